@@ -1,14 +1,9 @@
 import os
-import time
-import pygame
-from PIL import Image
-import io
 from mutagen.mp3 import MP3
-from pydub import AudioSegment
-from tqdm import tqdm
-from mutagen.id3 import ID3, USLT, TALB, TPE1, SYLT, APIC
-from utils import extended_seconds_to_hms
-import math
+from mutagen.id3 import ID3, ID3NoHeaderError, USLT, TALB, TPE1, SYLT, APIC
+from cover_store import embedded_art_bytes
+from lrc import Lyrics
+from tracing import traced
 from utils import get_logger
 logger = get_logger("add_bgm")
 
@@ -24,119 +19,116 @@ AUDIO_FORMATS = {
     '.wma': 'wma'
 }
 
+# BGM 单独播放的开头（含交叉淡入）和交叉淡入的时长，与 audio_mixer.BgmMixer 的默认值一致
+BGM_INTRO_MS = 3000
+BGM_CROSSFADE_MS = 1000
 
+
+@traced()
 def load_audio(file_path):
     """加载音频文件"""
+    from pydub import AudioSegment
     ext = os.path.splitext(file_path)[1].lower()
     if ext not in AUDIO_FORMATS:
         raise ValueError(f"Unsupported audio format: {ext}")
     return AudioSegment.from_file(file_path, format=AUDIO_FORMATS[ext])
 
 
-def set_mp3_metadata(mp3_file, album=None, artist=None, cover_img=None, lyrics_file=None, create_lrc=True):
+def lrc_to_sylt(lrc_content):
+    """Convert LRC text to SYLT (text, milliseconds) pairs"""
+    return Lyrics.parse(lrc_content).to_sylt()
+
+
+@traced()
+def tag_mp3(mp3_file, album=None, artist=None, cover_img=None, lrc_content=None, verify=False):
     """
-    Set metadata (album, artist, cover image, lyrics) for an MP3 file
+    Write album, artist, cover and lyrics frames to an MP3 in a single save
+
+    Everything is computed from the arguments; only the existing ID3 header is
+    read, the audio data is never parsed.
 
     :param mp3_file: Path to the MP3 file
     :param album: Album name (optional)
     :param artist: Artist name (optional)
     :param cover_img: Path to the cover image file (optional)
-    :param lyrics_file: Path to the LRC lyrics file (optional)
-    :param create_lrc: Whether to create an external LRC file (default: True)
+    :param lrc_content: LRC text or lrc.Lyrics for the USLT and SYLT frames (optional)
+    :param verify: Re-read the tag afterwards and log what it contains
     """
     try:
         audio = ID3(mp3_file)
+    except ID3NoHeaderError:
+        audio = ID3()
+
+    if album:
+        audio['TALB'] = TALB(encoding=3, text=album)
+    if artist:
+        audio['TPE1'] = TPE1(encoding=3, text=artist)
+
+    if cover_img and os.path.exists(cover_img):
+        try:
+            # The 500x500 JPEG is precomputed next to the cover and only read here
+            audio['APIC'] = APIC(
+                encoding=3,
+                mime='image/jpeg',
+                type=3,  # 3 is for the cover image
+                desc='Cover',
+                data=embedded_art_bytes(cover_img)
+            )
+        except Exception as img_error:
+            logger.info(f"Error processing cover image: {str(img_error)}")
+    elif cover_img:
+        logger.info(f"Cover image file not found: {cover_img}")
+
+    if lrc_content:
+        try:
+            if isinstance(lrc_content, Lyrics):
+                lyrics, lrc_content = lrc_content, lrc_content.to_lrc()
+            else:
+                lyrics = Lyrics.parse(lrc_content)
+            # Unsynchronized (USLT) and synchronized (SYLT) lyrics
+            audio.add(USLT(encoding=3, lang="zho", desc="", text=lrc_content))
+            audio.add(SYLT(encoding=3, lang="zho", format=2, type=1, text=lyrics.to_sylt()))
+        except Exception as lyrics_error:
+            logger.info(f"Error adding lyrics to MP3: {str(lyrics_error)}")
+
+    audio.save(mp3_file)
+    logger.info(f"Metadata saved to {mp3_file} ({', '.join(sorted(audio.keys()))})")
+
+    if verify:
+        verify_mp3_metadata(mp3_file)
 
-        if album:
-            audio['TALB'] = TALB(encoding=3, text=album)
-            logger.info(f"Album set: {album}")
-
-        if artist:
-            audio['TPE1'] = TPE1(encoding=3, text=artist)
-            logger.info(f"Artist set: {artist}")
-
-        if cover_img and os.path.exists(cover_img):
-            try:
-                img = Image.open(cover_img)
-                print(f"Image format: {img.format}, Mode: {img.mode}, Size: {img.size}")
-
-                # Convert to RGB mode (remove alpha channel if RGBA)
-                if img.mode in ('RGBA', 'LA'):
-                    print("Converting RGBA image to RGB")
-                    background = Image.new('RGB', img.size, (255, 255, 255))
-                    background.paste(img, mask=img.split()[-1])
-                    img = background
-                elif img.mode != 'RGB':
-                    print(f"Converting {img.mode} image to RGB")
-                    img = img.convert('RGB')
-
-                # Resize image to 500x500 pixels
-                img = img.resize((500, 500), Image.LANCZOS)
-                print(f"Image resized to 500x500 pixels")
-
-                # Convert image to bytes
-                buffer = io.BytesIO()
-                img.save(buffer, format="JPEG")
-                img_data = buffer.getvalue()
-                print(f"Image converted to JPEG, size: {len(img_data)} bytes")
-
-                audio['APIC'] = APIC(
-                    encoding=3,
-                    mime='image/jpeg',
-                    type=3,  # 3 is for the cover image
-                    desc='Cover',
-                    data=img_data
-                )
-                print(f"Cover image successfully added to {mp3_file}")
-            except Exception as img_error:
-                print(f"Error processing cover image: {str(img_error)}")
-        else:
-            print(f"Cover image file not found: {cover_img}")
 
+@traced()
+def set_mp3_metadata(mp3_file, album=None, artist=None, cover_img=None, lyrics_file=None, create_lrc=True,
+                     verify=False):
+    """
+    Set metadata (album, artist, cover image, lyrics) for an MP3 file
+
+    :param mp3_file: Path to the MP3 file
+    :param album: Album name (optional)
+    :param artist: Artist name (optional)
+    :param cover_img: Path to the cover image file (optional)
+    :param lyrics_file: Path to the LRC lyrics file (optional)
+    :param create_lrc: Whether to create an external LRC file (default: True)
+    :param verify: Re-read the tag afterwards and log what it contains (default: False)
+    """
+    try:
+        lrc_content = None
         if lyrics_file and os.path.exists(lyrics_file):
-            logger.info(f"Adding lyrics from {lyrics_file} to {mp3_file}")
-            try:
-                with open(lyrics_file, 'r', encoding='utf-8') as f:
-                    lrc_content = f.read()
-                logger.info(f"LRC content:\n{lrc_content[:300]}...")  # logger.info first 300 characters
-                logger.info(f"Total LRC length: {len(lrc_content)} characters")
-
-                # Add unsynchronized lyrics (USLT)
-                audio.add(USLT(encoding=3, lang="zho", desc="", text=lrc_content))
-
-                # Add synchronized lyrics (SYLT)
-                sylt_data = []
-                for line in lrc_content.split('\n'):
-                    if line.strip() and '[' in line:
-                        time_str, _, content = line.partition(']')
-                        time_str = time_str[1:]  # Remove leading '['
-                        minutes, seconds = map(float, time_str.split(':'))
-                        timestamp = int((minutes * 60 + seconds) * 1000)
-                        sylt_data.append((content.strip(), timestamp))
-
-                audio.add(SYLT(encoding=3, lang="zho", format=2, type=1, text=sylt_data))
-
-                logger.info(f"Lyrics (USLT and SYLT) saved to MP3 file.")
-
-                # Create external LRC file if requested
-                if create_lrc:
-                    lrc_output = os.path.splitext(mp3_file)[0] + '.lrc'
-                    with open(lrc_output, 'w', encoding='utf-8') as f:
-                        f.write(lrc_content)
-                    logger.info(f"External LRC file created: {lrc_output}")
-
-            except Exception as lyrics_error:
-                logger.info(f"Error adding lyrics to MP3: {str(lyrics_error)}")
-                import traceback
-                logger.info(traceback.format_exc())
+            with open(lyrics_file, 'r', encoding='utf-8') as f:
+                lrc_content = f.read()
+            logger.info(f"Total LRC length: {len(lrc_content)} characters")
+
+            # Create external LRC file if requested
+            lrc_output = os.path.splitext(mp3_file)[0] + '.lrc'
+            if create_lrc and os.path.abspath(lrc_output) != os.path.abspath(lyrics_file):
+                with open(lrc_output, 'w', encoding='utf-8') as f:
+                    f.write(lrc_content)
+                logger.info(f"External LRC file created: {lrc_output}")
         else:
             logger.info(f"Lyrics file not found: {lyrics_file}")
 
-        audio.save()
-        logger.info(f"Metadata successfully saved to {mp3_file}")
-
-        # Verify metadata
-        verify_mp3_metadata(mp3_file)
+        tag_mp3(mp3_file, album, artist, cover_img, lrc_content, verify=verify)
 
     except Exception as e:
         logger.info(f"Error setting MP3 metadata: {str(e)}")
@@ -148,6 +140,8 @@ def verify_mp3_metadata(mp3_file):
     """
     Verify the metadata of an MP3 file
 
+    Only the ID3 tag at the start of the file is read.
+
     :param mp3_file: Path to the MP3 file
     """
     try:
@@ -164,9 +158,9 @@ def verify_mp3_metadata(mp3_file):
         else:
             logger.info("Artist: Not set")
 
-        if 'APIC:' in audio:
-            cover = audio['APIC:'].data
-            logger.info(f"Cover image: Present (size: {len(cover)} bytes)")
+        covers = audio.getall('APIC')
+        if covers:
+            logger.info(f"Cover image: Present (size: {len(covers[0].data)} bytes)")
         else:
             logger.info("Cover image: Not present")
 
@@ -181,7 +175,8 @@ def verify_mp3_metadata(mp3_file):
         logger.info(f"Error verifying MP3 metadata: {str(e)}")
 
 
-def generate_timestamped_lyrics(mp3_file, lyrics_file, bgm_intro_duration=2, crossfade_duration=1):
+@traced()
+def generate_timestamped_lyrics(mp3_file, lyrics_file, bgm_intro_duration=2, crossfade_duration=1, duration=None):
     """
     根据 MP3 文件的时长生成带时间戳的歌词，考虑 BGM 介绍和交叉淡入
 
@@ -189,11 +184,12 @@ def generate_timestamped_lyrics(mp3_file, lyrics_file, bgm_intro_duration=2, cro
     :param lyrics_file: 歌词文件路径
     :param bgm_intro_duration: BGM 介绍时长（秒）
     :param crossfade_duration: 交叉淡入时长（秒）
-    :return: 带时间戳的歌词列表
+    :param duration: 音频时长（秒），已知时不再打开 MP3 文件
+    :return: lrc.Lyrics 对象
     """
     # 获取 MP3 文件时长
-    audio = MP3(mp3_file)
-    duration = audio.info.length
+    if duration is None:
+        duration = MP3(mp3_file).info.length
 
     # 读取歌词文件
     with open(lyrics_file, 'r', encoding='utf-8') as f:
@@ -209,36 +205,47 @@ def generate_timestamped_lyrics(mp3_file, lyrics_file, bgm_intro_duration=2, cro
     # 计算每行歌词的持续时间
     line_duration = lyrics_duration / len(lyrics)
 
-    # 生成带时间戳的歌词
-    timestamped_lyrics = []
-    current_time = lyrics_start_time
-    for line in lyrics:
-        minutes = math.floor(current_time / 60)
-        seconds = current_time % 60
-        timestamp = f"[{minutes:02d}:{seconds:05.2f}]"
-        timestamped_lyrics.append(f"{timestamp}{line}")
-        current_time += line_duration
+    # 生成带时间戳的歌词（毫秒）
+    return Lyrics((round((lyrics_start_time + i * line_duration) * 1000), line) for i, line in enumerate(lyrics))
+
+
+@traced()
+def generate_aligned_lyrics(speech_audio, lyrics_file, speech_start_ms):
+    """
+    根据合成语音中的停顿（或合成时记录的词边界）生成带时间戳的歌词
+
+    :param speech_audio: 混音前的语音文件路径，或合成得到的 audio_mixer.SpeechPcm
+    :param lyrics_file: 歌词文件路径
+    :param speech_start_ms: 语音在混音结果中的起始位置（毫秒）
+    :return: lrc.Lyrics 对象
+    """
+    from lyric_align import align_lyrics
+    with open(lyrics_file, 'r', encoding='utf-8') as f:
+        lines = [line.strip() for line in f.read().splitlines() if line.strip()]
+    starts = align_lyrics(speech_audio, lines)
+    return Lyrics((speech_start_ms + start, line) for start, line in zip(starts, lines))
 
-    return timestamped_lyrics
 
 def create_lrc_file(timestamped_lyrics, output_lrc):
     """
     创建 LRC 格式的歌词文件
 
-    :param timestamped_lyrics: 带时间戳的歌词列表
+    :param timestamped_lyrics: lrc.Lyrics 对象或带时间戳的歌词行列表
     :param output_lrc: 输出的 LRC 文件路径
     """
-    with open(output_lrc, 'w', encoding='utf-8') as f:
-        for line in timestamped_lyrics:
-            f.write(f"{line}\n")
+    if not isinstance(timestamped_lyrics, Lyrics):
+        timestamped_lyrics = Lyrics.parse("\n".join(timestamped_lyrics))
+    timestamped_lyrics.write(output_lrc)
 
 
-def add_lyrics_to_mp3(mp3_file, lrc_file):
+@traced()
+def add_lyrics_to_mp3(mp3_file, lrc_file, verify=False):
     """
     为MP3文件添加LRC格式的歌词
 
     :param mp3_file: MP3文件路径
     :param lrc_file: LRC歌词文件路径
+    :param verify: 保存后是否重新读取标签确认
     """
     try:
         logger.info(f"Attempting to add lyrics from {lrc_file} to {mp3_file}")
@@ -261,58 +268,78 @@ def add_lyrics_to_mp3(mp3_file, lrc_file):
         audio.save()
         logger.info(f"Lyrics saved to MP3 file.")
 
-        # 验证歌词是否成功添加
-        audio = ID3(mp3_file)
-        if "USLT::'zho'" in audio:
-            logger.info("Lyrics successfully added to the MP3 file.")
-        else:
-            logger.info("Warning: Lyrics were not found in the MP3 file after addition.")
+        # 验证歌词是否成功添加（只读取标签头）
+        if verify:
+            audio = ID3(mp3_file)
+            if "USLT::zho" in audio:
+                logger.info("Lyrics successfully added to the MP3 file.")
+            else:
+                logger.info("Warning: Lyrics were not found in the MP3 file after addition.")
 
     except Exception as e:
         logger.info(f"Error adding lyrics to MP3: {str(e)}")
         raise
 
 
+def export_paths(output_audio, formats):
+    """
+    Resolve extra export targets
+
+    :param output_audio: Path of the main output
+    :param formats: List of formats (written next to output_audio with their extension),
+                    dict mapping format to path, or None
+    :return: Dict mapping output path to audio format, without the main output
+    """
+    if not formats:
+        return {}
+    if not isinstance(formats, dict):
+        base = os.path.splitext(output_audio)[0]
+        formats = {audio_format: f"{base}.{audio_format}" for audio_format in formats}
+    supported = set(AUDIO_FORMATS.values())
+    outputs = {}
+    for audio_format, path in formats.items():
+        if audio_format not in supported:
+            raise ValueError(f"Unsupported output format: {audio_format}")
+        if os.path.abspath(path) != os.path.abspath(output_audio):
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            outputs[path] = audio_format
+    return outputs
+
+
+@traced()
 def add_background_music(original_audio, bg_music, lyrics_file=None, output_audio=None, bg_volume=0.5, album=None,
-                         artist=None, cover_img=None):
+                         artist=None, cover_img=None, normalize_loudness=False, duck_db=0.0, extra_formats=None):
     """
     For audio file add background music and lyrics
 
-    :param original_audio: Path to the original audio file
+    :param original_audio: Path to the original audio file, or an audio_mixer.SpeechPcm from synthesis
     :param bg_music: Path to the background music file
     :param lyrics_file: Path to the lyrics file (optional)
-    :param output_audio: Path to the output audio file (optional)
+    :param output_audio: Path to the output audio file (optional for a file path, required for a SpeechPcm)
     :param bg_volume: Background music volume, range 0-1 (default 0.5)
     :param album: Album name (optional)
     :param artist: Artist name (optional)
     :param cover_img: Path to the cover image file (optional)
+    :param normalize_loudness: Bring the speech to SPEECH_TARGET_LUFS and the BGM to a level below it
+                               set by bg_volume, instead of a fixed dB offset (default False)
+    :param duck_db: Lower the BGM by this many dB (negative) while the voice is present (default 0, off)
+    :param extra_formats: Further formats encoded from the same mix in parallel, either a list such as
+                          ['ogg', 'm4a'] (written next to output_audio) or a dict mapping format to path
     :return: Path to the output audio file
     """
-    # Load original audio and background music
-    original = load_audio(original_audio)
-    background = load_audio(bg_music)
-
-    # Adjust background music volume
-    background = background - (10 * (1 - bg_volume))
-
-    # Create a 3-second segment of background music
-    bg_intro = background[:3000]  # 3000 milliseconds = 3 seconds
-
-    # Create a crossfade effect for the transition
-    crossfade_duration = 1000  # 1 second crossfade
-
-    # Prepare the main part of the background music
-    bg_main = background
-    if len(bg_main) < len(original):
-        bg_main = bg_main * (len(original) // len(bg_main) + 1)
-    bg_main = bg_main[:len(original)]
-
-    # Combine the intro, crossfade, and main audio
-    output = bg_intro.append(original, crossfade=crossfade_duration)
-    output = output.overlay(bg_main[crossfade_duration:])
+    from audio_mixer import SpeechPcm, mix_background_music
+    from loudness import BGM_BELOW_SPEECH_LU, SPEECH_TARGET_LUFS
+    from pcm_cache import get_bgm_cache
+    in_memory = isinstance(original_audio, SpeechPcm)
+    for path in (bg_music,) if in_memory else (original_audio, bg_music):
+        ext = os.path.splitext(path)[1].lower()
+        if ext not in AUDIO_FORMATS:
+            raise ValueError(f"Unsupported audio format: {ext}")
 
     # If no output file path is specified, create a new file in the original directory
     if output_audio is None:
+        if in_memory:
+            raise ValueError("output_audio is required for speech held in memory")
         original_dir = os.path.dirname(original_audio)
         original_name = os.path.splitext(os.path.basename(original_audio))[0]
         output_audio = os.path.join(original_dir, f"{original_name}_with_bgm.mp3")
@@ -324,72 +351,78 @@ def add_background_music(original_audio, bg_music, lyrics_file=None, output_audi
     output_ext = os.path.splitext(output_audio)[1].lower()
     if output_ext not in AUDIO_FORMATS:
         raise ValueError(f"Unsupported output format: {output_ext}")
+    extra_outputs = export_paths(output_audio, extra_formats)
+
+    # Mix block by block: a 3-second BGM intro, a 1-second crossfade into the speech,
+    # and the looped BGM bed underneath, with the volume lowered by 10 * (1 - bg_volume) dB
+    # (relative to the BGM itself, or to the speech target when normalizing)
+    intro_ms, crossfade_ms = BGM_INTRO_MS, BGM_CROSSFADE_MS
+    bg_gain_db = -(10 * (1 - bg_volume))
+    duration = mix_background_music(original_audio, bg_music, output_audio,
+                                    bg_gain_db=bg_gain_db,
+                                    intro_ms=intro_ms,
+                                    crossfade_ms=crossfade_ms,
+                                    audio_format=AUDIO_FORMATS[output_ext],
+                                    bgm_cache=get_bgm_cache(),
+                                    speech_lufs=SPEECH_TARGET_LUFS if normalize_loudness else None,
+                                    bgm_lufs=SPEECH_TARGET_LUFS - BGM_BELOW_SPEECH_LU + bg_gain_db
+                                    if normalize_loudness else None,
+                                    duck_db=duck_db,
+                                    extra_outputs=extra_outputs)
+
+    finish_mix(output_audio, original_audio, lyrics_file, intro_ms - crossfade_ms, album, artist, cover_img,
+               extra_outputs)
+    return output_audio
 
-    # Export the result
-    output.export(output_audio, format=AUDIO_FORMATS[output_ext])
 
-    # If lyrics file is provided, generate timestamped lyrics
+@traced()
+def finish_mix(output_audio, speech, lyrics_file=None, speech_start_ms=BGM_INTRO_MS - BGM_CROSSFADE_MS, album=None,
+               artist=None, cover_img=None, extra_outputs=None):
+    """
+    Write the LRC next to a rendered mix and tag every MP3 output
+
+    Shared by add_background_music and the streaming player, so a streamed
+    mix ends up with the same lyrics, cover and tags as a rendered one.
+
+    :param output_audio: Path of the main output
+    :param speech: The speech that was mixed, path or audio_mixer.SpeechPcm, for lyric alignment
+    :param lyrics_file: Path to the lyrics file (optional)
+    :param speech_start_ms: Where the speech starts in the mix (milliseconds)
+    :param album: Album name (optional)
+    :param artist: Artist name (optional)
+    :param cover_img: Path to the cover image file (optional)
+    :param extra_outputs: Further outputs of the same mix, dict mapping path to audio format (optional)
+    """
+    # If lyrics file is provided, time every line from the pauses in the speech,
+    # which starts where the crossfade begins
+    lyrics = None
     if lyrics_file:
-        logger.info(f"Generating timestamped lyrics from {lyrics_file}")
-        timestamped_lyrics = generate_timestamped_lyrics(output_audio, lyrics_file)
+        logger.info(f"Aligning lyrics from {lyrics_file}")
+        lyrics = generate_aligned_lyrics(speech, lyrics_file, speech_start_ms)
         lrc_file = os.path.splitext(output_audio)[0] + '.lrc'
-        create_lrc_file(timestamped_lyrics, lrc_file)
+        create_lrc_file(lyrics, lrc_file)
         logger.info(f"Created LRC file: {lrc_file}")
-    else:
-        lrc_file = None
-
-    # Set metadata (album, artist, cover image, lyrics)
-    set_mp3_metadata(output_audio, album, artist, cover_img, lrc_file)
 
-    return output_audio
+    # Set metadata (album, artist, cover image, lyrics) in one save per MP3 output
+    output_format = AUDIO_FORMATS.get(os.path.splitext(output_audio)[1].lower())
+    for path, audio_format in {output_audio: output_format, **(extra_outputs or {})}.items():
+        if audio_format != 'mp3':
+            continue
+        try:
+            tag_mp3(path, album, artist, cover_img, lyrics)
+        except Exception as e:
+            logger.info(f"Error setting MP3 metadata: {str(e)}")
 
 
-def play_audio(file_path):
+def play_audio(file_path, lrc_file=None):
     """
-    播放给定路径的音频文件，并显示进度条
+    播放给定路径的音频文件，并显示进度条和同步歌词
 
     :param file_path: 音频文件的路径
+    :param lrc_file: LRC 歌词文件路径（可选，默认使用音频旁边的同名 .lrc 文件）
     """
-    # 检查文件是否存在
-    if not os.path.exists(file_path):
-        logger.info(f"错误：文件 '{file_path}' 不存在。")
-        return
-
-    # 初始化 pygame mixer
-    pygame.mixer.init()
-
-    try:
-        # 加载音频文件
-        pygame.mixer.music.load(file_path)
-
-        # 获取音频长度（以秒为单位）
-        audio = pygame.mixer.Sound(file_path)
-        duration = int(audio.get_length())
-
-        logger.info(f"正在播放: {os.path.basename(file_path)}")
-        logger.info(f"音频长度: {extended_seconds_to_hms(duration)}")
-
-        # 播放音频
-        pygame.mixer.music.play()
-        bar_format = "{l_bar}{bar}| {n_fmt}/{total_fmt}",
-
-        # 创建进度条，使用自定义格式化函数确保显示整数
-        with tqdm(total=duration, unit="sec", bar_format=bar_format,
-                  ncols=100,  # 设置进度条的总宽度
-                  # 使用 lambda 函数确保 n 和 total 都显示为整数
-                  unit_scale=False, unit_divisor=0.2) as pbar:
-            start_time = time.time()
-            while pygame.mixer.music.get_busy():
-                elapsed_time = round(time.time() - start_time)
-                pbar.n = elapsed_time
-                pbar.refresh()
-                time.sleep(0.1)
-    except pygame.error as e:
-        logger.info(f"播放音频时发生错误: {e}")
-    finally:
-        pygame.mixer.music.stop()
-        pygame.mixer.quit()
-
+    from player import get_player
+    get_player().play(file_path, lrc_file)
 
 if __name__ == '__main__':
     from config import SPEECH_CACHE_DIR, BGM_DIR
@@ -0,0 +1,272 @@
+"""
+Per-poem artifact store
+
+Every poem is identified by the sha256 of its LLM response and owns one
+directory, sharded by that hash (artifacts/ab/<id>/). Its files are named by
+stage, e.g. mix.mp3 with mix.lrc next to it, so titles never collide. Files
+are written to a temp name and renamed into place. A SQLite manifest maps
+poem id, title and stage to the file, its size and sha256, so lookups use
+the B-tree indexes and listing or cleanup never walk the directory tree.
+
+    python artifact_store.py list --stage mix
+    python artifact_store.py find 晨曦中的花瓣
+    python artifact_store.py remove <poem id>...
+    python artifact_store.py prune --older-than 30
+"""
+import hashlib
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from config import ARTIFACT_DB_PATH, ARTIFACT_DIR
+from utils import get_logger
+
+logger = get_logger("artifact_store")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS poems (
+    id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS poems_title ON poems (title);
+CREATE INDEX IF NOT EXISTS poems_created ON poems (created);
+CREATE TABLE IF NOT EXISTS artifacts (
+    poem_id TEXT NOT NULL REFERENCES poems(id),
+    stage TEXT NOT NULL,
+    file TEXT NOT NULL,
+    sha256 TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    PRIMARY KEY (poem_id, stage)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS artifacts_stage ON artifacts (stage, created);
+"""
+
+
+def poem_id(response: str) -> str:
+    """Id of a poem: the sha256 of the LLM response it was parsed from"""
+    return hashlib.sha256(response.encode('utf-8')).hexdigest()
+
+
+def _sha256_file(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class ArtifactStore:
+    """
+    Files produced for each poem, indexed by a SQLite manifest
+
+    Safe to share between threads (one connection per thread) and between
+    processes (WAL journal, writers wait for each other).
+    """
+
+    def __init__(self, root=ARTIFACT_DIR, db_path=ARTIFACT_DB_PATH):
+        self.root = root
+        self.db_path = db_path
+        self._local = threading.local()
+        os.makedirs(root, exist_ok=True)
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._db.executescript(SCHEMA)
+
+    @property
+    def _db(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.db_path, timeout=60, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def poem_dir(self, poem: str) -> str:
+        return os.path.join(self.root, poem[:2], poem)
+
+    def add_poem(self, poem: str, title: str):
+        """Register a poem; the title is updated if the poem is already known"""
+        self._db.execute("INSERT INTO poems (id, title, created) VALUES (?, ?, ?) "
+                         "ON CONFLICT (id) DO UPDATE SET title = excluded.title", (poem, title, time.time()))
+
+    def _temp_path(self, final_path):
+        return f"{final_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+    def _commit(self, poem, stage, tmp_path, name, sha):
+        path = os.path.join(self.poem_dir(poem), name)
+        os.replace(tmp_path, path)
+        self._db.execute("INSERT OR REPLACE INTO artifacts (poem_id, stage, file, sha256, size, created) "
+                         "VALUES (?, ?, ?, ?, ?, ?)",
+                         (poem, stage, os.path.relpath(path, self.root), sha, os.path.getsize(path), time.time()))
+        return path
+
+    def put_bytes(self, poem: str, stage: str, data: bytes, ext: str, name: str = None) -> str:
+        """
+        Store bytes as a poem's artifact, skipping the write when the stored file is identical
+
+        :param ext: Extension such as ".txt"; the file is named <stage><ext> unless name is given
+        :return: Path of the stored file
+        """
+        name = name or stage + ext
+        sha = hashlib.sha256(data).hexdigest()
+        existing = self.get(poem, stage)
+        if existing is not None and os.path.basename(existing) == name and self.sha256(poem, stage) == sha:
+            return existing
+        os.makedirs(self.poem_dir(poem), exist_ok=True)
+        tmp_path = self._temp_path(os.path.join(self.poem_dir(poem), name))
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        return self._commit(poem, stage, tmp_path, name, sha)
+
+    def put_file(self, poem: str, stage: str, src_path: str, name: str = None, link: bool = False) -> str:
+        """
+        Store a finished file as a poem's artifact
+
+        :param src_path: File to move into the store, e.g. one written inside staging()
+        :param name: File name inside the poem's directory (default: <stage> plus the source extension)
+        :param link: Hardlink (or copy) instead of moving, for files owned by another cache
+        :return: Path of the stored file
+        """
+        name = name or stage + os.path.splitext(src_path)[1]
+        os.makedirs(self.poem_dir(poem), exist_ok=True)
+        tmp_path = self._temp_path(os.path.join(self.poem_dir(poem), name))
+        if link:
+            try:
+                os.link(src_path, tmp_path)
+            except OSError:
+                shutil.copyfile(src_path, tmp_path)
+        else:
+            os.replace(src_path, tmp_path)
+        return self._commit(poem, stage, tmp_path, name, _sha256_file(tmp_path))
+
+    @contextmanager
+    def staging(self, poem: str):
+        """
+        A private directory inside the poem's directory for tools that write
+        several files at once (e.g. an MP3 and its LRC); move the results in
+        with put_file. Whatever is left is removed on exit.
+        """
+        path = os.path.join(self.poem_dir(poem), f".staging-{os.getpid()}-{threading.get_ident()}")
+        os.makedirs(path, exist_ok=True)
+        try:
+            yield path
+        finally:
+            shutil.rmtree(path, ignore_errors=True)
+
+    def get(self, poem: str, stage: str):
+        """
+        :return: Path of a poem's artifact, or None if it is not recorded or its file is gone
+        """
+        row = self._db.execute("SELECT file FROM artifacts WHERE poem_id = ? AND stage = ?", (poem, stage)).fetchone()
+        if row is None:
+            return None
+        path = os.path.join(self.root, row[0])
+        return path if os.path.exists(path) else None
+
+    def sha256(self, poem: str, stage: str):
+        row = self._db.execute("SELECT sha256 FROM artifacts WHERE poem_id = ? AND stage = ?",
+                               (poem, stage)).fetchone()
+        return row[0] if row else None
+
+    def find(self, title: str):
+        """
+        :return: [(poem id, {stage: path})] of the poems with this title, oldest first
+        """
+        found = []
+        for (poem,) in self._db.execute("SELECT id FROM poems WHERE title = ? ORDER BY created", (title,)).fetchall():
+            stages = self._db.execute("SELECT stage, file FROM artifacts WHERE poem_id = ?", (poem,)).fetchall()
+            found.append((poem, {stage: os.path.join(self.root, file) for stage, file in stages}))
+        return found
+
+    def list(self, stage: str = None):
+        """
+        :return: [(poem id, title, stage, path, size)], oldest first
+        """
+        query = ("SELECT a.poem_id, p.title, a.stage, a.file, a.size FROM artifacts a JOIN poems p ON p.id = a.poem_id "
+                 "{} ORDER BY a.created")
+        rows = self._db.execute(query.format("WHERE a.stage = ?"), (stage,)) if stage else \
+            self._db.execute(query.format(""))
+        return [(poem, title, stage, os.path.join(self.root, file), size) for poem, title, stage, file, size in rows]
+
+    def paths(self, stage: str):
+        """Paths of every stored artifact of one stage, oldest first"""
+        return [path for _, _, _, path, _ in self.list(stage)]
+
+    def remove(self, poem: str):
+        """Delete a poem's files and manifest entries; returns the number of bytes freed"""
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            files = self._db.execute("SELECT file, size FROM artifacts WHERE poem_id = ?", (poem,)).fetchall()
+            self._db.execute("DELETE FROM artifacts WHERE poem_id = ?", (poem,))
+            self._db.execute("DELETE FROM poems WHERE id = ?", (poem,))
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        self._db.execute("COMMIT")
+        for file, _ in files:
+            try:
+                os.remove(os.path.join(self.root, file))
+            except FileNotFoundError:
+                pass
+        shutil.rmtree(self.poem_dir(poem), ignore_errors=True)
+        return sum(size for _, size in files)
+
+    def prune(self, older_than: float):
+        """
+        Remove poems created more than older_than seconds ago
+
+        :return: (number of poems, bytes freed)
+        """
+        cutoff = time.time() - older_than
+        poems = [row[0] for row in self._db.execute("SELECT id FROM poems WHERE created < ?", (cutoff,)).fetchall()]
+        freed = sum(self.remove(poem) for poem in poems)
+        logger.info(f"Pruned {len(poems)} poems, {freed / 1024 ** 2:.1f} MB")
+        return len(poems), freed
+
+
+_artifact_store = None
+
+
+def get_artifact_store() -> ArtifactStore:
+    global _artifact_store
+    if _artifact_store is None:
+        _artifact_store = ArtifactStore()
+    return _artifact_store
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="List, find and clean up stored poem artifacts")
+    commands = parser.add_subparsers(dest="command", required=True)
+    list_parser = commands.add_parser("list", help="list stored artifacts, oldest first")
+    list_parser.add_argument("--stage", help="only this stage, e.g. mix")
+    find_parser = commands.add_parser("find", help="show the artifacts of poems with a title")
+    find_parser.add_argument("title")
+    remove_parser = commands.add_parser("remove", help="delete poems and their files")
+    remove_parser.add_argument("ids", nargs="+")
+    prune_parser = commands.add_parser("prune", help="delete poems older than some days")
+    prune_parser.add_argument("--older-than", type=float, required=True, help="age in days")
+    args = parser.parse_args()
+
+    store = get_artifact_store()
+    if args.command == "list":
+        for poem, title, stage, path, size in store.list(args.stage):
+            print(f"{poem}  {stage:<8} {size:>10}  {title}  {path}")
+    elif args.command == "find":
+        for poem, stages in store.find(args.title):
+            print(poem)
+            for stage, path in sorted(stages.items()):
+                print(f"    {stage:<8} {path}")
+    elif args.command == "remove":
+        for poem in args.ids:
+            logger.info(f"Removed {poem}: {store.remove(poem) / 1024 ** 2:.1f} MB")
+    elif args.command == "prune":
+        store.prune(args.older_than * 24 * 3600)
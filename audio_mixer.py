@@ -0,0 +1,700 @@
+import os
+import queue
+import subprocess
+import threading
+import time
+import wave
+
+import numpy as np
+from pydub import AudioSegment
+from pydub.utils import mediainfo_json
+
+from config import EXPORT_CODEC_ARGS
+from loudness import Ducker, FramePower, ducking_envelope, frame_power, gain_to_target, integrated_loudness, \
+    FRAME_MS
+from tracing import enabled as tracing_enabled, span, timed_iter
+from utils import get_logger
+
+logger = get_logger("audio_mixer")
+
+# 每次处理的帧数，峰值内存只与它有关，与输入时长无关
+BLOCK_FRAMES = 64 * 1024
+# 通过管道把内存中的 PCM 交给 ffmpeg 时每次写入的字节数
+FEED_BYTES = 256 * 1024
+
+# 通过管道写入时 ffmpeg 需要显式的容器名
+FFMPEG_MUXERS = {
+    'wav': 'wav',
+    'mp3': 'mp3',
+    'ogg': 'ogg',
+    'flac': 'flac',
+    'aac': 'adts',
+    'm4a': 'ipod',
+    'wma': 'asf'
+}
+
+
+def db_to_gain(db):
+    """Convert a dB change into a linear amplitude factor (same as pydub's db_to_float)"""
+    return 10 ** (db / 20)
+
+
+def ms_to_frames(ms, sample_rate):
+    return int(round(ms * sample_rate / 1000))
+
+
+def upmix(block, channels):
+    """
+    Copy a mono float32 block of shape (frames, 1) to `channels` channels at full level
+
+    This is what pydub's set_channels does. ffmpeg's `-ac` would instead mix
+    the mono channel in at -3 dB, which makes the voice quieter under a
+    stereo BGM, so every mono source is decoded as mono and widened here.
+    """
+    if block.shape[1] == channels:
+        return block
+    if block.shape[1] != 1:
+        raise ValueError(f"Cannot upmix {block.shape[1]} channels to {channels}")
+    return np.repeat(block, channels, axis=1)
+
+
+def probe_audio(file_path):
+    """
+    Read sample rate and channel count of an audio file
+
+    PCM WAV headers are parsed directly, everything else goes through ffprobe.
+
+    :param file_path: Path to the audio file
+    :return: (sample_rate, channels)
+    """
+    if os.path.splitext(file_path)[1].lower() == '.wav':
+        try:
+            with wave.open(file_path, 'rb') as w:
+                return w.getframerate(), w.getnchannels()
+        except (wave.Error, EOFError):
+            pass  # e.g. float or extensible WAV, let ffprobe handle it
+    info = mediainfo_json(file_path)
+    for stream in info.get('streams', []):
+        if stream.get('codec_type') == 'audio':
+            return int(stream['sample_rate']), int(stream['channels'])
+    raise ValueError(f"No audio stream found in {file_path}")
+
+
+def map_wav(file_path):
+    """
+    Memory-map the samples of a 16-bit PCM WAV file
+
+    :return: (int16 array of shape (frames, channels), sample_rate), or None for anything else
+    """
+    with open(file_path, 'rb') as f:
+        try:
+            w = wave.open(f)
+        except (wave.Error, EOFError):
+            return None
+        if w.getsampwidth() != 2:
+            return None
+        # wave 读完头部后，文件指针正好位于 data 块的开头
+        offset = f.tell()
+        sample_rate, channels, frames = w.getframerate(), w.getnchannels(), w.getnframes()
+    if not frames:
+        return np.empty((0, channels), dtype='<i2'), sample_rate
+    return np.memmap(file_path, dtype='<i2', mode='r', offset=offset, shape=(frames, channels)), sample_rate
+
+
+class SpeechPcm:
+    """
+    16-bit speech held in memory, handed from synthesis straight to the mixer
+
+    `samples` may be a view of a synthesis buffer or a memory map of a cached
+    WAV; it is never copied. mix_background_music, analyze_speech and
+    lyric_align accept a SpeechPcm wherever they take a speech file path.
+    """
+
+    def __init__(self, samples, sample_rate, words=None, path=None):
+        """
+        :param samples: int16 array of shape (frames, channels)
+        :param sample_rate: Sample rate of the samples
+        :param words: (text, [(audio offset in ms, text offset)]) captured during synthesis (optional)
+        :param path: WAV file holding the same samples, e.g. the TTS cache entry (optional, for logging)
+        """
+        self.samples = samples
+        self.sample_rate = sample_rate
+        self.words = words
+        self.path = path
+
+    @property
+    def channels(self):
+        return self.samples.shape[1]
+
+    @property
+    def duration(self):
+        return len(self.samples) / self.sample_rate
+
+    def __str__(self):
+        return self.path or f"<{self.duration:.2f}s of speech in memory>"
+
+
+class PcmBuffer:
+    """
+    Growable int16 buffer for PCM arriving in pieces, e.g. from a synthesis push stream
+
+    Capacity is preallocated from an estimate and doubled when exceeded, so
+    appending is amortized O(1) and view() returns the samples without a copy.
+    """
+
+    def __init__(self, channels=1, capacity_frames=BLOCK_FRAMES):
+        self.channels = channels
+        self._data = np.empty(max(capacity_frames, 1) * channels, dtype='<i2')
+        self._bytes = 0
+
+    def write(self, data):
+        """Append raw s16le bytes (any bytes-like object); pieces may split a sample"""
+        data = np.frombuffer(data, dtype=np.uint8)
+        end = self._bytes + len(data)
+        if end > self._data.nbytes:
+            grown = np.empty(max(end, 2 * self._data.nbytes) // 2 + 1, dtype='<i2')
+            grown.view(np.uint8)[:self._bytes] = self._data.view(np.uint8)[:self._bytes]
+            self._data = grown
+        self._data.view(np.uint8)[self._bytes:end] = data
+        self._bytes = end
+        return len(data)
+
+    def view(self):
+        """The samples written so far, an int16 array of shape (frames, channels)"""
+        frames = self._bytes // (2 * self.channels)
+        return self._data[:frames * self.channels].reshape(frames, self.channels)
+
+
+class PcmReader:
+    """
+    Decode an audio file with ffmpeg and read it back as float32 blocks of shape (frames, channels)
+
+    A mono source is decoded as mono and copied to every channel (see upmix).
+    """
+
+    def __init__(self, file_path, sample_rate, channels, source_channels=None):
+        """
+        :param source_channels: Channel count of the file, probed when needed and not given
+        """
+        self.file_path = file_path
+        self.sample_rate = sample_rate
+        self.channels = channels
+        if source_channels is None and channels > 1:
+            source_channels = probe_audio(file_path)[1]
+        self._decode_channels = 1 if source_channels == 1 else channels
+        self._frame_bytes = 4 * self._decode_channels
+        command = [AudioSegment.converter, '-v', 'error', '-i', file_path,
+                   '-f', 'f32le', '-ac', str(self._decode_channels), '-ar', str(sample_rate), 'pipe:1']
+        self._proc = subprocess.Popen(command, stdin=subprocess.DEVNULL,
+                                      stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def read(self, frames):
+        """Read up to `frames` frames, an empty array means end of stream"""
+        data = self._proc.stdout.read(frames * self._frame_bytes)
+        usable = len(data) - len(data) % self._frame_bytes
+        block = np.frombuffer(data, dtype='<f4', count=usable // 4).reshape(-1, self._decode_channels)
+        return upmix(block, self.channels)
+
+    def __iter__(self):
+        while True:
+            block = self.read(BLOCK_FRAMES)
+            if not len(block):
+                return
+            yield block
+
+    def close(self):
+        self._proc.stdout.close()
+        stderr = self._proc.stderr.read()
+        self._proc.stderr.close()
+        if self._proc.wait() != 0:
+            raise RuntimeError(f"Decoding {self.file_path} failed: {stderr.decode('utf-8', 'ignore').strip()}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._proc.kill()
+            self._proc.wait()
+
+
+class SpeechReader(PcmReader):
+    """
+    Read a SpeechPcm as float32 blocks of shape (frames, channels), like PcmReader
+
+    Samples at the target rate are converted straight from the array. Otherwise
+    they are piped to ffmpeg for resampling, so the result is the same as
+    decoding the WAV from disk, without writing or parsing one. Mono speech is
+    copied to every channel either way (see upmix).
+    """
+
+    def __init__(self, speech, sample_rate, channels):
+        self.file_path = str(speech)
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self._decode_channels = 1 if speech.channels == 1 else channels
+        self._frame_bytes = 4 * self._decode_channels
+        self._samples = speech.samples
+        self._position = 0
+        self._proc = None
+        self._feeder = None
+        # 只有重采样（或多声道之间的转换）才交给 ffmpeg
+        if speech.sample_rate == sample_rate and speech.channels == self._decode_channels:
+            return
+        command = [AudioSegment.converter, '-v', 'error',
+                   '-f', 's16le', '-ar', str(speech.sample_rate), '-ac', str(speech.channels), '-i', 'pipe:0',
+                   '-f', 'f32le', '-ac', str(self._decode_channels), '-ar', str(sample_rate), 'pipe:1']
+        self._proc = subprocess.Popen(command, stdin=subprocess.PIPE,
+                                      stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        self._feeder = threading.Thread(target=self._feed, daemon=True)
+        self._feeder.start()
+
+    def _feed(self):
+        data = np.ascontiguousarray(self._samples).reshape(-1).view(np.uint8)
+        try:
+            for start in range(0, len(data), FEED_BYTES):
+                self._proc.stdin.write(data[start:start + FEED_BYTES])
+        except OSError:
+            pass  # ffmpeg 已退出，close() 会报告原因
+        finally:
+            try:
+                self._proc.stdin.close()
+            except OSError:
+                pass
+
+    def read(self, frames):
+        if self._proc is not None:
+            return super().read(frames)
+        block = self._samples[self._position:self._position + frames]
+        self._position += len(block)
+        return upmix(block.astype('<f4') / np.float32(32768), self.channels)
+
+    def close(self):
+        if self._proc is not None:
+            super().close()
+            self._feeder.join()
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._proc is not None:
+            super().__exit__(exc_type, exc, tb)
+            self._feeder.join()
+
+
+def open_speech(source, sample_rate, channels, source_channels=None):
+    """Reader for a speech file path or a SpeechPcm"""
+    if isinstance(source, SpeechPcm):
+        return SpeechReader(source, sample_rate, channels)
+    return PcmReader(source, sample_rate, channels, source_channels)
+
+
+class PcmWriter:
+    """
+    Encode float32 blocks to an audio file by piping s16le PCM into ffmpeg
+    """
+
+    def __init__(self, output_path, sample_rate, channels, audio_format, codec_args=()):
+        self.output_path = output_path
+        command = [AudioSegment.converter, '-y', '-v', 'error',
+                   '-f', 's16le', '-ar', str(sample_rate), '-ac', str(channels), '-i', 'pipe:0',
+                   *codec_args, '-f', FFMPEG_MUXERS.get(audio_format, audio_format), output_path]
+        self._proc = subprocess.Popen(command, stdin=subprocess.PIPE,
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+    def write(self, block):
+        self.write_pcm(to_pcm16(block))
+
+    def write_pcm(self, data):
+        """Write already converted s16le bytes"""
+        self._proc.stdin.write(data)
+
+    def kill(self):
+        self._proc.kill()
+        self._proc.wait()
+
+    def close(self):
+        self._proc.stdin.close()
+        stderr = self._proc.stderr.read()
+        self._proc.stderr.close()
+        if self._proc.wait() != 0:
+            raise RuntimeError(f"Encoding {self.output_path} failed: {stderr.decode('utf-8', 'ignore').strip()}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.kill()
+
+
+def to_pcm16(block):
+    """float32 block to interleaved s16le bytes"""
+    return np.clip(block * 32768.0, -32768, 32767).astype('<i2').tobytes()
+
+
+class MultiPcmWriter:
+    """
+    Encode the same float32 blocks to several files at once
+
+    Every block is converted to s16le once and handed to one thread per
+    output, which pipes it into that output's own ffmpeg process. The encoders
+    run side by side, so the total time is close to that of the slowest one,
+    and nothing is written to temporary files.
+    """
+
+    def __init__(self, outputs, sample_rate, channels, codec_args=None, queue_blocks=4):
+        """
+        :param outputs: Dict mapping output path to audio format (a value of add_bgm.AUDIO_FORMATS)
+        :param codec_args: Dict mapping audio format to ffmpeg arguments (default: config.EXPORT_CODEC_ARGS)
+        :param queue_blocks: Blocks buffered per output before write() waits for that encoder
+        """
+        codec_args = EXPORT_CODEC_ARGS if codec_args is None else codec_args
+        self._writers = []
+        self._queues = []
+        self._threads = []
+        self._errors = {}
+        try:
+            for path, audio_format in outputs.items():
+                self._writers.append(PcmWriter(path, sample_rate, channels, audio_format,
+                                               codec_args.get(audio_format, ())))
+        except Exception:
+            self._kill()
+            raise
+        for writer in self._writers:
+            blocks = queue.Queue(maxsize=queue_blocks)
+            thread = threading.Thread(target=self._feed, args=(writer, blocks), daemon=True)
+            thread.start()
+            self._queues.append(blocks)
+            self._threads.append(thread)
+
+    def _feed(self, writer, blocks):
+        while True:
+            data = blocks.get()
+            if data is None:
+                break
+            if writer.output_path in self._errors:
+                continue  # 继续取出数据，避免 write() 阻塞
+            try:
+                writer.write_pcm(data)
+            except OSError as e:
+                self._errors[writer.output_path] = e
+        try:
+            writer.close()
+        except (OSError, RuntimeError) as e:
+            self._errors.setdefault(writer.output_path, e)
+
+    def write(self, block):
+        data = to_pcm16(block)
+        for blocks in self._queues:
+            blocks.put(data)
+
+    def close(self):
+        """Finish all encoders; raises RuntimeError naming every output that failed"""
+        for blocks in self._queues:
+            blocks.put(None)
+        for thread in self._threads:
+            thread.join()
+        if self._errors:
+            details = "; ".join(f"{path}: {error}" for path, error in self._errors.items())
+            raise RuntimeError(f"Encoding failed for {details}")
+
+    def _kill(self):
+        for writer in self._writers:
+            writer.kill()
+
+    def abort(self):
+        """Stop every encoder and delete the partial outputs, e.g. when the mix failed halfway"""
+        # 编码进程被杀掉后写线程只会丢弃数据，结束标记总能放入队列
+        self._kill()
+        for blocks in self._queues:
+            blocks.put(None)
+        for thread in self._threads:
+            thread.join()
+        for writer in self._writers:
+            if os.path.exists(writer.output_path):
+                os.remove(writer.output_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def load_pcm(file_path, sample_rate, channels, gain_db=0.0, source_channels=None):
+    """
+    Decode a whole (short) file such as the BGM into a float32 array of shape (frames, channels)
+
+    :param file_path: Path to the audio file
+    :param sample_rate: Target sample rate
+    :param channels: Target channel count
+    :param gain_db: Gain in dB applied to the decoded samples
+    :param source_channels: Channel count of the file, if already known
+    :return: numpy array of shape (frames, channels)
+    """
+    with PcmReader(file_path, sample_rate, channels, source_channels) as reader:
+        blocks = list(reader)
+    pcm = np.concatenate(blocks) if blocks else np.empty((0, channels), dtype='<f4')
+    if gain_db:
+        pcm *= np.float32(db_to_gain(gain_db))
+    return pcm
+
+
+class BgmMixer:
+    """
+    Mix speech with looping background music block by block.
+
+    The layout matches what add_background_music used to build with pydub:
+    the first `intro_ms` of the BGM play alone, the speech fades in over the
+    last `crossfade_ms` of that intro while the intro fades out, and the BGM,
+    started `crossfade_ms` in and looped, is overlaid from the very beginning
+    until `intro_ms` before the end of the output. The BGM is looped by index
+    arithmetic, and the speech is only held for one block plus a short
+    lookahead.
+
+    Mono speech is copied to every channel at full level, as pydub did. The
+    samples then match the pydub path (within 19/32768 on a sine test, mono
+    or stereo speech) when speech and BGM share a sample rate. Otherwise the
+    speech is resampled by ffmpeg instead of pydub's audioop.ratecv, which
+    interpolates with a different phase. The difference grows with frequency:
+    a half-scale tone at 16 kHz under 44.1 kHz BGM differs by up to about
+    1200/32768 per sample at 220 Hz and 2400/32768 at 440 Hz.
+    """
+
+    def __init__(self, bgm, sample_rate, intro_ms=3000, crossfade_ms=1000, block_frames=BLOCK_FRAMES, ducker=None):
+        """
+        :param bgm: Gain-adjusted BGM samples, float32 array of shape (frames, channels)
+        :param sample_rate: Sample rate shared by the BGM and the speech blocks
+        :param intro_ms: Length of the BGM-only intro, crossfade included
+        :param crossfade_ms: Length of the crossfade between intro and speech
+        :param block_frames: Number of frames per output block
+        :param ducker: Optional loudness.Ducker lowering the BGM bed under the voice
+        """
+        if not len(bgm):
+            raise ValueError("Background music is empty")
+        self.bgm = bgm
+        self.sample_rate = sample_rate
+        self.channels = bgm.shape[1]
+        self.block_frames = block_frames
+        self.intro = min(ms_to_frames(intro_ms, sample_rate), len(bgm))
+        self.crossfade = min(ms_to_frames(crossfade_ms, sample_rate), self.intro)
+        # 语音在输出中的起始帧
+        self.speech_start = self.intro - self.crossfade
+        # 叠加的 BGM 从 crossfade 处开始（对应原来的 bg_main[crossfade_duration:]）
+        self.overlay_offset = self.crossfade
+        self.ducker = ducker
+
+    def output_frames(self, speech_frames):
+        """Length of the mixed output for a speech of `speech_frames` frames"""
+        return max(self.speech_start + speech_frames, self.intro)
+
+    def _add_bgm(self, out, start, stop, offset, gains=None):
+        """Add looped BGM frames [start + offset, stop + offset) to out[0:stop - start], optionally scaled"""
+        length = len(self.bgm)
+        pos = (start + offset) % length
+        done = 0
+        total = stop - start
+        while done < total:
+            n = min(length - pos, total - done)
+            if gains is None:
+                out[done:done + n] += self.bgm[pos:pos + n]
+            else:
+                out[done:done + n] += self.bgm[pos:pos + n] * gains[done:done + n, None]
+            done += n
+            pos = 0
+
+    def iter_mix(self, speech_blocks, eager_intro=False):
+        """
+        Mix an iterable of speech blocks, yielding float32 output blocks
+
+        :param speech_blocks: Iterable of float32 arrays of shape (frames, channels)
+        :param eager_intro: Yield the blocks before the speech starts without reading any speech,
+                            assuming it is at least `crossfade_ms` longer than them (for playback while
+                            synthesizing; a shorter speech would have ended the BGM bed earlier)
+        """
+        blocks = iter(speech_blocks)
+        pending = np.empty((0, self.channels), dtype='<f4')
+        pending_start = 0  # speech frame index of pending[0]
+        speech_frames = None  # known once the speech is exhausted
+        t0 = 0
+        while True:
+            t1 = t0 + self.block_frames
+            # Whether the overlay still runs at t depends on t + overlay_offset < speech length,
+            # so read that far ahead before emitting the block.
+            need = t1 + self.overlay_offset
+            if eager_intro and t1 <= self.speech_start:
+                need = 0
+            parts = [pending]
+            have = pending_start + len(pending)
+            while speech_frames is None and have < need:
+                block = next(blocks, None)
+                if block is None:
+                    speech_frames = have
+                else:
+                    parts.append(block)
+                    have += len(block)
+            if len(parts) > 1:
+                pending = np.concatenate(parts)
+
+            if speech_frames is not None:
+                total = self.output_frames(speech_frames)
+                if t0 >= total:
+                    return
+                t1 = min(t1, total)
+            out = np.zeros((t1 - t0, self.channels), dtype='<f4')
+
+            # BGM intro, fading out over the crossfade
+            if t0 < self.intro:
+                stop = min(t1, self.intro)
+                t = np.arange(t0, stop)
+                fade = np.clip(1 - (t - self.speech_start) / self.crossfade, 0, 1) if self.crossfade else \
+                    np.ones(len(t))
+                out[:stop - t0] += self.bgm[t0:stop] * fade[:, None].astype('<f4')
+
+            # Speech, fading in over the crossfade
+            s0 = max(t0 - self.speech_start, 0)
+            s1 = min(t1 - self.speech_start, pending_start + len(pending))
+            if s1 > s0:
+                speech = pending[s0 - pending_start:s1 - pending_start]
+                if s0 < self.crossfade:
+                    fade = np.minimum(np.arange(s0, s1) / self.crossfade, 1).astype('<f4')
+                    speech = speech * fade[:, None]
+                begin = s0 + self.speech_start - t0
+                out[begin:begin + len(speech)] += speech
+
+            # Looped BGM bed
+            overlay_stop = t1 if speech_frames is None else min(t1, speech_frames - self.overlay_offset)
+            if overlay_stop > t0:
+                gains = None
+                if self.ducker is not None:
+                    gains = self.ducker.gains(t0 - self.speech_start, overlay_stop - self.speech_start)
+                self._add_bgm(out, t0, overlay_stop, self.overlay_offset, gains)
+
+            drop = min(max(t1 - self.speech_start - pending_start, 0), len(pending))
+            pending = pending[drop:]
+            pending_start += drop
+            yield out
+            t0 = t1
+
+
+def analyze_speech(file_path):
+    """
+    Per-frame power of a speech file (or SpeechPcm) at its own sample rate
+
+    16-bit WAV files are memory-mapped, anything else is decoded block by block.
+
+    :return: (power per loudness.FRAME_MS frame, frame length in seconds, channels)
+    """
+    if isinstance(file_path, SpeechPcm):
+        wav = file_path.samples, file_path.sample_rate
+    else:
+        wav = map_wav(file_path) if os.path.splitext(file_path)[1].lower() == '.wav' else None
+    if wav is not None:
+        samples, sample_rate = wav
+        frame_length = max(int(sample_rate * FRAME_MS / 1000), 1)
+        return frame_power(samples, sample_rate, full_scale=32768.0), frame_length / sample_rate, samples.shape[1]
+    sample_rate, channels = probe_audio(file_path)
+    power = FramePower(max(int(sample_rate * FRAME_MS / 1000), 1))
+    with PcmReader(file_path, sample_rate, channels) as reader:
+        for block in reader:
+            power.feed(block)
+    return power.result(), power.frame_length / sample_rate, channels
+
+
+def _timed_writes(blocks, target):
+    """Yield the mixed blocks, adding the time until the next one is requested (the write) to encode_s"""
+    for block in blocks:
+        start = time.perf_counter()
+        yield block
+        target.add('encode_s', time.perf_counter() - start)
+
+
+def mix_background_music(original_audio, bg_music, output_audio, bg_gain_db=0.0, intro_ms=3000,
+                         crossfade_ms=1000, audio_format='mp3', bgm_cache=None, speech_lufs=None, bgm_lufs=None,
+                         duck_db=0.0, extra_outputs=None):
+    """
+    Stream `original_audio` through a BgmMixer into `output_audio`
+
+    The mix is computed once; with `extra_outputs` the same blocks are encoded
+    to every output in parallel (see MultiPcmWriter).
+
+    :param original_audio: Path to the speech file, or a SpeechPcm handed over from synthesis
+    :param bg_music: Path to the background music file
+    :param output_audio: Path to the output file
+    :param bg_gain_db: Gain in dB applied to the background music, unless bgm_lufs is given
+    :param intro_ms: Length of the BGM-only intro
+    :param crossfade_ms: Length of the intro/speech crossfade
+    :param audio_format: Output format, a value of add_bgm.AUDIO_FORMATS
+    :param bgm_cache: Optional pcm_cache.PcmCache used to probe and decode the BGM
+    :param speech_lufs: Normalize the speech to this integrated loudness (optional)
+    :param bgm_lufs: Normalize the background music to this integrated loudness (optional)
+    :param duck_db: Lower the BGM bed by this many dB (negative) while the voice is present
+    :param extra_outputs: Dict mapping further output paths to their audio format (optional)
+    :return: Duration of the output in seconds
+    """
+    with span("audio_mixer.probe"):
+        if isinstance(original_audio, SpeechPcm):
+            speech_rate, speech_channels = original_audio.sample_rate, original_audio.channels
+        else:
+            speech_rate, speech_channels = probe_audio(original_audio)
+        bg_rate, bg_channels = bgm_cache.probe(bg_music) if bgm_cache else probe_audio(bg_music)
+    # 与 pydub 一致：统一到较高的采样率和声道数（重采样由 ffmpeg 完成，结果与 pydub 有相位差，见 BgmMixer）
+    sample_rate = max(speech_rate, bg_rate)
+    channels = max(speech_channels, bg_channels)
+
+    speech_gain_db = 0.0
+    ducker = None
+    if speech_lufs is not None or duck_db:
+        with span("audio_mixer.analyze_speech"):
+            power, frame_seconds, analyzed_channels = analyze_speech(original_audio)
+        # 单声道人声在混音中以原电平复制到每个声道（见 upmix），各声道的功率相加
+        power *= channels / analyzed_channels
+        speech_loudness = integrated_loudness(power)
+        logger.info(f"Speech loudness {speech_loudness:.1f} LUFS")
+        if speech_lufs is not None:
+            speech_gain_db = gain_to_target(speech_loudness, speech_lufs)
+        if duck_db:
+            ducker = Ducker(ducking_envelope(power, speech_loudness, duck_db), frame_seconds * sample_rate)
+
+    if bgm_lufs is not None:
+        raw = bgm_cache.load(bg_music, sample_rate, channels) if bgm_cache else \
+            load_pcm(bg_music, sample_rate, channels, source_channels=bg_channels)
+        bgm_loudness = integrated_loudness(frame_power(raw, sample_rate))
+        bg_gain_db = gain_to_target(bgm_loudness, bgm_lufs)
+        logger.info(f"BGM loudness {bgm_loudness:.1f} LUFS, gain {bg_gain_db:+.1f} dB")
+
+    with span("audio_mixer.load_bgm"):
+        if bgm_cache:
+            bgm = bgm_cache.load(bg_music, sample_rate, channels, bg_gain_db)
+        else:
+            bgm = load_pcm(bg_music, sample_rate, channels, bg_gain_db, bg_channels)
+    mixer = BgmMixer(bgm, sample_rate, intro_ms=intro_ms, crossfade_ms=crossfade_ms, ducker=ducker)
+    frames = 0
+    outputs = {output_audio: audio_format, **(extra_outputs or {})}
+    with span("audio_mixer.mix", outputs=len(outputs)) as mix_span:
+        with open_speech(original_audio, sample_rate, channels, speech_channels) as reader, \
+                MultiPcmWriter(outputs, sample_rate, channels) as writer:
+            speech = reader
+            if tracing_enabled():
+                # decode_s: 等待 ffmpeg 解码的时间；encode_s: 交给编码线程的时间；其余为混音本身
+                speech = timed_iter(reader, mix_span, 'decode_s')
+            if speech_gain_db:
+                speech_gain = np.float32(db_to_gain(speech_gain_db))
+                speech = (block * speech_gain for block in speech)
+            blocks = mixer.iter_mix(speech)
+            if tracing_enabled():
+                blocks = _timed_writes(blocks, mix_span)
+            for block in blocks:
+                writer.write(block)
+                frames += len(block)
+        if tracing_enabled():
+            mix_span.set(seconds=frames / sample_rate,
+                         bytes=sum(os.path.getsize(path) for path in outputs if os.path.exists(path)))
+    logger.info(f"Mixed {original_audio} into {', '.join(outputs)} ({frames / sample_rate:.2f}s)")
+    return frames / sample_rate
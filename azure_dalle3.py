@@ -1,25 +1,27 @@
 import os
-import httpx
-from openai import AzureOpenAI
 from config import SPEECH_CACHE_DIR
-from private_config import AzureDalle3Config
-
-os.environ["AZURE_OPENAI_ENDPOINT"] = AzureDalle3Config.ENDPOINT
-os.environ['AZURE_OPENAI_API_KEY'] = AzureDalle3Config.KEY
+from http_pool import get_azure_openai_client, download_to_file
+from rate_limit import get_limiter
+from tracing import span, traced
 
 
+@traced("dalle3.generate_img")
 def generate_img_with_dalle3(prompt: str, save_path: str) -> str:
-    client = AzureOpenAI(
+    # 凭据在第一次调用时才读取，只导入模块不需要 private_config
+    from private_config import AzureDalle3Config
+    client = get_azure_openai_client(
         api_version="2024-02-01",
-        api_key=os.environ["AZURE_OPENAI_API_KEY"],
-        azure_endpoint=os.environ['AZURE_OPENAI_ENDPOINT']
+        api_key=AzureDalle3Config.KEY,
+        azure_endpoint=AzureDalle3Config.ENDPOINT
     )
 
-    result = client.images.generate(
-        model="dalle3",  # the name of your DALL-E 3 deployment
-        prompt=prompt,
-        n=1
-    )
+    with span("dalle3.images_generate"):
+        result = get_limiter("dalle").call(
+            client.images.generate,
+            model="dalle3",  # the name of your DALL-E 3 deployment
+            prompt=prompt,
+            n=1
+        )
 
     # Set the directory for the stored image
     image_dir = SPEECH_CACHE_DIR
@@ -30,7 +32,4 @@ def generate_img_with_dalle3(prompt: str, save_path: str) -> str:
 
     # Retrieve the generated image
     image_url = result.data[0].url  # extract image URL from response
-    generated_image = httpx.get(image_url).content  # download the image
-    with open(save_path, "wb") as image_file:
-        image_file.write(generated_image)
-    return save_path
+    return download_to_file(image_url, save_path)  # stream the image to disk
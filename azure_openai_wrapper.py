@@ -1,40 +1,246 @@
-import os
-from openai import AzureOpenAI
-from private_config import AzureOpenAiConfig
+import re
+import time
+from collections import deque
+from config import CHAT_COMPLETION_TOKEN_ESTIMATE
+from http_pool import get_azure_openai_client
+from json_stream import JsonArrayStream
+from rate_limit import get_limiter
+from tracing import current_span, record, traced
+from utils import get_logger
 
-# 设置环境变量
-os.environ["AZURE_OPENAI_ENDPOINT"] = AzureOpenAiConfig.azure_endpoint
-os.environ["AZURE_OPENAI_API_KEY"] = AzureOpenAiConfig.api_key
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
 
-client = AzureOpenAI(
-    api_version=AzureOpenAiConfig.api_version,
-    azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-    api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-)
+logger = get_logger("azure_openai_wrapper")
 
+# 对话历史（不含 system prompt）的 token 上限
+HISTORY_TOKEN_BUDGET = 3000
+# 每条消息在 chat 格式中的额外开销
+MESSAGE_TOKEN_OVERHEAD = 4
+# 连续这么多次回复里没有解析出任何对象（例如模型回了一段话或单个对象）就停止请求
+MAX_EMPTY_REPLIES = 3
 
-def chat_with_gpt4(messages):
-    try:
-        response = client.chat.completions.create(
-            model=AzureOpenAiConfig.model_name,
-            messages=messages
+_CJK = re.compile(r'[　-〿㐀-䶿一-鿿＀-￯]')
+_encoding = None
+_client = None
+
+
+def get_client():
+    """
+    The chat client, created on first use so that importing this module needs
+    neither private_config nor the openai package
+    """
+    global _client
+    if _client is None:
+        from private_config import AzureOpenAiConfig
+        # 端点和密钥直接交给客户端，不写进进程的环境变量，免得和 DALL-E 的互相覆盖
+        _client = get_azure_openai_client(
+            api_version=AzureOpenAiConfig.api_version,
+            azure_endpoint=AzureOpenAiConfig.azure_endpoint,
+            api_key=AzureOpenAiConfig.api_key,
         )
-        return response.choices[0].message.content
-    except Exception as e:
-        print(f"An error occurred: {e}")
-        return None
+    return _client
+
+
+def _model_name():
+    from private_config import AzureOpenAiConfig
+    return AzureOpenAiConfig.model_name
+
+
+def count_tokens(text: str) -> int:
+    """
+    Count the tokens of a text with tiktoken when it is installed, otherwise
+    estimate them: one token per CJK character, one per four other characters
+    """
+    global _encoding
+    if tiktoken is not None:
+        if _encoding is None:
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        return len(_encoding.encode(text))
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def _prompt_tokens(messages) -> int:
+    return sum(count_tokens(message["content"]) + MESSAGE_TOKEN_OVERHEAD for message in messages)
+
+
+class ConversationWindow:
+    """
+    A fixed system prompt plus the most recent messages that fit in a token budget.
+
+    Token counts are computed once per message and kept as a running total, so
+    adding a message and trimming the window cost O(1) per message. When a
+    summarizer is given, messages pushed out of the window are folded into a
+    running summary instead of being dropped.
+    """
+
+    def __init__(self, system_prompt: str, max_tokens: int = HISTORY_TOKEN_BUDGET, summarizer=None):
+        """
+        :param system_prompt: System message sent with every request
+        :param max_tokens: Token budget for the history (system prompt excluded)
+        :param summarizer: Optional callable(previous_summary, dropped_messages) -> str
+        """
+        self.system_message = {"role": "system", "content": system_prompt}
+        self.max_tokens = max_tokens
+        self.summarizer = summarizer
+        self.summary = None
+        self._summary_tokens = 0
+        self._history = deque()
+        self._history_tokens = 0
+
+    @staticmethod
+    def _cost(message) -> int:
+        return count_tokens(message["content"]) + MESSAGE_TOKEN_OVERHEAD
+
+    @property
+    def tokens(self) -> int:
+        """Tokens of the history and summary currently in the window"""
+        return self._history_tokens + self._summary_tokens
+
+    def add(self, role: str, content: str):
+        message = {"role": role, "content": content}
+        cost = self._cost(message)
+        self._history.append((message, cost))
+        self._history_tokens += cost
+        self._trim()
+
+    def _trim(self):
+        dropped = []
+        while self.tokens > self.max_tokens and len(self._history) > 1:
+            message, cost = self._history.popleft()
+            self._history_tokens -= cost
+            dropped.append(message)
+        if dropped and self.summarizer is not None:
+            self.summary = self.summarizer(self.summary, dropped)
+            self._summary_tokens = count_tokens(self.summary) + MESSAGE_TOKEN_OVERHEAD if self.summary else 0
+            # 摘要本身过长时继续丢弃最早的消息
+            while self.tokens > self.max_tokens and len(self._history) > 1:
+                _, cost = self._history.popleft()
+                self._history_tokens -= cost
+
+    def messages(self, *extra):
+        """The messages to send: system prompt, summary, history, then any extra messages"""
+        messages = [self.system_message]
+        if self.summary:
+            messages.append({"role": "system", "content": f"之前对话的摘要：{self.summary}"})
+        messages.extend(message for message, _ in self._history)
+        messages.extend(extra)
+        return messages
+
+
+@traced("llm.chat")
+def chat_with_gpt4(messages):
+    """
+    One chat completion within the chat quota; 429s and transient errors are retried
+
+    :return: The reply; the last error is raised once the retries are used up
+    """
+    limiter = get_limiter("chat")
+    estimate = _prompt_tokens(messages) + CHAT_COMPLETION_TOKEN_ESTIMATE
+    response = limiter.call(get_client().chat.completions.create,
+                            model=_model_name(),
+                            messages=messages,
+                            tokens=estimate)
+    if response.usage is not None:
+        limiter.settle(estimate, response.usage.total_tokens)
+        current_span().set(prompt_tokens=response.usage.prompt_tokens,
+                           completion_tokens=response.usage.completion_tokens)
+    return response.choices[0].message.content
+
+
+def stream_chat_with_gpt4(messages):
+    """Yield the content of a chat completion piece by piece as it is generated"""
+    # 生成器在 yield 之间会交出控制权，无法保持 span 打开，因此自行计时后一次性记录
+    start = time.perf_counter()
+    first_piece = None
+    chars = 0
+    limiter = get_limiter("chat")
+    prompt_tokens = _prompt_tokens(messages)
+    estimate = prompt_tokens + CHAT_COMPLETION_TOKEN_ESTIMATE
+    # 429 在建立流时返回，只有这一步需要限流和重试
+    stream = limiter.call(get_client().chat.completions.create,
+                          model=_model_name(),
+                          messages=messages,
+                          stream=True,
+                          tokens=estimate)
+    pieces = []
+    for chunk in stream:
+        # Azure 会先发送一个只含内容过滤结果、没有 choices 的块
+        if chunk.choices and chunk.choices[0].delta.content:
+            if first_piece is None:
+                first_piece = time.perf_counter() - start
+                record("llm.stream.first_piece", first_piece)
+            chars += len(chunk.choices[0].delta.content)
+            pieces.append(chunk.choices[0].delta.content)
+            yield chunk.choices[0].delta.content
+    limiter.settle(estimate, prompt_tokens + count_tokens("".join(pieces)))
+    record("llm.stream", time.perf_counter() - start, chars=chars, first_piece=first_piece)
+
+
+def create_texts_in_batches(user_input: str, batch_size: int, max_history_tokens: int = HISTORY_TOKEN_BUDGET):
+    """
+    Ask for `batch_size` results per request as a JSON array and yield each
+    element's JSON text as soon as it has been streamed completely
+
+    Ends when a request fails, or after MAX_EMPTY_REPLIES replies in a row
+    without a single object, so a consumer waiting for more never keeps
+    paying for replies that cannot be parsed.
+
+    :param user_input: Prompt describing one JSON object
+    :param batch_size: Number of objects to request per call
+    :param max_history_tokens: Token budget of the conversation window
+    """
+    window = ConversationWindow(user_input, max_history_tokens)
+    request = f"{user_input}\n请一次创作 {batch_size} 首，放在一个 JSON 数组中返回，数组的每个元素都符合上述格式。"
+    empty_replies = 0
+
+    while True:
+        user_message = {"role": "user", "content": request}
+        parser = JsonArrayStream()
+        pieces = []
+        objects = 0
+        try:
+            for piece in stream_chat_with_gpt4(window.messages(user_message)):
+                pieces.append(piece)
+                for obj in parser.feed(piece):
+                    objects += 1
+                    yield obj
+        except Exception as e:
+            logger.error(f"Chat stream failed: {type(e).__name__}: {e}")
+            return
+        if not objects:
+            empty_replies += 1
+            logger.warning(f"Reply contained no JSON array elements ({empty_replies}/{MAX_EMPTY_REPLIES}): "
+                           f"{''.join(pieces)[:200]!r}")
+            if empty_replies >= MAX_EMPTY_REPLIES:
+                logger.error("Giving up after replies without a JSON array")
+                return
+            # 不把无法解析的回复放进对话历史，免得模型照着它继续回答
+            continue
+        empty_replies = 0
+        window.add("user", request)
+        window.add("assistant", "".join(pieces))
+
 
+def create_text_with_openai(user_input: str, max_history_tokens: int = HISTORY_TOKEN_BUDGET, summarizer=None):
+    """
+    Yield one reply per request, keeping the conversation in a token-budgeted window
 
-def create_text_with_openai(user_input: str):
-    messages = [
-        {"role": "system",
-         "content": user_input}
-    ]
+    Ends when a request still fails after the limiter's retries, like
+    create_texts_in_batches, so callers never receive None.
+    """
+    window = ConversationWindow(user_input, max_history_tokens, summarizer)
 
     while True:
-        # 添加用户输入到消息历史
-        messages.append({"role": "user", "content": user_input})
-        # 获取AI响应
-        response = chat_with_gpt4(messages)
+        user_message = {"role": "user", "content": user_input}
+        try:
+            response = chat_with_gpt4(window.messages(user_message))
+        except Exception as e:
+            logger.error(f"Chat completion failed: {type(e).__name__}: {e}")
+            return
         yield response
-        messages.append({"role": "assistant", "content": messages})
+        window.add("user", user_input)
+        window.add("assistant", response)
@@ -0,0 +1,109 @@
+import argparse
+import json
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from add_bgm import add_background_music
+from config import BGM_DIR
+from utils import get_logger
+
+logger = get_logger("batch_render")
+
+DEFAULT_BGM = os.path.join(BGM_DIR, "default.mp3")
+
+# 清单中每个任务可用的字段，与 add_background_music 的参数同名
+JOB_FIELDS = ('original_audio', 'bg_music', 'lyrics_file', 'output_audio', 'bg_volume', 'album', 'artist',
+              'cover_img', 'normalize_loudness', 'duck_db', 'extra_formats')
+
+
+def load_manifest(manifest_path):
+    """
+    Load render jobs from a JSON array or a JSON-lines file
+
+    Each job is an object with the keys of JOB_FIELDS; only `original_audio` is required.
+
+    :param manifest_path: Path to the manifest file
+    :return: List of job dicts
+    """
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        text = f.read()
+    if text.lstrip().startswith('['):
+        jobs = json.loads(text)
+    else:
+        jobs = [json.loads(line) for line in text.splitlines() if line.strip()]
+    for index, job in enumerate(jobs):
+        if 'original_audio' not in job:
+            raise ValueError(f"Job {index} in {manifest_path} has no original_audio")
+        unknown = set(job) - set(JOB_FIELDS)
+        if unknown:
+            raise ValueError(f"Job {index} in {manifest_path} has unknown fields: {', '.join(sorted(unknown))}")
+    return jobs
+
+
+def render_job(index, job):
+    """
+    Render one job in a worker process, never raising
+
+    :return: Result dict with index, output, ok, error and seconds
+    """
+    start = time.perf_counter()
+    kwargs = dict(job)
+    kwargs.setdefault('bg_music', DEFAULT_BGM)
+    try:
+        output = add_background_music(**kwargs)
+        return {'index': index, 'output': output, 'ok': True, 'error': None,
+                'seconds': time.perf_counter() - start}
+    except Exception as e:
+        return {'index': index, 'output': job.get('output_audio'), 'ok': False,
+                'error': f"{type(e).__name__}: {e}\n{traceback.format_exc()}",
+                'seconds': time.perf_counter() - start}
+
+
+def render_batch(jobs, max_workers=None):
+    """
+    Mix, export and tag many files across a process pool
+
+    Decoded BGM is shared between the workers through the PCM cache, so each
+    distinct BGM is decoded once per batch. A failing job is reported in its
+    result and does not stop the others.
+
+    :param jobs: Iterable of job dicts (see load_manifest)
+    :param max_workers: Number of worker processes (default: number of CPUs)
+    :return: List of result dicts in job order
+    """
+    jobs = list(jobs)
+    max_workers = max_workers or os.cpu_count() or 1
+    results = [None] * len(jobs)
+    logger.info(f"Rendering {len(jobs)} jobs with {max_workers} workers")
+    with ProcessPoolExecutor(max_workers=min(max_workers, max(len(jobs), 1))) as pool:
+        futures = [pool.submit(render_job, index, job) for index, job in enumerate(jobs)]
+        for done, future in enumerate(as_completed(futures), 1):
+            result = future.result()
+            results[result['index']] = result
+            if result['ok']:
+                logger.info(f"[{done}/{len(jobs)}] {result['output']} ({result['seconds']:.2f}s)")
+            else:
+                logger.error(f"[{done}/{len(jobs)}] job {result['index']} failed: {result['error']}")
+    failed = sum(1 for result in results if not result['ok'])
+    logger.info(f"Batch finished: {len(jobs) - failed} succeeded, {failed} failed")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Add background music to many speech files in parallel")
+    parser.add_argument("manifest", help="JSON or JSON-lines file with one job per entry")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="number of worker processes")
+    parser.add_argument("-o", "--results", help="write the per-job results to this JSON file")
+    args = parser.parse_args(argv)
+
+    results = render_batch(load_manifest(args.manifest), max_workers=args.workers)
+    if args.results:
+        with open(args.results, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return 0 if all(result['ok'] for result in results) else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,89 @@
+"""
+Benchmark cases
+
+Each case takes the input length in seconds and a scratch directory, does its
+setup (fixtures, imports, warm caches) and returns the callable to measure.
+"""
+import itertools
+import os
+
+from benchmarks.fixtures import FIXTURE_DIR, FIXTURE_VERSION, bgm_fixture, cover_fixture, speech_fixture, \
+    speech_mp3_fixture
+from benchmarks.stubs import install_stubs
+
+
+def _pcm_cache_dir():
+    return os.path.join(FIXTURE_DIR, f"v{FIXTURE_VERSION}", "pcm_cache")
+
+
+def _stubbed(seconds, work_dir, latency=0.0):
+    speech_wav, _ = speech_fixture(seconds)
+    bgm = bgm_fixture()
+    install_stubs(work_dir, speech_wav, cover_fixture(), os.path.dirname(bgm), _pcm_cache_dir(), latency)
+
+
+def load_audio(seconds, work_dir):
+    from add_bgm import load_audio as load
+    speech_wav, _ = speech_fixture(seconds)
+    return lambda: load(speech_wav)
+
+
+def add_background_music(seconds, work_dir):
+    _stubbed(seconds, work_dir)
+    from add_bgm import add_background_music as mix
+    speech_wav, lyrics_txt = speech_fixture(seconds)
+    bgm, cover = bgm_fixture(), cover_fixture()
+    output = os.path.join(work_dir, "out_with_bgm.mp3")
+    return lambda: mix(speech_wav, bgm, lyrics_file=lyrics_txt, output_audio=output, bg_volume=0.3,
+                       album="bench", artist="bench", cover_img=cover)
+
+
+def generate_timestamped_lyrics(seconds, work_dir):
+    from add_bgm import generate_timestamped_lyrics as generate
+    _, lyrics_txt = speech_fixture(seconds)
+    return lambda: generate(None, lyrics_txt, duration=seconds)
+
+
+def align_lyrics(seconds, work_dir):
+    from add_bgm import generate_aligned_lyrics
+    speech_wav, lyrics_txt = speech_fixture(seconds)
+    return lambda: generate_aligned_lyrics(speech_wav, lyrics_txt, 2000)
+
+
+def set_mp3_metadata(seconds, work_dir):
+    import shutil
+    import cover_store
+    from add_bgm import set_mp3_metadata as tag
+    mp3, lrc = speech_mp3_fixture(seconds)
+    # 封面放进 CoverStore，与正常渲染一样预先生成嵌入封面
+    covers = cover_store._cover_store = cover_store.CoverStore(os.path.join(work_dir, "covers"))
+    cover = covers.get_or_generate("bench", lambda prompt, path: shutil.copyfile(cover_fixture(), path))
+    target = os.path.join(work_dir, "tagged.mp3")
+    shutil.copyfile(mp3, target)
+    return lambda: tag(target, album="bench", artist="bench", cover_img=cover, lyrics_file=lrc, create_lrc=False)
+
+
+def pipeline(seconds, work_dir):
+    """Four poems through enjou_poem's stage graph, every cloud call stubbed"""
+    _stubbed(seconds, work_dir)
+    import enjou_poem
+    from azure_openai_wrapper import create_texts_in_batches
+
+    def run():
+        texts = create_texts_in_batches(enjou_poem.PROMPT, 4)
+        results = list(enjou_poem.build_pipeline().run(itertools.islice(texts, 4)))
+        failed = [error for _, _, error in results if error]
+        if failed:
+            raise RuntimeError(f"Pipeline failed: {failed[0][1]}")
+    return run
+
+
+# 名称 -> (用例, 适用的最长输入秒数)
+CASES = {
+    'load_audio': (load_audio, None),
+    'add_background_music': (add_background_music, None),
+    'generate_timestamped_lyrics': (generate_timestamped_lyrics, None),
+    'align_lyrics': (align_lyrics, None),
+    'set_mp3_metadata': (set_mp3_metadata, None),
+    'pipeline': (pipeline, 600),
+}
@@ -0,0 +1,205 @@
+"""
+A local stand-in for the Azure OpenAI chat endpoint that enforces a quota
+
+Requests beyond the server's requests-per-minute or concurrency limit get a
+429 with Retry-After, like Azure. The load driver sends chat completions from
+many threads through chat_with_gpt4 and reports the throughput per window, so
+the rate limiter can be checked against a known ceiling:
+
+    python -m benchmarks.fake_azure --server-rpm 120 --threads 16 --seconds 60
+    python -m benchmarks.fake_azure --server-rpm 600 --server-concurrency 3 --client-rpm 1200
+"""
+import argparse
+import json
+import math
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks.stubs import install_private_config, stub_poem
+
+
+class FakeQuota:
+    """Azure-like admission: a per-minute bucket refilled continuously, plus a concurrency cap"""
+
+    def __init__(self, requests_per_minute, max_concurrency=None, burst=None):
+        """
+        :param burst: Requests that may arrive at once (default: 10 seconds' worth)
+        """
+        self.rate = requests_per_minute / 60.0
+        self.capacity = burst or max(requests_per_minute / 6.0, 1.0)
+        self.max_concurrency = max_concurrency
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._injected = []
+        self.accepted = 0
+        self.rejected = 0
+
+    def inject(self, status, times=1):
+        """Answer the next `times` requests with this HTTP status, e.g. 503, before any quota check"""
+        with self._lock:
+            self._injected.extend([status] * times)
+
+    def injected(self):
+        """The status injected for the current request, or None"""
+        with self._lock:
+            return self._injected.pop(0) if self._injected else None
+
+    def admit(self):
+        """
+        :return: None if admitted (call done() afterwards), else the seconds to put in Retry-After
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self.max_concurrency is not None and self._in_flight >= self.max_concurrency:
+                self.rejected += 1
+                return 1.0
+            if self._tokens < 1:
+                self.rejected += 1
+                return (1 - self._tokens) / self.rate
+            self._tokens -= 1
+            self._in_flight += 1
+            self.accepted += 1
+            return None
+
+    def done(self):
+        with self._lock:
+            self._in_flight -= 1
+
+
+def make_handler(quota, latency, reject_latency=0.0, retry_after_ms=True):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status, body, headers=()):
+            data = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in headers:
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if not self.path.split("?")[0].endswith("/chat/completions"):
+                self._send(404, {"error": {"code": "404", "message": "Not found"}})
+                return
+            status = quota.injected()
+            if status is not None:
+                self._send(status, {"error": {"code": str(status), "message": "Injected failure"}})
+                return
+            retry_after = quota.admit()
+            if retry_after is not None:
+                time.sleep(reject_latency)
+                headers = [("Retry-After", str(math.ceil(retry_after)))]
+                if retry_after_ms:
+                    headers.append(("retry-after-ms", str(int(retry_after * 1000))))
+                self._send(429, {"error": {"code": "429", "message": "Rate limit exceeded"}}, headers)
+                return
+            try:
+                time.sleep(latency)
+                content = json.dumps(stub_poem(quota.accepted), ensure_ascii=False)
+                self._send(200, {
+                    "id": "fake", "object": "chat.completion", "created": int(time.time()), "model": "fake",
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": content}}],
+                    "usage": {"prompt_tokens": 200, "completion_tokens": 100, "total_tokens": 300},
+                })
+            finally:
+                quota.done()
+    return Handler
+
+
+def start_server(quota, latency=0.2, reject_latency=0.0, retry_after_ms=True):
+    """
+    Serve on a free local port in a daemon thread; returns the server
+
+    :param reject_latency: Seconds before a 429 is sent
+    :param retry_after_ms: Send retry-after-ms along with Retry-After (whole seconds, rounded up)
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(quota, latency, reject_latency, retry_after_ms))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def drive(threads, seconds, window=10.0):
+    """
+    Call chat_with_gpt4 from `threads` threads for `seconds`
+
+    :return: List of (window end, completed requests per minute in that window)
+    """
+    from azure_openai_wrapper import chat_with_gpt4
+    messages = [{"role": "user", "content": "写一首诗"}]
+    done = []
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+
+    def worker():
+        while time.monotonic() < deadline:
+            try:
+                chat_with_gpt4(messages)
+            except Exception:
+                continue
+            with lock:
+                done.append(time.monotonic())
+
+    start = time.monotonic()
+    pool = [threading.Thread(target=worker, daemon=True) for _ in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    windows = []
+    for i in range(int(seconds // window)):
+        lo, hi = start + i * window, start + (i + 1) * window
+        windows.append((hi - start, sum(lo <= t < hi for t in done) * 60.0 / window))
+    return windows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Drive chat_with_gpt4 against a local 429-returning fake endpoint")
+    parser.add_argument("--server-rpm", type=float, default=120, help="quota enforced by the fake server")
+    parser.add_argument("--server-concurrency", type=int, default=None, help="concurrent requests the server accepts")
+    parser.add_argument("--client-rpm", type=float, default=None,
+                        help="requests per minute configured in the limiter (default: the server quota)")
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=60)
+    parser.add_argument("--latency", type=float, default=0.2, help="server response time in seconds")
+    args = parser.parse_args(argv)
+
+    install_private_config()
+    import azure_openai_wrapper
+    import rate_limit
+    from http_pool import get_azure_openai_client
+
+    quota = FakeQuota(args.server_rpm, args.server_concurrency)
+    server = start_server(quota, args.latency)
+    azure_openai_wrapper._client = get_azure_openai_client(api_version="2024-02-01", api_key="fake",
+                                                           azure_endpoint=f"http://127.0.0.1:{server.server_port}")
+    rate_limit._limiters["chat"] = limiter = rate_limit.Limiter("chat", args.client_rpm or args.server_rpm,
+                                                                max_concurrency=args.threads)
+    windows = drive(args.threads, args.seconds)
+    server.shutdown()
+
+    for end, rpm in windows:
+        print(f"{end:6.0f}s  {rpm:7.1f} req/min", file=sys.stderr)
+    steady = [rpm for _, rpm in windows[1:]] or [rpm for _, rpm in windows]
+    print(f"quota {args.server_rpm:.0f} req/min, steady state {sum(steady) / len(steady):.1f} req/min, "
+          f"{quota.accepted} accepted, {quota.rejected} rejected (429), final concurrency {int(limiter.concurrency)}",
+          file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,147 @@
+import os
+import wave
+
+import numpy as np
+from PIL import Image
+
+from audio_mixer import PcmReader, PcmWriter
+from config import DATA_DIR
+from lrc import Lyrics
+
+# 修改生成方式时递增，旧的夹具文件会被重新生成
+FIXTURE_VERSION = 1
+FIXTURE_DIR = os.path.join(DATA_DIR, "bench_fixtures")
+SPEECH_RATE = 16000
+BGM_RATE = 44100
+BGM_SECONDS = 60
+
+SYLLABLE_MS = 220
+SYLLABLE_GAP_MS = 40
+LINE_PAUSE_MS = 450
+STANZA_PAUSE_MS = 900
+# 歌词行里使用的汉字，每个音节对应一个字
+CHARACTERS = "春夏秋冬风花雪月山水云天星河晨暮灯影诗书梦归"
+
+
+def _path(name):
+    return os.path.join(FIXTURE_DIR, f"v{FIXTURE_VERSION}", name)
+
+
+def _temp(path, ext=""):
+    # 多个进程可能同时生成同一个夹具，各写各的临时文件
+    return f"{path}.{os.getpid()}.tmp{ext}"
+
+
+def _speech_lines(rng, seconds):
+    """Yield (characters, pause_ms) until about `seconds` of speech are planned"""
+    total_ms = 0
+    line_index = 0
+    while total_ms < seconds * 1000:
+        count = int(rng.integers(5, 13))
+        text = "".join(CHARACTERS[i] for i in rng.integers(0, len(CHARACTERS), count))
+        pause = STANZA_PAUSE_MS if line_index % 4 == 3 else LINE_PAUSE_MS
+        total_ms += count * (SYLLABLE_MS + SYLLABLE_GAP_MS) + pause
+        line_index += 1
+        yield text, pause
+
+
+def _syllables(rng, count):
+    """Voiced bursts: a pitched tone with harmonics plus breath noise under a Hann envelope"""
+    length = SPEECH_RATE * SYLLABLE_MS // 1000
+    gap = np.zeros(SPEECH_RATE * SYLLABLE_GAP_MS // 1000, dtype=np.float32)
+    t = np.arange(length) / SPEECH_RATE
+    envelope = np.hanning(length).astype(np.float32)
+    parts = []
+    for pitch in rng.uniform(110, 260, count):
+        tone = sum(np.sin(2 * np.pi * pitch * k * t) / k for k in (1, 2, 3))
+        noise = rng.normal(0, 0.3, length)
+        parts.append((0.25 * (tone + noise) * envelope).astype(np.float32))
+        parts.append(gap)
+    return np.concatenate(parts)
+
+
+def speech_fixture(seconds):
+    """
+    Synthetic 16 kHz mono speech of about `seconds`, with the matching lyrics
+
+    Every line is a run of voiced syllables followed by a line or stanza pause,
+    so lyric alignment has real structure to find. Files are generated once per
+    length and fixture version, written line by line.
+
+    :return: (wav path, lyrics txt path)
+    """
+    wav_path = _path(f"speech_{seconds}s.wav")
+    txt_path = _path(f"speech_{seconds}s.txt")
+    if os.path.exists(wav_path) and os.path.exists(txt_path):
+        return wav_path, txt_path
+    os.makedirs(os.path.dirname(wav_path), exist_ok=True)
+    rng = np.random.default_rng(seconds)
+    lines = []
+    with wave.open(_temp(wav_path), 'wb') as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(SPEECH_RATE)
+        w.writeframes(np.zeros(SPEECH_RATE // 5, dtype='<i2').tobytes())
+        for text, pause in _speech_lines(rng, seconds):
+            samples = np.concatenate((_syllables(rng, len(text)),
+                                      np.zeros(SPEECH_RATE * pause // 1000, dtype=np.float32)))
+            w.writeframes(np.clip(samples * 32767, -32768, 32767).astype('<i2').tobytes())
+            lines.append(text)
+    with open(txt_path, 'w', encoding='utf-8') as f:
+        f.write("\n".join(lines))
+    os.replace(_temp(wav_path), wav_path)
+    return wav_path, txt_path
+
+
+def speech_mp3_fixture(seconds):
+    """The speech fixture encoded to MP3, with a uniformly timed LRC next to it"""
+    mp3_path = _path(f"speech_{seconds}s.mp3")
+    lrc_path = _path(f"speech_{seconds}s.lrc")
+    if os.path.exists(mp3_path) and os.path.exists(lrc_path):
+        return mp3_path, lrc_path
+    wav_path, txt_path = speech_fixture(seconds)
+    with PcmReader(wav_path, SPEECH_RATE, 1) as reader, \
+            PcmWriter(_temp(mp3_path), SPEECH_RATE, 1, 'mp3') as writer:
+        for block in reader:
+            writer.write(block)
+    with open(txt_path, 'r', encoding='utf-8') as f:
+        lines = f.read().splitlines()
+    step = seconds * 1000 // max(len(lines), 1)
+    Lyrics((i * step, line) for i, line in enumerate(lines)).write(lrc_path)
+    os.replace(_temp(mp3_path), mp3_path)
+    return mp3_path, lrc_path
+
+
+def bgm_fixture():
+    """
+    A 60-second stereo MP3 bed named default.mp3, so its directory can stand in for BGM_DIR
+
+    :return: Path to the MP3
+    """
+    path = _path(os.path.join("bgm", "default.mp3"))
+    if os.path.exists(path):
+        return path
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    t = np.arange(BGM_RATE * BGM_SECONDS) / BGM_RATE
+    chord = sum(np.sin(2 * np.pi * f * t) for f in (220.0, 277.18, 329.63)) / 3
+    tremolo = 0.75 + 0.25 * np.sin(2 * np.pi * 0.25 * t)
+    left = 0.4 * chord * tremolo
+    right = 0.4 * np.roll(chord, BGM_RATE // 100) * tremolo
+    samples = np.stack((left, right), axis=1).astype(np.float32)
+    with PcmWriter(_temp(path), BGM_RATE, 2, 'mp3') as writer:
+        writer.write(samples)
+    os.replace(_temp(path), path)
+    return path
+
+
+def cover_fixture():
+    """A deterministic 1024x1024 RGBA gradient PNG, the size DALL-E returns"""
+    path = _path("cover.png")
+    if os.path.exists(path):
+        return path
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    y, x = np.mgrid[0:1024, 0:1024]
+    pixels = np.stack(((x // 4) % 256, (y // 4) % 256, ((x + y) // 8) % 256, np.full_like(x, 255)), axis=2)
+    Image.fromarray(pixels.astype(np.uint8), 'RGBA').save(_temp(path, ".png"))
+    os.replace(_temp(path, ".png"), path)
+    return path
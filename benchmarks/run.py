@@ -0,0 +1,187 @@
+"""
+Benchmark the audio pipeline on synthetic fixtures
+
+    python -m benchmarks.run                                  # default sizes, all cases
+    python -m benchmarks.run --sizes 10,60 --cases load_audio,pipeline
+    python -m benchmarks.run --baseline benchmarks/results/<earlier>.json
+
+Every measurement runs in a fresh process, so peak RSS belongs to that case
+alone. CPU time includes child processes such as ffmpeg. Results are written
+as JSON; with --baseline, slower or larger cases are flagged and the exit
+status is 1.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from config import PROJECT_ROOT
+
+DEFAULT_SIZES = (10, 60, 600, 3600, 7200)
+RESULTS_DIR = os.path.join(PROJECT_ROOT, "benchmarks", "results")
+# 超过这个比例且超过绝对阈值才算退化，避免噪声误报
+REGRESSION_TOLERANCE = 0.2
+MIN_DELTA = {'wall': 0.05, 'cpu': 0.05, 'peak_rss_kb': 5 * 1024, 'peak_traced_kb': 5 * 1024}
+
+
+def _max_rss_kb(who):
+    rss = resource.getrusage(who).ru_maxrss
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+
+def _cpu(who):
+    usage = resource.getrusage(who)
+    return usage.ru_utime + usage.ru_stime
+
+
+def measure(case, seconds, trace_memory):
+    """Run one case in this (fresh) process and return its measurements"""
+    from benchmarks.cases import CASES
+    setup = CASES[case][0]
+    result = {'case': case, 'seconds': seconds}
+    work_dir = tempfile.mkdtemp(prefix="bench_")
+    try:
+        func = setup(seconds, work_dir)
+        result['base_rss_kb'] = _max_rss_kb(resource.RUSAGE_SELF)
+        cpu_self, cpu_children = _cpu(resource.RUSAGE_SELF), _cpu(resource.RUSAGE_CHILDREN)
+        start = time.perf_counter()
+        func()
+        result['wall'] = time.perf_counter() - start
+        result['cpu'] = (_cpu(resource.RUSAGE_SELF) - cpu_self) + (_cpu(resource.RUSAGE_CHILDREN) - cpu_children)
+        result['peak_rss_kb'] = _max_rss_kb(resource.RUSAGE_SELF)
+        result['peak_child_rss_kb'] = _max_rss_kb(resource.RUSAGE_CHILDREN)
+        if trace_memory:
+            # 单独再跑一次，tracemalloc 的开销不计入时间
+            func = setup(seconds, work_dir)
+            tracemalloc.start()
+            func()
+            result['peak_traced_kb'] = tracemalloc.get_traced_memory()[1] // 1024
+            tracemalloc.stop()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return result
+
+
+def _prepare_fixtures(sizes):
+    from benchmarks.fixtures import bgm_fixture, cover_fixture, speech_fixture
+    bgm_fixture()
+    cover_fixture()
+    for seconds in sizes:
+        start = time.perf_counter()
+        speech_fixture(seconds)
+        print(f"fixture {seconds}s ready ({time.perf_counter() - start:.1f}s)", file=sys.stderr)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(cases, sizes, repeat=1, trace_memory=True):
+    """
+    :return: Report dict with environment info and one aggregated entry per (case, size)
+    """
+    from benchmarks.cases import CASES
+    _prepare_fixtures(sizes)
+    results = []
+    spawn = get_context('spawn')
+    for case in cases:
+        limit = CASES[case][1]
+        for seconds in sizes:
+            if limit is not None and seconds > limit:
+                continue
+            runs = []
+            for _ in range(repeat):
+                with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as pool:
+                    runs.append(pool.submit(measure, case, seconds, trace_memory).result())
+            entry = {'case': case, 'seconds': seconds, 'runs': len(runs),
+                     'wall': statistics.median(run['wall'] for run in runs),
+                     'cpu': statistics.median(run['cpu'] for run in runs)}
+            for key in ('base_rss_kb', 'peak_rss_kb', 'peak_child_rss_kb', 'peak_traced_kb'):
+                if key in runs[0]:
+                    entry[key] = max(run[key] for run in runs)
+            results.append(entry)
+            print(f"{case:<28} {seconds:>6}s  wall {entry['wall']:8.3f}s  cpu {entry['cpu']:8.3f}s  "
+                  f"rss {entry['peak_rss_kb'] / 1024:8.1f}MB", file=sys.stderr)
+    return {
+        'commit': _git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'results': results,
+    }
+
+
+def compare(report, baseline, tolerance=REGRESSION_TOLERANCE):
+    """
+    :return: List of (case, seconds, metric, old, new) that got worse than tolerance allows
+    """
+    old = {(entry['case'], entry['seconds']): entry for entry in baseline['results']}
+    regressions = []
+    for entry in report['results']:
+        before = old.get((entry['case'], entry['seconds']))
+        if before is None:
+            continue
+        for metric, min_delta in MIN_DELTA.items():
+            if metric not in entry or metric not in before:
+                continue
+            if entry[metric] > before[metric] * (1 + tolerance) and entry[metric] - before[metric] > min_delta:
+                regressions.append((entry['case'], entry['seconds'], metric, before[metric], entry[metric]))
+    return regressions
+
+
+def main(argv=None):
+    from benchmarks.cases import CASES
+    parser = argparse.ArgumentParser(description="Benchmark the audio pipeline on synthetic fixtures")
+    parser.add_argument("--cases", default=",".join(CASES), help="comma-separated case names")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="comma-separated input lengths in seconds")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per case; the median time is kept")
+    parser.add_argument("--no-tracemalloc", action="store_true", help="skip the tracemalloc run")
+    parser.add_argument("-o", "--output", help="result JSON path (default: benchmarks/results/<time>-<commit>.json)")
+    parser.add_argument("--baseline", help="earlier result JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE,
+                        help="relative slowdown or growth that counts as a regression")
+    args = parser.parse_args(argv)
+
+    cases = [case for case in args.cases.split(",") if case]
+    unknown = set(cases) - set(CASES)
+    if unknown:
+        parser.error(f"unknown cases: {', '.join(sorted(unknown))}")
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+
+    report = run_benchmarks(cases, sizes, args.repeat, not args.no_tracemalloc)
+    output = args.output or os.path.join(RESULTS_DIR, f"{report['timestamp'].replace(':', '')}-{report['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}", file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        for case, seconds, metric, old, new in regressions:
+            print(f"REGRESSION {case} {seconds}s {metric}: {old:.3f} -> {new:.3f}", file=sys.stderr)
+        if regressions:
+            return 1
+        print(f"No regressions against {args.baseline} (commit {baseline.get('commit')})", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,145 @@
+"""
+Offline stand-ins for the cloud services, so the whole pipeline can be benchmarked without network access
+"""
+import json
+import os
+import shutil
+import sys
+import time
+import types
+
+STUB_ENDPOINT = "https://offline.invalid"
+
+
+def install_private_config():
+    """Provide placeholder credentials when private_config.py is absent; nothing is ever sent"""
+    try:
+        import private_config  # noqa: F401
+        return
+    except ImportError:
+        pass
+    module = types.ModuleType("private_config")
+
+    class AzureOpenAiConfig:
+        api_key = "offline"
+        azure_endpoint = STUB_ENDPOINT
+        api_version = "2024-02-01"
+        model_name = "offline"
+        SPEECH_KEY = "offline"
+        AzureLocation = "offline"
+
+    class AzureDalle3Config:
+        KEY = "offline"
+        ENDPOINT = STUB_ENDPOINT
+
+    module.AzureOpenAiConfig = AzureOpenAiConfig
+    module.AzureDalle3Config = AzureDalle3Config
+    sys.modules["private_config"] = module
+
+
+def stub_poem(index):
+    return {
+        "title": f"基准诗{index:04d}",
+        "content": "晨曦露珠微，羞涩花瓣垂。\n天光渐映晚，\n柔情绕心扉。",
+        "photo_desc": f"A quiet sunrise over dew-covered petals, variation {index}",
+    }
+
+
+class StubChat:
+    """Stream JSON arrays of poems in small pieces, like the chat completion stream"""
+
+    def __init__(self, latency=0.0, piece_chars=16):
+        self.latency = latency
+        self.piece_chars = piece_chars
+        self.calls = 0
+
+    def stream(self, messages):
+        text = json.dumps([stub_poem(self.calls * 100 + i) for i in range(8)], ensure_ascii=False)
+        self.calls += 1
+        for start in range(0, len(text), self.piece_chars):
+            if self.latency:
+                time.sleep(self.latency / (len(text) / self.piece_chars))
+            yield text[start:start + self.piece_chars]
+
+    def complete(self, messages):
+        time.sleep(self.latency)
+        self.calls += 1
+        return json.dumps(stub_poem(self.calls), ensure_ascii=False)
+
+
+class StubSpeech:
+    """SpeechAssistant stand-in that hands out a fixture WAV"""
+
+    def __init__(self, speech_wav, latency=0.0):
+        self.speech_wav = speech_wav
+        self.latency = latency
+        self._batched = set()
+
+    def _wait(self, text):
+        if self._cache_key(text) not in self._batched:
+            time.sleep(self.latency)
+
+    def synthesize_batch(self, texts):
+        """One simulated request for all texts; they are served without latency afterwards"""
+        time.sleep(self.latency)
+        self._batched.update(self._cache_key(text) for text in texts)
+        return len(texts)
+
+    def get_or_create_audio(self, text, save_path=None):
+        self._wait(text)
+        if save_path is None:
+            return self.speech_wav
+        shutil.copyfile(self.speech_wav, save_path)
+        return save_path
+
+    def _cache_key(self, text):
+        import hashlib
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def get_or_create_pcm(self, text, save_path=None):
+        from audio_mixer import SpeechPcm, map_wav
+        self._wait(text)
+        if save_path is not None:
+            shutil.copyfile(self.speech_wav, save_path)
+        return SpeechPcm(*map_wav(self.speech_wav), path=self.speech_wav)
+
+
+def stub_dalle(cover_png, latency=0.0):
+    """generate_img_with_dalle3 stand-in copying a fixture cover"""
+    def generate(prompt, save_path):
+        time.sleep(latency)
+        shutil.copyfile(cover_png, save_path)
+        return save_path
+    return generate
+
+
+def install_stubs(work_dir, speech_wav, cover_png, bgm_dir, pcm_cache_dir, latency=0.0):
+    """
+    Route every cloud call and every output directory of the pipeline to stubs and `work_dir`
+
+    :param latency: Simulated seconds per cloud call
+    :return: The StubChat in use
+    """
+    install_private_config()
+    import azure_openai_wrapper
+    import cover_store
+    import music_object
+    import pcm_cache
+    from artifact_store import ArtifactStore
+    from cover_store import CoverStore
+
+    chat = StubChat(latency)
+    azure_openai_wrapper.stream_chat_with_gpt4 = chat.stream
+    azure_openai_wrapper.chat_with_gpt4 = chat.complete
+    speech = StubSpeech(speech_wav, latency)
+    music_object.get_speech_instance = lambda: speech
+    music_object.generate_img_with_dalle3 = stub_dalle(cover_png, latency)
+    covers = CoverStore(os.path.join(work_dir, "covers"))
+    music_object.get_cover_store = lambda: covers
+    cover_store._cover_store = covers
+    artifact_dir = os.path.join(work_dir, "artifacts")
+    store = ArtifactStore(artifact_dir, os.path.join(artifact_dir, "manifest.sqlite3"))
+    music_object.get_artifact_store = lambda: store
+    music_object.BGM_DIR = bgm_dir
+    pcm_cache._bgm_cache = pcm_cache.PcmCache(pcm_cache_dir)
+    return chat
@@ -0,0 +1,163 @@
+import queue
+import re
+import threading
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+from tts_cache import normalize_text
+from utils import get_logger
+
+logger = get_logger("chunked_synthesis")
+
+# 句末标点，行内超长时在这些位置切分
+SENTENCE_END = re.compile(r'(?<=[。！？!?；;…])')
+MAX_CHUNK_CHARS = 200
+
+# 各类边界后插入的停顿（毫秒）
+DEFAULT_PAUSES = {
+    'sentence': 150,
+    'line': 350,
+    'stanza': 800,
+}
+
+
+def split_text(text, max_chars=MAX_CHUNK_CHARS):
+    """
+    Split text into synthesis chunks at stanza, line and sentence boundaries
+
+    Every line is its own chunk so that editing one line only invalidates that
+    chunk; lines longer than max_chars are packed sentence by sentence.
+
+    :param text: Text to split
+    :param max_chars: Soft upper bound of a chunk's length
+    :return: List of (chunk, pause) where pause names the boundary after the chunk
+             ('sentence', 'line', 'stanza') or is None for the last chunk
+    """
+    chunks = []
+    stanzas = [stanza for stanza in re.split(r'\n\s*\n', normalize_text(text)) if stanza.strip()]
+    for stanza in stanzas:
+        lines = [line for line in stanza.split('\n') if line.strip()]
+        for line_index, line in enumerate(lines):
+            pieces = []
+            for sentence in SENTENCE_END.split(line):
+                if not sentence.strip():
+                    continue
+                if pieces and len(pieces[-1]) + len(sentence) <= max_chars:
+                    pieces[-1] += sentence
+                else:
+                    pieces.append(sentence)
+            for piece in pieces[:-1]:
+                chunks.append((piece.strip(), 'sentence'))
+            chunks.append((pieces[-1].strip(), 'stanza' if line_index == len(lines) - 1 else 'line'))
+    if chunks:
+        chunks[-1] = (chunks[-1][0], None)
+    return chunks
+
+
+class ChunkedSynthesizer:
+    """
+    Synthesize long texts chunk by chunk on a bounded pool of reused synthesizers.
+
+    A synthesizer is any object with a `synthesize(text) -> bytes` method that
+    returns raw 16-bit mono PCM at `sample_rate` and raises on failure, so a
+    local fake can stand in for the Azure service. Chunks are cached on their
+    own and joined in order with silence between them.
+    """
+
+    def __init__(self, synthesizer_factory, pool_size=4, sample_rate=16000, cache=None, voice="", format_name="",
+                 pauses=None, max_chars=MAX_CHUNK_CHARS):
+        """
+        :param synthesizer_factory: Callable returning a new synthesizer
+        :param pool_size: Maximum number of synthesizers and concurrent requests
+        :param sample_rate: Sample rate of the PCM the synthesizers return
+        :param cache: Optional tts_cache.TtsCache for per-chunk results
+        :param voice: Voice name, part of the chunk cache key
+        :param format_name: Output format name, part of the chunk cache key
+        :param pauses: Pause lengths in ms per boundary kind, see DEFAULT_PAUSES
+        :param max_chars: Soft upper bound of a chunk's length
+        """
+        self.synthesizer_factory = synthesizer_factory
+        self.pool_size = pool_size
+        self.sample_rate = sample_rate
+        self.cache = cache
+        self.voice = voice
+        self.format_name = format_name
+        self.pauses = dict(DEFAULT_PAUSES, **(pauses or {}))
+        self.max_chars = max_chars
+        self._idle = queue.Queue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="tts")
+
+    def _acquire(self):
+        with self._lock:
+            if self._idle.empty() and self._created < self.pool_size:
+                self._created += 1
+                return self.synthesizer_factory()
+        return self._idle.get()
+
+    def _release(self, synthesizer):
+        self._idle.put(synthesizer)
+
+    def _synthesize_chunk(self, text):
+        key = None
+        if self.cache is not None:
+            key = self.cache.make_key(text, self.voice, self.format_name)
+            path = self.cache.get(key)
+            if path is not None:
+                with open(path, 'rb') as f:
+                    return f.read()
+        synthesizer = self._acquire()
+        try:
+            pcm = synthesizer.synthesize(text)
+        finally:
+            self._release(synthesizer)
+        if key is not None:
+            self.cache.put_bytes(key, pcm, ".pcm")
+        return pcm
+
+    def _silence(self, pause):
+        if pause is None:
+            return b''
+        frames = int(self.sample_rate * self.pauses.get(pause, 0) / 1000)
+        return b'\0\0' * frames
+
+    def synthesize(self, text, marks=None):
+        """
+        Synthesize text, returning raw 16-bit mono PCM
+
+        :param text: Text to speak
+        :param marks: Optional list that receives (audio offset in ms, text offset) for the
+                      start of every chunk, offsets referring to normalize_text(text)
+        :return: PCM bytes of all chunks joined in order
+        """
+        chunks = split_text(text, self.max_chars)
+        logger.info(f"Synthesizing {len(chunks)} chunks with up to {self.pool_size} synthesizers")
+        futures = [self._executor.submit(self._synthesize_chunk, chunk) for chunk, _ in chunks]
+        normalized = normalize_text(text)
+        parts = []
+        size = 0
+        cursor = 0
+        for future, (chunk, pause) in zip(futures, chunks):
+            if marks is not None:
+                position = normalized.find(chunk, cursor)
+                if position >= 0:
+                    marks.append((size * 500 // self.sample_rate, position))
+                    cursor = position + len(chunk)
+            for part in (future.result(), self._silence(pause)):
+                parts.append(part)
+                size += len(part)
+        return b''.join(parts)
+
+    def synthesize_to_wav(self, text, file_path, marks=None):
+        """Synthesize text into a 16-bit mono WAV file"""
+        pcm = self.synthesize(text, marks)
+        with wave.open(file_path, 'wb') as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(self.sample_rate)
+            w.writeframes(pcm)
+        return file_path
+
+    def close(self):
+        self._executor.shutdown(wait=True)
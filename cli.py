@@ -0,0 +1,161 @@
+"""
+Single entry point for the command line tools
+
+    python cli.py generate -y -n 4 -b 4      # LLM -> TTS -> cover -> mix
+    python cli.py synth "床前明月光" -o poem.wav
+    python cli.py mix speech.wav -o out.mp3 --lyrics poem.txt --cover cover.png
+    python cli.py tag out.mp3 --album 秋夜 --lyrics out.lrc
+    python cli.py play                        # every stored poem, listed from the manifest
+    python cli.py batch jobs.jsonl -j 4
+    python cli.py queue run -n 20 -j 4        # same as generate, but durable and resumable
+
+Each subcommand imports what it needs when it runs, so local commands such as
+tag and play never load the cloud SDKs or read private_config.
+"""
+import argparse
+import os
+import sys
+
+from config import BGM_DIR
+
+DEFAULT_BGM = os.path.join(BGM_DIR, "default.mp3")
+
+
+def _generate(args):
+    import enjou_poem
+    enjou_poem.main(streaming=args.stream, interactive=not args.non_interactive, count=args.count,
+                    batch_size=args.batch_size)
+    return 0
+
+
+def _synth(args):
+    from speech_assistant import get_speech_instance
+    text = args.text
+    if args.file:
+        with open(args.file, 'r', encoding='utf-8') as f:
+            text = f.read()
+    if not text:
+        raise SystemExit("synth: give the text or --file")
+    path = get_speech_instance().get_or_create_audio(text, save_path=args.output)
+    print(path)
+    if args.play:
+        from player import get_player
+        get_player().play(path)
+    return 0
+
+
+def _mix(args):
+    from add_bgm import add_background_music
+    output = add_background_music(args.speech, args.bgm, lyrics_file=args.lyrics, output_audio=args.output,
+                                  bg_volume=args.volume, album=args.album, artist=args.artist,
+                                  cover_img=args.cover, normalize_loudness=args.normalize, duck_db=args.duck_db,
+                                  extra_formats=args.formats.split(",") if args.formats else None)
+    print(output)
+    return 0
+
+
+def _tag(args):
+    from add_bgm import set_mp3_metadata
+    set_mp3_metadata(args.mp3, album=args.album, artist=args.artist, cover_img=args.cover,
+                     lyrics_file=args.lyrics, create_lrc=not args.no_lrc, verify=args.verify)
+    return 0
+
+
+def _play(args):
+    from player import find_tracks, get_player
+    if len(args.paths) == 1 and os.path.isfile(args.paths[0]):
+        get_player().play(args.paths[0], args.lrc)
+        return 0
+    if not args.paths:
+        # 从清单中列出，不遍历目录
+        from artifact_store import get_artifact_store
+        get_player().play_playlist(get_artifact_store().paths("mix"))
+        return 0
+    tracks = []
+    for target in args.paths:
+        tracks.extend(find_tracks(target) if os.path.isdir(target) else [target])
+    get_player().play_playlist(tracks)
+    return 0
+
+
+def _batch(args):
+    import json
+    from batch_render import load_manifest, render_batch
+    results = render_batch(load_manifest(args.manifest), max_workers=args.workers)
+    if args.results:
+        with open(args.results, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return 0 if all(result['ok'] for result in results) else 1
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="cli.py", description="Generate, render and play poems")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    generate = commands.add_parser("generate", help="write poems with the LLM and render them")
+    generate.add_argument("--stream", action="store_true", help="play each poem while it is being synthesized")
+    generate.add_argument("-y", "--non-interactive", action="store_true",
+                          help="run stages concurrently without waiting for Enter between poems")
+    generate.add_argument("-n", "--count", type=int, default=None, help="number of poems to generate")
+    generate.add_argument("-b", "--batch-size", type=int, default=1, help="poems requested per LLM call")
+    generate.set_defaults(func=_generate)
+
+    synth = commands.add_parser("synth", help="synthesize speech (cached by text and voice)")
+    synth.add_argument("text", nargs="?", help="text to speak")
+    synth.add_argument("-f", "--file", help="read the text from this file")
+    synth.add_argument("-o", "--output", help="WAV path (default: the file in the TTS cache)")
+    synth.add_argument("--play", action="store_true", help="play the result")
+    synth.set_defaults(func=_synth)
+
+    mix = commands.add_parser("mix", help="add background music, lyrics and tags to a speech file")
+    mix.add_argument("speech", help="speech audio file")
+    mix.add_argument("--bgm", default=DEFAULT_BGM, help="background music (default: %(default)s)")
+    mix.add_argument("-o", "--output", help="output path (default: <speech>_with_bgm.mp3)")
+    mix.add_argument("--lyrics", help="plain text lyrics, one line per sung line")
+    mix.add_argument("--volume", type=float, default=0.3, help="background volume 0-1 (default: %(default)s)")
+    mix.add_argument("--album")
+    mix.add_argument("--artist")
+    mix.add_argument("--cover", help="cover image")
+    mix.add_argument("--normalize", action="store_true", help="normalize the loudness of speech and BGM")
+    mix.add_argument("--duck-db", type=float, default=0.0, help="lower the BGM by this many dB under the voice")
+    mix.add_argument("--formats", help="extra comma-separated output formats, e.g. ogg,m4a")
+    mix.set_defaults(func=_mix)
+
+    tag = commands.add_parser("tag", help="write album, artist, cover and lyrics to an MP3")
+    tag.add_argument("mp3")
+    tag.add_argument("--album")
+    tag.add_argument("--artist")
+    tag.add_argument("--cover", help="cover image")
+    tag.add_argument("--lyrics", help="LRC file")
+    tag.add_argument("--no-lrc", action="store_true", help="do not copy the LRC next to the MP3")
+    tag.add_argument("--verify", action="store_true", help="re-read the tag and log it")
+    tag.set_defaults(func=_tag)
+
+    play = commands.add_parser("play", help="play files or directories of rendered poems back to back")
+    play.add_argument("paths", nargs="*", help="audio files or directories (default: every stored poem)")
+    play.add_argument("--lrc", help="LRC file for a single track (default: the .lrc next to it)")
+    play.set_defaults(func=_play)
+
+    batch = commands.add_parser("batch", help="render a manifest of mix jobs in parallel")
+    batch.add_argument("manifest", help="JSON or JSON-lines file with one job per entry")
+    batch.add_argument("-j", "--workers", type=int, default=None, help="number of worker processes")
+    batch.add_argument("-o", "--results", help="write the per-job results to this JSON file")
+    batch.set_defaults(func=_batch)
+
+    # 由 main 直接转交 job_queue.main，这里只为出现在帮助中
+    commands.add_parser("queue", help="durable, resumable job queue (run, work, status, retry)")
+    return parser
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if argv[:1] == ["queue"]:
+        # 选项原样交给 job_queue，包括 --help
+        import job_queue
+        return job_queue.main(argv[1:])
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
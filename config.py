@@ -5,6 +5,59 @@ DATA_DIR = os.path.join(PROJECT_ROOT, "data")
 SPEECH_CACHE_DIR = os.path.join(DATA_DIR, "speech_cache")
 BGM_DIR = os.path.join(DATA_DIR, "bgm")
 WITH_BGM_DIR = os.path.join(DATA_DIR, "with_bgm")
+COVER_DIR = os.path.join(DATA_DIR, "covers")
+ARTIFACT_DIR = os.path.join(DATA_DIR, "artifacts")  # 每首诗的产物，按回复的哈希分目录存放
+ARTIFACT_DB_PATH = os.path.join(ARTIFACT_DIR, "manifest.sqlite3")
+PCM_CACHE_DIR = os.path.join(DATA_DIR, "pcm_cache")
+PCM_CACHE_MAX_BYTES = 2 * 1024 ** 3  # 解码后的 BGM 缓存上限
+TTS_CACHE_DIR = os.path.join(SPEECH_CACHE_DIR, "tts")
+TTS_CACHE_MAX_BYTES = 5 * 1024 ** 3  # 语音合成缓存上限
+TTS_CACHE_MAX_AGE = 90 * 24 * 3600  # 超过 90 天未使用的语音会被清理
+SAVE_SPEECH_WAV = False  # 语音在内存中直接交给混音；为 True 时另外保存 <标题>_ori.wav
+# 多首短诗合成一个 SSML 请求：服务端单次最多 10 分钟音频、64 KB SSML，2000 字约 7 分钟
+TTS_BATCH_MAX_TEXTS = 16  # 为 1 时不合并
+TTS_BATCH_MAX_CHARS = 2000
+
+# 设置 POEM_TRACE=1（或 JSON-lines 文件路径）时记录各阶段耗时，见 tracing.py
+TRACE_ENV = "POEM_TRACE"
+TRACE_DIR = os.path.join(DATA_DIR, "traces")
+
+# 各输出格式的 ffmpeg 编码参数，导出时按格式选用
+EXPORT_CODEC_ARGS = {
+    'wav': ['-c:a', 'pcm_s16le'],
+    'mp3': ['-c:a', 'libmp3lame', '-b:a', '128k'],
+    'ogg': ['-c:a', 'libvorbis', '-q:a', '5'],
+    'flac': ['-c:a', 'flac'],
+    'aac': ['-c:a', 'aac', '-b:a', '160k'],
+    'm4a': ['-c:a', 'aac', '-b:a', '160k'],
+    'wma': ['-c:a', 'wmav2', '-b:a', '160k'],
+}
+
+# 共享 HTTP 连接池
+HTTP_MAX_CONNECTIONS = 32
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 16
+HTTP_KEEPALIVE_EXPIRY = 60  # 秒
+HTTP_CONNECT_TIMEOUT = 10  # 秒
+HTTP_READ_TIMEOUT = 120  # 秒，DALL-E 生成可能较慢
+
+# 各云服务的配额（rate_limit.py），按部署的实际配额调整；每个进程各自限流
+RATE_LIMITS = {
+    'chat': {'requests_per_minute': 60, 'tokens_per_minute': 30000, 'max_concurrency': 8},
+    'tts': {'requests_per_minute': 600, 'max_concurrency': 8},  # S0 为每秒 200 次，这里留出余量
+    'dalle': {'requests_per_minute': 6, 'max_concurrency': 2},  # DALL-E 3 默认每单位 6 RPM
+}
+# 预估一次对话的回复 token 数，先按它占用 TPM，返回后按实际用量修正
+CHAT_COMPLETION_TOKEN_ESTIMATE = 1000
+RETRY_MAX_ATTEMPTS = 6
+RETRY_BASE_SECONDS = 1.0  # 第 n 次重试前随机等待 0 到 RETRY_BASE_SECONDS * 2 ** n 秒
+RETRY_MAX_SECONDS = 60
+
+# 持久化任务队列（job_queue.py）
+JOB_DB_PATH = os.path.join(DATA_DIR, "jobs.sqlite3")
+JOB_LEASE_SECONDS = 300  # 租约到期未续的任务视为执行它的进程已崩溃
+JOB_MAX_ATTEMPTS = 5
+JOB_BACKOFF_SECONDS = 10  # 第 n 次重试前最多等待 JOB_BACKOFF_SECONDS * 2 ** (n - 1) 秒
+JOB_BACKOFF_MAX_SECONDS = 15 * 60
 
 
 class AzureVoice:
@@ -0,0 +1,195 @@
+import hashlib
+import io
+import os
+import re
+
+from config import COVER_DIR
+from tracing import count
+from utils import get_logger
+
+logger = get_logger("cover_store")
+
+# 嵌入 MP3 的封面尺寸
+EMBEDDED_ART_SIZE = (500, 500)
+EMBEDDED_ART_SUFFIX = f".art{EMBEDDED_ART_SIZE[0]}.jpg"
+
+
+def prompt_key(prompt: str) -> str:
+    """Hash of a cover prompt with whitespace differences ignored"""
+    return hashlib.sha256(re.sub(r'\s+', ' ', prompt).strip().encode('utf-8')).hexdigest()
+
+
+def embedded_art_path(cover_img: str) -> str:
+    """Where the embedded-art derivative of a cover image is kept"""
+    return os.path.splitext(cover_img)[0] + EMBEDDED_ART_SUFFIX
+
+
+def render_embedded_art(cover_img: str) -> bytes:
+    """
+    Render the embedded-art derivative of a cover in memory: RGB, 500x500, JPEG
+
+    :param cover_img: Path to the original image
+    :return: JPEG bytes
+    """
+    from PIL import Image
+    img = Image.open(cover_img)
+
+    # Convert to RGB mode (remove alpha channel if RGBA)
+    if img.mode in ('RGBA', 'LA'):
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        background.paste(img, mask=img.split()[-1])
+        img = background
+    elif img.mode != 'RGB':
+        img = img.convert('RGB')
+
+    img = img.resize(EMBEDDED_ART_SIZE, Image.LANCZOS)
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def _write_art(art_path: str, data: bytes):
+    tmp_path = f"{art_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, art_path)
+
+
+def make_embedded_art(cover_img: str, art_path: str = None) -> str:
+    """
+    Render the embedded-art derivative of a cover and save it next to the cover
+
+    :param cover_img: Path to the original image
+    :param art_path: Output path (default: embedded_art_path(cover_img))
+    :return: art_path
+    """
+    art_path = art_path or embedded_art_path(cover_img)
+    _write_art(art_path, render_embedded_art(cover_img))
+    return art_path
+
+
+def embedded_art_bytes(cover_img: str) -> bytes:
+    """
+    JPEG bytes to embed as cover art
+
+    Covers kept by the shared CoverStore use their cached derivative, rendered
+    again only if it is missing or older than the image. Any other image, e.g.
+    one passed to `cli.py tag --cover`, is rendered in memory and nothing is
+    written next to it; the same happens when the derivative cannot be saved.
+    """
+    if not get_cover_store().contains(cover_img):
+        return render_embedded_art(cover_img)
+    art_path = embedded_art_path(cover_img)
+    try:
+        fresh = os.path.getmtime(art_path) >= os.path.getmtime(cover_img)
+    except OSError:
+        fresh = False
+    if fresh:
+        with open(art_path, 'rb') as f:
+            return f.read()
+    data = render_embedded_art(cover_img)
+    try:
+        _write_art(art_path, data)
+    except OSError as e:
+        logger.warning(f"Cannot cache embedded art {art_path}: {e}")
+    return data
+
+
+def build_derivatives(cover_imgs, max_workers=None):
+    """
+    Render the embedded-art derivatives of many covers in a process pool
+
+    :return: List of derivative paths, None where rendering failed
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    cover_imgs = list(cover_imgs)
+    results = []
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(make_embedded_art, path) for path in cover_imgs]
+        for path, future in zip(cover_imgs, futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                logger.error(f"Failed to render embedded art for {path}: {e}")
+                results.append(None)
+    return results
+
+
+class CoverStore:
+    """
+    Cover images keyed by the hash of their prompt
+
+    Each entry keeps the generated original and its embedded-art derivative,
+    so identical prompts are generated once whatever the poem's title is and
+    tagging only reads the precomputed JPEG.
+    """
+
+    def __init__(self, cover_dir=COVER_DIR):
+        self.cover_dir = cover_dir
+
+    def original_path(self, key: str) -> str:
+        return os.path.join(self.cover_dir, key[:2], key + ".png")
+
+    def contains(self, path: str) -> bool:
+        """Whether a file lies inside the store's directory"""
+        root = os.path.abspath(self.cover_dir)
+        return os.path.abspath(path).startswith(root + os.sep)
+
+    def get(self, prompt: str):
+        """Path of the stored original for a prompt, or None"""
+        path = self.original_path(prompt_key(prompt))
+        return path if os.path.exists(path) else None
+
+    def get_or_generate(self, prompt: str, generator) -> str:
+        """
+        Return the cover for a prompt, generating it only on a miss
+
+        :param prompt: Image prompt
+        :param generator: Callable(prompt, save_path) writing the image, e.g. generate_img_with_dalle3
+        :return: Path of the original image
+        """
+        path = self.original_path(prompt_key(prompt))
+        if os.path.exists(path):
+            logger.info(f"Using stored cover: {path}")
+            count("cover_store.hit")
+            return path
+        count("cover_store.miss")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{os.path.splitext(path)[0]}.{os.getpid()}.tmp.png"
+        generator(prompt, tmp_path)
+        os.replace(tmp_path, path)
+        make_embedded_art(path)
+        logger.info(f"Stored new cover: {path}")
+        return path
+
+    def missing_derivatives(self):
+        """Originals in the store whose embedded art is missing or stale"""
+        for root, _, files in os.walk(self.cover_dir):
+            for name in files:
+                if not name.endswith(".png") or ".tmp" in name:
+                    continue
+                path = os.path.join(root, name)
+                art_path = embedded_art_path(path)
+                if not os.path.exists(art_path) or os.path.getmtime(art_path) < os.path.getmtime(path):
+                    yield path
+
+
+_cover_store = None
+
+
+def get_cover_store() -> CoverStore:
+    global _cover_store
+    if _cover_store is None:
+        _cover_store = CoverStore()
+    return _cover_store
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Render missing embedded-art derivatives of stored covers")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="number of worker processes")
+    args = parser.parse_args()
+    pending = list(get_cover_store().missing_derivatives())
+    logger.info(f"Rendering {len(pending)} derivatives")
+    build_derivatives(pending, max_workers=args.workers)
@@ -1,26 +1,80 @@
-from azure_openai_wrapper import create_text_with_openai
-from config import SPEECH_CACHE_DIR
+import argparse
+import itertools
+
+from azure_openai_wrapper import create_text_with_openai, create_texts_in_batches
 from music_object import MusicMeta
-from utils import open_in_file_explorer
+from pipeline import PipelineScheduler, Stage
+from utils import open_in_file_explorer, get_logger
 
+logger = get_logger("enjou_poem")
 
-def main():
-    prompt = '''写一首描写程序员工作成长过程的歌,以json格式返回，标准如下：
+PROMPT = '''写一首描写程序员工作成长过程的歌,以json格式返回，标准如下：
 {
     "title": "文章标题",
     "content": "文章内容",
     "photo_desc": "面向 della3 编写一套用于生成对应封面的prompt"：
 }
 '''
+
+
+def create_music(content: str) -> MusicMeta:
+    return MusicMeta(content)
+
+
+def build_pipeline(tts_concurrency=2, cover_concurrency=2, mix_concurrency=2) -> PipelineScheduler:
+    """
+    生成流水线：解析 -> (语音, 封面) -> 混音
+
+    每个条目是一条 LLM 回复；语音和封面只依赖解析结果，可以并行。回复由调度器按需拉取，
+    所以下一首诗的 LLM 调用与前面诗的渲染重叠。
+    """
+    return PipelineScheduler([
+        Stage("meta", create_music),
+        Stage("speech", lambda music: music.generate_audio(), deps=["meta"], concurrency=tts_concurrency),
+        Stage("cover", lambda music: music.generate_cover(), deps=["meta"], concurrency=cover_concurrency),
+        Stage("mix", lambda music, wav, cover: music.attach_bgm(wav, cover), deps=["meta", "speech", "cover"],
+              concurrency=mix_concurrency),
+    ])
+
+
+def main(streaming=False, interactive=True, count=None, batch_size=1):
+    """
+    :param streaming: 边合成边播放
+    :param interactive: 每首诗完成后打开文件并等待回车；为 False 时以流水线方式连续生成
+    :param count: 生成的数量，None 表示不限
+    :param batch_size: 每次请求生成的数量，大于 1 时流式解析 JSON 数组，每首诗一完成就进入后续阶段
+    """
+    if batch_size > 1:
+        texts = create_texts_in_batches(PROMPT, batch_size)
+    else:
+        texts = create_text_with_openai(PROMPT)
+    if not interactive:
+        for index, results, error in build_pipeline().run(itertools.islice(texts, count)):
+            if error:
+                logger.error(f"第 {index} 首生成失败（{error[0]}）: {error[1]}")
+            else:
+                logger.info(f"第 {index} 首已完成: {results['mix']}")
+        return
+
     # 将对话记录写入文件
-    for content in create_text_with_openai(prompt):
-        music = MusicMeta(content, SPEECH_CACHE_DIR)
-        music.save_content_to_text_file()
-        wav_file = music.generate_audio()
-        np3 = music.attach_bgm(wav_file)
+    for content in itertools.islice(texts, count):
+        music = create_music(content)
+        if streaming:
+            # 边合成边播放，MP3 在后台写出
+            np3 = music.play_streaming()
+        else:
+            speech = music.generate_audio()
+            np3 = music.attach_bgm(speech)
         open_in_file_explorer(np3)
         input("按回车键继续")
 
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stream", action="store_true", help="play each poem while it is being synthesized")
+    parser.add_argument("-y", "--non-interactive", action="store_true",
+                        help="run stages concurrently without waiting for Enter between poems")
+    parser.add_argument("-n", "--count", type=int, default=None, help="number of poems to generate")
+    parser.add_argument("-b", "--batch-size", type=int, default=1, help="poems requested per LLM call")
+    args = parser.parse_args()
+    main(streaming=args.stream, interactive=not args.non_interactive, count=args.count, batch_size=args.batch_size)
@@ -0,0 +1,84 @@
+import os
+import threading
+
+from config import (HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE_CONNECTIONS, HTTP_KEEPALIVE_EXPIRY,
+                    HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+from tracing import span
+from utils import get_logger
+
+try:
+    import h2  # noqa: F401  httpx 只有在装了 h2 时才能使用 HTTP/2
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+logger = get_logger("http_pool")
+
+_lock = threading.Lock()
+_http_client = None
+_openai_clients = {}
+
+
+def get_http_client() -> "httpx.Client":
+    """
+    The process-wide HTTP client: one keep-alive connection pool shared by the
+    OpenAI, DALL-E and image download requests, using HTTP/2 when available
+    """
+    global _http_client
+    with _lock:
+        if _http_client is None:
+            import httpx
+            _http_client = httpx.Client(
+                http2=HTTP2_AVAILABLE,
+                limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS,
+                                    max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                                    keepalive_expiry=HTTP_KEEPALIVE_EXPIRY),
+                timeout=httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+                follow_redirects=True,
+            )
+            logger.info(f"HTTP pool created (http2={HTTP2_AVAILABLE}, max_connections={HTTP_MAX_CONNECTIONS})")
+        return _http_client
+
+
+def get_azure_openai_client(api_version: str, azure_endpoint: str, api_key: str) -> "AzureOpenAI":
+    """An AzureOpenAI client per endpoint, all sharing the pooled HTTP client"""
+    key = (api_version, azure_endpoint, api_key)
+    client = _openai_clients.get(key)
+    if client is None:
+        # openai 导入很慢，只在第一次需要客户端时加载
+        from openai import AzureOpenAI
+        http_client = get_http_client()
+        with _lock:
+            client = _openai_clients.get(key)
+            if client is None:
+                # 重试由 rate_limit 统一负责，SDK 自带的重试会绕过限流
+                client = _openai_clients[key] = AzureOpenAI(api_version=api_version,
+                                                            azure_endpoint=azure_endpoint,
+                                                            api_key=api_key,
+                                                            http_client=http_client,
+                                                            max_retries=0)
+    return client
+
+
+def download_to_file(url: str, save_path: str, chunk_size: int = 64 * 1024) -> str:
+    """
+    Stream a URL straight to disk over the shared pool
+
+    The body is written chunk by chunk to a temporary file that replaces
+    save_path only once the download is complete.
+
+    :return: save_path
+    """
+    tmp_path = f"{save_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with span("http_pool.download") as download_span, get_http_client().stream("GET", url) as response:
+            response.raise_for_status()
+            with open(tmp_path, "wb") as f:
+                for chunk in response.iter_bytes(chunk_size):
+                    f.write(chunk)
+            download_span.set(bytes=response.num_bytes_downloaded)
+        os.replace(tmp_path, save_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return save_path
@@ -0,0 +1,621 @@
+"""
+Durable job queue for poem production
+
+Every LLM response is stored in SQLite as soon as it arrives, together with
+one task per stage (speech, cover, mix). Worker processes claim ready tasks
+under a lease and renew it while they work. A task whose worker crashed is
+picked up again once its lease expires, and failures are retried with
+exponential backoff. Stage outputs live in the poem's directory of the
+artifact store (artifact_store.py), whose manifest is keyed by the same
+poem id as jobs.response_hash; a task only remembers the input key its
+output was made from. A stage whose inputs hash to that key and whose
+output is still in the manifest is marked done without running, so a
+restart resumes where the last run stopped and never repeats a cloud call.
+Speech tasks are claimed several at a time and synthesized together in
+batched SSML requests.
+
+    python job_queue.py run -n 20 -b 4 -j 4   # generate 20 poems and render them with 4 workers
+    python job_queue.py work -j 4             # render whatever is queued
+    python job_queue.py status
+    python job_queue.py retry                 # give failed tasks another round
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from multiprocessing import get_context
+
+from artifact_store import poem_id
+from config import (JOB_BACKOFF_MAX_SECONDS, JOB_BACKOFF_SECONDS, JOB_DB_PATH, JOB_LEASE_SECONDS,
+                    JOB_MAX_ATTEMPTS, TTS_BATCH_MAX_TEXTS)
+from tracing import span
+from utils import get_logger
+
+logger = get_logger("job_queue")
+
+# 队列为空时两次查询之间的间隔
+POLL_SECONDS = 1.0
+REQUIRED_FIELDS = ('title', 'content', 'photo_desc')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    response TEXT NOT NULL,
+    response_hash TEXT NOT NULL UNIQUE,
+    title TEXT,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    job_id INTEGER NOT NULL REFERENCES jobs(id),
+    stage TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    available_at REAL NOT NULL DEFAULT 0,
+    lease_until REAL,
+    worker TEXT,
+    artifact_key TEXT,
+    error TEXT,
+    updated REAL,
+    PRIMARY KEY (job_id, stage)
+);
+CREATE INDEX IF NOT EXISTS tasks_ready ON tasks (stage, state, available_at);
+"""
+
+
+def digest(*parts) -> str:
+    """sha256 over the parts, used as the input key of a stage"""
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(str(part).encode('utf-8'))
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+class Task:
+    def __init__(self, job_id, stage, attempts, response):
+        self.job_id = job_id
+        self.stage = stage
+        self.attempts = attempts
+        self.response = response
+
+
+class QueueStage:
+    """
+    One stage of a queued poem
+
+    `key` maps the MusicMeta and the sha256 of every dependency's artifact to
+    the stage's input key; `run` gets the MusicMeta and the dependency
+    artifact paths and records its output in music.store under the stage's
+    name.
+    """
+
+    def __init__(self, name, run, key, deps=()):
+        self.name = name
+        self.run = run
+        self.key = key
+        self.deps = tuple(deps)
+
+
+def _speech_key(worker, music):
+    return digest("speech", worker.speech()._cache_key(music.full_text))
+
+
+def _speech(worker, music):
+    # TTS 缓存中的 WAV 和词边界硬链接进诗的目录，不另占空间；mix 阶段按 words_path 找到词边界
+    from lyric_align import words_path
+    with music.store.staging(music.poem_id) as staging:
+        wav = worker.speech().get_or_create_audio(music.full_text, save_path=os.path.join(staging, "speech.wav"))
+        if os.path.exists(words_path(wav)):
+            music.store.put_file(music.poem_id, "words", words_path(wav), name=os.path.basename(words_path(wav)))
+        return music.store.put_file(music.poem_id, "speech", wav)
+
+
+def _cover_key(worker, music):
+    return digest("cover", music.photo_desc)
+
+
+def _cover(worker, music):
+    return music.generate_cover()
+
+
+def _mix_key(worker, music, speech_sha, cover_sha):
+    import music_object
+    bgm = os.path.join(music_object.BGM_DIR, "default.mp3")
+    stat = os.stat(bgm)
+    return digest("mix", music.title, speech_sha, cover_sha, bgm, stat.st_size, stat.st_mtime_ns)
+
+
+def _mix(worker, music, speech_path, cover_path):
+    return music.attach_bgm(speech_path, cover_path)
+
+
+STAGES = (
+    QueueStage("speech", _speech, _speech_key),
+    QueueStage("cover", _cover, _cover_key),
+    QueueStage("mix", _mix, _mix_key, deps=("speech", "cover")),
+)
+STAGE_BY_NAME = {stage.name: stage for stage in STAGES}
+
+
+class JobQueue:
+    """The SQLite side of the queue; one instance per process (connections are not shared)"""
+
+    def __init__(self, db_path=JOB_DB_PATH, lease_seconds=JOB_LEASE_SECONDS, max_attempts=JOB_MAX_ATTEMPTS,
+                 backoff_seconds=JOB_BACKOFF_SECONDS, backoff_max_seconds=JOB_BACKOFF_MAX_SECONDS):
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._db = self.connect()
+        self._db.executescript(SCHEMA)
+
+    def connect(self):
+        db = sqlite3.connect(self.db_path, timeout=60, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    @contextmanager
+    def _transaction(self):
+        # BEGIN IMMEDIATE 先拿写锁，两个进程不会认领同一个任务
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            yield self._db
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        self._db.execute("COMMIT")
+
+    def enqueue(self, response: str):
+        """
+        Store an LLM response and its stage tasks
+
+        :return: Job id, or None if the response is not a poem or is already queued
+        """
+        try:
+            poem = json.loads(response)
+            missing = [field for field in REQUIRED_FIELDS if not poem.get(field)]
+        except (TypeError, ValueError, AttributeError) as e:
+            logger.warning(f"Not queuing a response that is not a JSON object: {e}")
+            return None
+        if missing:
+            logger.warning(f"Not queuing a response without {', '.join(missing)}")
+            return None
+        now = time.time()
+        with self._transaction() as db:
+            cursor = db.execute("INSERT OR IGNORE INTO jobs (response, response_hash, title, created) "
+                                "VALUES (?, ?, ?, ?)", (response, poem_id(response), poem['title'], now))
+            if not cursor.rowcount:
+                return None
+            job_id = cursor.lastrowid
+            db.executemany("INSERT INTO tasks (job_id, stage, updated) VALUES (?, ?, ?)",
+                           [(job_id, stage.name, now) for stage in STAGES])
+        logger.info(f"Queued job {job_id}: {poem['title']}")
+        return job_id
+
+    def claim(self, worker_id):
+        """
+        Lease the next ready task, finishing stages of older jobs first
+
+        :return: Task or None
+        """
+        now = time.time()
+        with self._transaction() as db:
+            for stage in reversed(STAGES):
+                task = self._claim_stage(db, stage, worker_id, now)
+                if task is not None:
+                    return task
+        return None
+
+    def claim_more(self, worker_id, stage_name, limit):
+        """
+        Lease up to `limit` further ready tasks of one stage, for stages that run in batches
+
+        :return: List of Task
+        """
+        now = time.time()
+        tasks = []
+        with self._transaction() as db:
+            while len(tasks) < limit:
+                task = self._claim_stage(db, STAGE_BY_NAME[stage_name], worker_id, now)
+                if task is None:
+                    break
+                tasks.append(task)
+        return tasks
+
+    def _claim_stage(self, db, stage, worker_id, now):
+        deps = ""
+        if stage.deps:
+            deps = (f"AND NOT EXISTS (SELECT 1 FROM tasks d WHERE d.job_id = t.job_id "
+                    f"AND d.stage IN ({', '.join('?' * len(stage.deps))}) AND d.state != 'done')")
+        while True:
+            row = db.execute(
+                f"SELECT t.job_id, t.attempts, t.state, j.response FROM tasks t JOIN jobs j ON j.id = t.job_id "
+                f"WHERE t.stage = ? AND ((t.state = 'pending' AND t.available_at <= ?) "
+                f"OR (t.state = 'running' AND t.lease_until < ?)) {deps} ORDER BY t.job_id LIMIT 1",
+                (stage.name, now, now, *stage.deps)).fetchone()
+            if row is None:
+                return None
+            job_id, attempts, state, response = row
+            if state == 'running' and attempts >= self.max_attempts:
+                # 最后一次尝试时进程崩溃了
+                self._fail(db, job_id, stage.name, "lease expired on the last attempt", now)
+                continue
+            if state == 'running':
+                logger.warning(f"Lease of job {job_id} {stage.name} expired, taking it over")
+            db.execute("UPDATE tasks SET state = 'running', attempts = attempts + 1, lease_until = ?, "
+                       "worker = ?, updated = ? WHERE job_id = ? AND stage = ?",
+                       (now + self.lease_seconds, worker_id, now, job_id, stage.name))
+            return Task(job_id, stage.name, attempts + 1, response)
+
+    def renew(self, task, worker_id, db=None):
+        """Extend the lease; False if another worker has taken the task over"""
+        cursor = (db or self._db).execute(
+            "UPDATE tasks SET lease_until = ? WHERE job_id = ? AND stage = ? AND worker = ? AND state = 'running'",
+            (time.time() + self.lease_seconds, task.job_id, task.stage, worker_id))
+        return cursor.rowcount == 1
+
+    def artifact_key(self, task):
+        """Input key of the output this task last recorded, or None"""
+        row = self._db.execute("SELECT artifact_key FROM tasks WHERE job_id = ? AND stage = ?",
+                               (task.job_id, task.stage)).fetchone()
+        return row[0] if row else None
+
+    def record_artifact(self, task, worker_id, key):
+        """Remember the input key of a stored output before the task is marked done"""
+        self._db.execute("UPDATE tasks SET artifact_key = ? WHERE job_id = ? AND stage = ? AND worker = ?",
+                         (key, task.job_id, task.stage, worker_id))
+
+    def complete(self, task, worker_id, key):
+        """Mark a task done; False if its lease was lost and another worker owns it now"""
+        cursor = self._db.execute("UPDATE tasks SET state = 'done', artifact_key = ?, lease_until = NULL, "
+                                  "error = NULL, updated = ? "
+                                  "WHERE job_id = ? AND stage = ? AND worker = ? AND state = 'running'",
+                                  (key, time.time(), task.job_id, task.stage, worker_id))
+        if cursor.rowcount != 1:
+            logger.warning(f"Job {task.job_id} {task.stage} finished after its lease was taken over")
+            return False
+        return True
+
+    def fail(self, task, worker_id, error):
+        """Schedule a retry with jittered exponential backoff, or give up after max_attempts"""
+        now = time.time()
+        with self._transaction() as db:
+            owner = db.execute("SELECT worker FROM tasks WHERE job_id = ? AND stage = ?",
+                               (task.job_id, task.stage)).fetchone()
+            if owner is None or owner[0] != worker_id:
+                return
+            if task.attempts >= self.max_attempts:
+                self._fail(db, task.job_id, task.stage, error, now)
+                return
+            delay = min(self.backoff_seconds * 2 ** (task.attempts - 1), self.backoff_max_seconds)
+            delay *= random.uniform(0.5, 1.0)
+            db.execute("UPDATE tasks SET state = 'pending', available_at = ?, lease_until = NULL, error = ?, "
+                       "updated = ? WHERE job_id = ? AND stage = ?",
+                       (now + delay, error, now, task.job_id, task.stage))
+        logger.warning(f"Job {task.job_id} {task.stage} failed (attempt {task.attempts}), retrying in {delay:.0f}s")
+
+    def _fail(self, db, job_id, stage, error, now):
+        db.execute("UPDATE tasks SET state = 'failed', lease_until = NULL, error = ?, updated = ? "
+                   "WHERE job_id = ? AND stage = ?", (error, now, job_id, stage))
+        logger.error(f"Job {job_id} {stage} failed for good: {error.splitlines()[0] if error else ''}")
+        for dependent in STAGES:
+            if stage in dependent.deps:
+                self._fail(db, job_id, dependent.name, f"{stage} failed", now)
+
+    def release_orphans(self):
+        """
+        Hand back tasks leased by workers on this host that no longer run, so a restart
+        after a crash does not wait for their leases to expire
+
+        :return: Number of tasks released
+        """
+        host = socket.gethostname()
+        orphans = []
+        for job_id, stage, worker in self._db.execute("SELECT job_id, stage, worker FROM tasks "
+                                                      "WHERE state = 'running'").fetchall():
+            worker_host, _, pid = (worker or "").rpartition(":")
+            if worker_host == host and pid.isdigit() and not _process_alive(int(pid)):
+                orphans.append((time.time(), job_id, stage, worker))
+        with self._transaction() as db:
+            db.executemany("UPDATE tasks SET state = 'pending', lease_until = NULL, updated = ? "
+                           "WHERE job_id = ? AND stage = ? AND worker = ? AND state = 'running'", orphans)
+        if orphans:
+            logger.warning(f"Released {len(orphans)} tasks of workers that exited without finishing them")
+        return len(orphans)
+
+    def retry_failed(self):
+        """Give every failed task a fresh set of attempts; returns the number reset"""
+        cursor = self._db.execute("UPDATE tasks SET state = 'pending', attempts = 0, available_at = 0, error = NULL, "
+                                  "updated = ? WHERE state = 'failed'", (time.time(),))
+        return cursor.rowcount
+
+    def unfinished(self):
+        """Number of tasks that are still pending or running"""
+        return self._db.execute("SELECT COUNT(*) FROM tasks WHERE state IN ('pending', 'running')").fetchone()[0]
+
+    def next_available(self):
+        """Earliest time a pending task becomes claimable, or None"""
+        return self._db.execute("SELECT MIN(available_at) FROM tasks WHERE state = 'pending'").fetchone()[0]
+
+    def status(self):
+        """
+        :return: {stage: {state: count}}
+        """
+        counts = {stage.name: {} for stage in STAGES}
+        for stage, state, n in self._db.execute("SELECT stage, state, COUNT(*) FROM tasks GROUP BY stage, state"):
+            counts.setdefault(stage, {})[state] = n
+        return counts
+
+    def outputs(self, store):
+        """(job id, title, path) of every finished poem, with the path from the artifact store's manifest"""
+        rows = self._db.execute("SELECT j.id, j.title, j.response_hash FROM tasks t JOIN jobs j ON j.id = t.job_id "
+                                "WHERE t.stage = 'mix' AND t.state = 'done' ORDER BY j.id").fetchall()
+        return [(job_id, title, store.get(poem, "mix")) for job_id, title, poem in rows]
+
+    def close(self):
+        self._db.close()
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class _Heartbeat:
+    """Renews the leases of claimed tasks from a background thread until each is finished"""
+
+    def __init__(self, queue, tasks, worker_id):
+        self.queue = queue
+        self.tasks = list(tasks)
+        self.worker_id = worker_id
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def finished(self, task):
+        """Stop renewing a task that has been completed or failed"""
+        with self._lock:
+            if task in self.tasks:
+                self.tasks.remove(task)
+
+    def _run(self):
+        db = self.queue.connect()
+        try:
+            while not self._stop.wait(self.queue.lease_seconds / 3):
+                with self._lock:
+                    for task in list(self.tasks):
+                        if not self.queue.renew(task, self.worker_id, db):
+                            logger.warning(f"Lost the lease of job {task.job_id} {task.stage}")
+                            self.tasks.remove(task)
+        finally:
+            db.close()
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+
+class Worker:
+    """Claims and runs tasks until the queue is drained"""
+
+    def __init__(self, queue):
+        self.queue = queue
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._speech = None
+
+    def speech(self):
+        if self._speech is None:
+            from music_object import get_speech_instance
+            self._speech = get_speech_instance()
+        return self._speech
+
+    def execute(self, task):
+        """Run one claimed task; the caller keeps its lease alive (see run)"""
+        from enjou_poem import create_music
+        stage = STAGE_BY_NAME[task.stage]
+        with span("job_queue.task", stage=task.stage, job=task.job_id, attempt=task.attempts) as task_span:
+            try:
+                music = create_music(task.response)
+                deps = self._dependency_artifacts(task, music)
+                key = stage.key(self, music, *(sha for _, sha in deps))
+                existing = music.store.get(music.poem_id, task.stage)
+                if existing is not None and self.queue.artifact_key(task) == key:
+                    task_span.set(reused=True)
+                    logger.info(f"Job {task.job_id} {task.stage}: reusing {existing}")
+                else:
+                    stage.run(self, music, *(path for path, _ in deps))
+                    self.queue.record_artifact(task, self.worker_id, key)
+                    logger.info(f"Job {task.job_id} {task.stage}: {music.store.get(music.poem_id, task.stage)}")
+                self.queue.complete(task, self.worker_id, key)
+            except Exception as e:
+                task_span.set(error=type(e).__name__)
+                self.queue.fail(task, self.worker_id, f"{type(e).__name__}: {e}\n{traceback.format_exc()}")
+
+    @staticmethod
+    def _dependency_artifacts(task, music):
+        """(path, sha256) of every dependency of the task's stage, from the artifact store, in order"""
+        artifacts = []
+        for dep in STAGE_BY_NAME[task.stage].deps:
+            path = music.store.get(music.poem_id, dep)
+            if path is None:
+                raise RuntimeError(f"Artifact of {dep} for job {task.job_id} is missing")
+            artifacts.append((path, music.store.sha256(music.poem_id, dep)))
+        return artifacts
+
+    def prefetch_speech(self, tasks):
+        """
+        Synthesize the speech of several claimed tasks in batched requests (see
+        SpeechAssistant.synthesize_batch); each task then finds its audio in the
+        TTS cache. Anything that fails here is left to the task itself.
+        """
+        from enjou_poem import create_music
+        texts = []
+        for task in tasks:
+            try:
+                # 已在 TTS 缓存中的文本由 synthesize_batch 跳过
+                texts.append(create_music(task.response).full_text)
+            except Exception as e:
+                logger.warning(f"Job {task.job_id}: not batching its speech: {e}")
+        if len(texts) < 2:
+            return
+        try:
+            self.speech().synthesize_batch(texts)
+        except Exception as e:
+            logger.warning(f"Batched speech synthesis failed, synthesizing one by one: {e}")
+
+    def run(self, producer_done=None):
+        """
+        :param producer_done: Event set once no more jobs will be queued; without it the
+                              worker stops as soon as nothing is left to do
+        """
+        processed = 0
+        while True:
+            task = self.queue.claim(self.worker_id)
+            if task is not None:
+                tasks = [task]
+                if task.stage == "speech" and TTS_BATCH_MAX_TEXTS > 1:
+                    # 短诗的开销主要在每次请求上，一次认领多首合成一个 SSML 请求
+                    tasks += self.queue.claim_more(self.worker_id, "speech", TTS_BATCH_MAX_TEXTS - 1)
+                # 一起认领的任务在排队等待时租约也不能过期，否则会被别的进程接手再合成一次
+                with _Heartbeat(self.queue, tasks, self.worker_id) as heartbeat:
+                    if len(tasks) > 1:
+                        self.prefetch_speech(tasks)
+                    for task in tasks:
+                        self.execute(task)
+                        heartbeat.finished(task)
+                processed += len(tasks)
+                continue
+            if (producer_done is None or producer_done.is_set()) and not self.queue.unfinished():
+                logger.info(f"Worker {self.worker_id} finished after {processed} tasks")
+                return processed
+            next_available = self.queue.next_available()
+            wait = POLL_SECONDS if next_available is None else next_available - time.time()
+            time.sleep(min(max(wait, 0.05), POLL_SECONDS))
+
+
+def _worker_main(db_path, producer_done, share, initializer, initargs):
+    import rate_limit
+    # 各工作进程平分云服务配额
+    rate_limit.set_share(share)
+    if initializer is not None:
+        initializer(*initargs)
+    queue = JobQueue(db_path)
+    try:
+        return Worker(queue).run(producer_done)
+    finally:
+        queue.close()
+
+
+def start_workers(count, db_path=JOB_DB_PATH, producer_done=None, initializer=None, initargs=()):
+    """
+    Start worker processes
+
+    :param producer_done: multiprocessing Event from the same context (see run), or None
+    :param initializer: Called with initargs in every worker before it starts, like ProcessPoolExecutor's
+    :return: List of started processes
+    """
+    queue = JobQueue(db_path)
+    try:
+        queue.release_orphans()
+    finally:
+        queue.close()
+    ctx = get_context('spawn')
+    processes = [ctx.Process(target=_worker_main, args=(db_path, producer_done, 1 / count, initializer, initargs),
+                             name=f"job-worker-{i}") for i in range(count)]
+    for process in processes:
+        process.start()
+    return processes
+
+
+def run(texts, workers, db_path=JOB_DB_PATH, initializer=None, initargs=()):
+    """
+    Queue LLM responses as they arrive while `workers` processes render them
+
+    :param texts: Iterable of LLM responses
+    :return: Number of newly queued jobs
+    """
+    producer_done = get_context('spawn').Event()
+    processes = start_workers(workers, db_path, producer_done, initializer, initargs)
+    queue = JobQueue(db_path)
+    queued = 0
+    try:
+        for response in texts:
+            if response is not None and queue.enqueue(response) is not None:
+                queued += 1
+    finally:
+        producer_done.set()
+        for process in processes:
+            process.join()
+        queue.close()
+    return queued
+
+
+def work(workers, db_path=JOB_DB_PATH, initializer=None, initargs=()):
+    """Render everything that is queued with `workers` processes, then return"""
+    for process in start_workers(workers, db_path, None, initializer, initargs):
+        process.join()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Durable, resumable poem production queue")
+    parser.add_argument("--db", default=JOB_DB_PATH, help="queue database (default: %(default)s)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="generate poems with the LLM and render them")
+    run_parser.add_argument("-n", "--count", type=int, required=True, help="number of poems to generate")
+    run_parser.add_argument("-b", "--batch-size", type=int, default=1, help="poems requested per LLM call")
+    run_parser.add_argument("-j", "--workers", type=int, default=2, help="number of worker processes")
+    work_parser = commands.add_parser("work", help="render the queued poems")
+    work_parser.add_argument("-j", "--workers", type=int, default=2, help="number of worker processes")
+    commands.add_parser("status", help="show task counts and finished poems")
+    commands.add_parser("retry", help="reset failed tasks")
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        import itertools
+        from azure_openai_wrapper import create_text_with_openai, create_texts_in_batches
+        from enjou_poem import PROMPT
+        texts = create_texts_in_batches(PROMPT, args.batch_size) if args.batch_size > 1 else \
+            create_text_with_openai(PROMPT)
+        queued = run(itertools.islice(texts, args.count), args.workers, args.db)
+        logger.info(f"Queued {queued} new poems")
+    elif args.command == "work":
+        work(args.workers, args.db)
+
+    queue = JobQueue(args.db)
+    try:
+        if args.command == "retry":
+            logger.info(f"Reset {queue.retry_failed()} failed tasks")
+        for stage, states in queue.status().items():
+            print(f"{stage:<8} " + "  ".join(f"{state}={n}" for state, n in sorted(states.items())))
+        if args.command == "status":
+            from artifact_store import get_artifact_store
+            for job_id, title, path in queue.outputs(get_artifact_store()):
+                print(f"{job_id:>6}  {title}  {path}")
+        failed = sum(states.get('failed', 0) for states in queue.status().values())
+    finally:
+        queue.close()
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
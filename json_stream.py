@@ -0,0 +1,63 @@
+class JsonArrayStream:
+    """
+    Incremental splitter for a streamed JSON array of objects.
+
+    Text is fed piece by piece as it arrives; every top-level object is
+    returned as soon as its closing brace is seen, without re-scanning what has
+    already been read. Anything before the opening bracket (such as a Markdown
+    code fence) is ignored.
+    """
+
+    def __init__(self):
+        self._buffer = []
+        self._in_array = False
+        self._done = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    @property
+    def done(self):
+        """Whether the closing bracket of the array has been seen"""
+        return self._done
+
+    def feed(self, text: str):
+        """
+        Consume the next piece of text
+
+        :param text: Next piece of the streamed response
+        :return: List of JSON texts of the objects completed by this piece
+        """
+        objects = []
+        for ch in text:
+            if self._done:
+                break
+            if not self._in_array:
+                self._in_array = ch == '['
+                continue
+            if self._depth == 0:
+                if ch == '{':
+                    self._depth = 1
+                    self._buffer = ['{']
+                elif ch == ']':
+                    self._done = True
+                continue
+
+            self._buffer.append(ch)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in '{[':
+                self._depth += 1
+            elif ch in '}]':
+                self._depth -= 1
+                if self._depth == 0:
+                    objects.append(''.join(self._buffer))
+                    self._buffer = []
+        return objects
@@ -0,0 +1,159 @@
+import numpy as np
+
+# 包络分辨率；积分响度按 100ms 步长、400ms 块计算（R128 的门限方式，但不做 K 计权）
+FRAME_MS = 10
+GATE_STEP_MS = 100
+GATE_BLOCK_MS = 400
+ABSOLUTE_GATE = -70.0
+RELATIVE_GATE = -10.0
+
+# 默认响度目标：人声 -16 LUFS，BGM 比人声低 12 LU
+SPEECH_TARGET_LUFS = -16.0
+BGM_BELOW_SPEECH_LU = 12.0
+
+# 闪避：人声出现时 BGM 降低的 dB、判定人声的门限（相对人声响度）、保持和平滑时间
+DUCK_THRESHOLD_LU = -20.0
+DUCK_HOLD_MS = 250
+DUCK_SMOOTH_MS = 150
+
+
+class FramePower:
+    """
+    Mean square per frame, summed over channels, fed block by block
+
+    Samples that do not fill a frame are carried over to the next block, so
+    the result does not depend on how the input is split.
+    """
+
+    def __init__(self, frame_length, full_scale=1.0):
+        """
+        :param frame_length: Samples per frame
+        :param full_scale: Value of a full-scale sample (32768 for int16 input)
+        """
+        self.frame_length = frame_length
+        self.full_scale = full_scale
+        self._carry = None
+        self._powers = []
+
+    def feed(self, block):
+        """:param block: Array of shape (frames, channels)"""
+        block = np.asarray(block, dtype=np.float32)
+        if self.full_scale != 1.0:
+            block = block / np.float32(self.full_scale)
+        if self._carry is not None and len(self._carry):
+            block = np.concatenate((self._carry, block))
+        usable = len(block) - len(block) % self.frame_length
+        frames = block[:usable].reshape(-1, self.frame_length * block.shape[1])
+        self._powers.append(np.einsum('ij,ij->i', frames, frames) / self.frame_length)
+        self._carry = block[usable:]
+
+    def result(self):
+        """:return: float32 array with one mean square per complete frame"""
+        if not self._powers:
+            return np.empty(0, dtype=np.float32)
+        return np.concatenate(self._powers).astype(np.float32)
+
+
+def frame_power(samples, sample_rate, full_scale=1.0, frame_ms=FRAME_MS, block_frames=1 << 20):
+    """Mean square per FRAME_MS frame of a whole array, converted in bounded blocks"""
+    if samples.ndim == 1:
+        samples = samples[:, None]
+    power = FramePower(max(int(sample_rate * frame_ms / 1000), 1), full_scale)
+    for start in range(0, len(samples), block_frames):
+        power.feed(samples[start:start + block_frames])
+    return power.result()
+
+
+def power_to_lufs(power):
+    return -0.691 + 10 * np.log10(np.maximum(power, 1e-12))
+
+
+def _moving_average(values, width):
+    """Centered moving average over `width` values, edges padded with the edge values"""
+    if width <= 1 or not len(values):
+        return values.astype(np.float64)
+    padded = np.pad(values.astype(np.float64), (width // 2, width - 1 - width // 2), mode='edge')
+    cumulative = np.concatenate(([0.0], np.cumsum(padded)))
+    return (cumulative[width:] - cumulative[:-width]) / width
+
+
+def integrated_loudness(power, frame_ms=FRAME_MS):
+    """
+    Gated integrated loudness from per-frame mean squares
+
+    Overlapping 400 ms blocks in 100 ms steps are gated at -70 LUFS and then
+    10 LU below the mean of the remaining blocks, as in EBU R128. There is no
+    K-weighting filter, so the value is an unweighted approximation.
+
+    :return: Loudness in LUFS, -inf for silence
+    """
+    step = max(GATE_STEP_MS // frame_ms, 1)
+    count = len(power) // step
+    if not count:
+        if not len(power):
+            return float('-inf')
+        blocks = np.array([power.mean()])
+    else:
+        steps = power[:count * step].reshape(count, step).mean(axis=1, dtype=np.float64)
+        window = GATE_BLOCK_MS // GATE_STEP_MS
+        if count < window:
+            blocks = np.array([steps.mean()])
+        else:
+            cumulative = np.concatenate(([0.0], np.cumsum(steps)))
+            blocks = (cumulative[window:] - cumulative[:-window]) / window
+    levels = power_to_lufs(blocks)
+    gated = blocks[levels > ABSOLUTE_GATE]
+    if not len(gated):
+        return float('-inf')
+    relative = power_to_lufs(gated.mean()) + RELATIVE_GATE
+    gated = blocks[levels > max(ABSOLUTE_GATE, relative)]
+    return float(power_to_lufs(gated.mean()))
+
+
+def gain_to_target(loudness, target):
+    """dB needed to bring `loudness` to `target`, 0 for silence"""
+    if not np.isfinite(loudness):
+        return 0.0
+    return float(target - loudness)
+
+
+def ducking_envelope(power, loudness, depth_db, frame_ms=FRAME_MS, threshold_lu=DUCK_THRESHOLD_LU,
+                     hold_ms=DUCK_HOLD_MS, smooth_ms=DUCK_SMOOTH_MS):
+    """
+    Linear BGM gain per frame from the voice envelope
+
+    Frames louder than `loudness + threshold_lu` count as voice. The voice mask
+    is widened by `hold_ms` on both sides so the bed does not pump between
+    words, and the dB curve is smoothed with a centered moving average, which
+    also lets the duck start slightly before the voice.
+
+    :param power: Per-frame mean squares of the voice
+    :param loudness: Integrated loudness of the voice
+    :param depth_db: Gain while the voice is present, e.g. -8
+    :return: float32 array of linear gains, one per frame
+    """
+    active = (power_to_lufs(power) > loudness + threshold_lu).astype(np.float64)
+    hold = int(hold_ms / frame_ms)
+    active = _moving_average(active, 2 * hold + 1) > 0
+    curve = _moving_average(np.where(active, depth_db, 0.0), 2 * int(smooth_ms / frame_ms) + 1)
+    return (10 ** (curve / 20)).astype(np.float32)
+
+
+class Ducker:
+    """Per-sample BGM gains interpolated from a frame-rate ducking envelope"""
+
+    def __init__(self, frame_gains, frame_length):
+        """
+        :param frame_gains: Output of ducking_envelope
+        :param frame_length: Length of one envelope frame in samples of the mix
+        """
+        self.frame_gains = frame_gains
+        self.frame_length = frame_length
+        self._index = np.arange(len(frame_gains), dtype=np.float64)
+
+    def gains(self, start, stop):
+        """Gains for speech samples [start, stop); before and after the speech the edge values hold"""
+        if not len(self.frame_gains):
+            return np.ones(stop - start, dtype=np.float32)
+        position = (np.arange(start, stop, dtype=np.float64) + 0.5) / self.frame_length - 0.5
+        return np.interp(position, self._index, self.frame_gains).astype(np.float32)
@@ -0,0 +1,138 @@
+import re
+from array import array
+from bisect import bisect_right
+
+# [mm:ss], [mm:ss.xx], [mm:ss.xxx] 以及少见的 [mm:ss:xx]
+TIME_TAG = re.compile(r'\[(\d+):(\d{1,2})(?:[.:](\d{1,3}))?\]')
+# [ti:标题]、[ar:作者]、[offset:+500] 等元数据标签
+META_TAG = re.compile(r'^\[([A-Za-z#]+):(.*)\]\s*$')
+
+
+def format_timestamp(ms: int) -> str:
+    """Format milliseconds as an LRC [mm:ss.xx] tag"""
+    centiseconds = (int(ms) + 5) // 10
+    minutes, rest = divmod(centiseconds, 6000)
+    return f"[{minutes:02d}:{rest // 100:02d}.{rest % 100:02d}]"
+
+
+class Lyrics:
+    """
+    Timed lyrics stored as parallel arrays.
+
+    `times` holds the start of every line in milliseconds, sorted, and
+    `offsets` holds where each line starts in one shared text buffer, so a
+    thousand-line file costs two small arrays and one string. line_at() is a
+    binary search over `times`.
+    """
+
+    __slots__ = ('times', 'offsets', '_text', 'metadata')
+
+    def __init__(self, entries=(), metadata=None):
+        """
+        :param entries: Iterable of (milliseconds, text); sorted by time, stable for equal times
+        :param metadata: Dict of LRC metadata tags such as {'ti': ..., 'ar': ...}
+        """
+        entries = sorted(entries, key=lambda entry: entry[0])
+        self.times = array('q', (int(ms) for ms, _ in entries))
+        self.offsets = array('q', [0])
+        parts = []
+        for _, text in entries:
+            parts.append(text)
+            self.offsets.append(self.offsets[-1] + len(text))
+        self._text = ''.join(parts)
+        self.metadata = dict(metadata or {})
+
+    @classmethod
+    def parse(cls, lrc_content: str) -> 'Lyrics':
+        """
+        Parse LRC text
+
+        Metadata tags are collected, lines with several timestamps produce one
+        entry per timestamp, an [offset:] tag is applied, and lines without a
+        timestamp are ignored.
+        """
+        entries = []
+        metadata = {}
+        for raw_line in lrc_content.splitlines():
+            line = raw_line.strip()
+            if not line:
+                continue
+            stamps = []
+            pos = 0
+            while True:
+                match = TIME_TAG.match(line, pos)
+                if match is None:
+                    break
+                minutes, seconds, fraction = match.groups()
+                ms = (int(minutes) * 60 + int(seconds)) * 1000
+                if fraction:
+                    ms += int(fraction.ljust(3, '0'))
+                stamps.append(ms)
+                pos = match.end()
+            if stamps:
+                text = line[pos:].strip()
+                entries.extend((ms, text) for ms in stamps)
+                continue
+            meta = META_TAG.match(line)
+            if meta:
+                metadata[meta.group(1).lower()] = meta.group(2).strip()
+
+        offset = metadata.get('offset')
+        if offset:
+            try:
+                # 正的 offset 表示歌词提前显示
+                shift = int(offset)
+                entries = [(max(ms - shift, 0), text) for ms, text in entries]
+            except ValueError:
+                pass
+        return cls(entries, metadata)
+
+    @classmethod
+    def from_file(cls, lrc_file: str) -> 'Lyrics':
+        with open(lrc_file, 'r', encoding='utf-8') as f:
+            return cls.parse(f.read())
+
+    @classmethod
+    def from_sylt(cls, sylt_data, metadata=None) -> 'Lyrics':
+        """Build from SYLT (text, milliseconds) pairs"""
+        return cls(((ms, text) for text, ms in sylt_data), metadata)
+
+    def __len__(self):
+        return len(self.times)
+
+    def text(self, index: int) -> str:
+        return self._text[self.offsets[index]:self.offsets[index + 1]]
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return self.times[index], self.text(index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self.times[index], self.text(index)
+
+    def line_at(self, ms: int) -> int:
+        """Index of the line showing at `ms`, -1 before the first line"""
+        return bisect_right(self.times, ms) - 1
+
+    def text_at(self, ms: int):
+        """Text of the line showing at `ms`, None before the first line"""
+        index = self.line_at(ms)
+        return self.text(index) if index >= 0 else None
+
+    def to_sylt(self):
+        """SYLT (text, milliseconds) pairs for mutagen"""
+        return [(text, ms) for ms, text in self]
+
+    def to_lrc(self) -> str:
+        """LRC text, metadata tags first (the offset is already applied)"""
+        lines = [f"[{key}:{value}]" for key, value in self.metadata.items() if key != 'offset']
+        lines.extend(f"{format_timestamp(ms)}{text}" for ms, text in self)
+        return "".join(f"{line}\n" for line in lines)
+
+    def write(self, lrc_file: str):
+        with open(lrc_file, 'w', encoding='utf-8') as f:
+            f.write(self.to_lrc())
@@ -0,0 +1,228 @@
+import json
+import os
+import re
+
+import numpy as np
+
+from audio_mixer import SpeechPcm, load_pcm, map_wav, probe_audio
+from utils import get_logger
+
+logger = get_logger("lyric_align")
+
+# 能量检测的帧长，以及一次转换为 float32 的帧数（约 1 分钟的 16kHz 音频）
+FRAME_MS = 10
+BLOCK_FRAMES = 6000
+# 比最响的帧低多少 dB 视为静音
+SILENCE_THRESH_DB = -35
+MIN_SILENCE_MS = 200
+# 匹配停顿时，位置偏差（以平均行长为单位）相对停顿长度的权重
+POSITION_WEIGHT = 0.5
+WORDS_SUFFIX = ".words.json"
+
+
+def words_path(audio_path):
+    """Path of the word-boundary sidecar that belongs to an audio file"""
+    return os.path.splitext(audio_path)[0] + WORDS_SUFFIX
+
+
+def dump_word_boundaries(text, words) -> bytes:
+    """
+    Serialize word boundaries captured during synthesis
+
+    :param text: The exact text that was synthesized
+    :param words: List of (audio offset in ms, text offset)
+    """
+    return json.dumps({'text': text, 'words': [[int(ms), int(offset)] for ms, offset in words]},
+                      ensure_ascii=False).encode('utf-8')
+
+
+def load_word_boundaries(audio_path):
+    """
+    :return: (text, words) from the sidecar next to audio_path, or None
+    """
+    path = words_path(audio_path)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return data['text'], [(ms, offset) for ms, offset in data['words']]
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"Ignoring unreadable word boundaries {path}: {e}")
+        return None
+
+
+def read_speech(file_path):
+    """
+    :param file_path: Speech file path or SpeechPcm
+    :return: (samples of shape (frames, channels), sample rate, full scale)
+    """
+    if isinstance(file_path, SpeechPcm):
+        return file_path.samples, file_path.sample_rate, 32768.0
+    wav = map_wav(file_path) if file_path.lower().endswith('.wav') else None
+    if wav is not None:
+        samples, sample_rate = wav
+        return samples, sample_rate, 32768.0
+    rate, _ = probe_audio(file_path)
+    return load_pcm(file_path, rate, 1), rate, 1.0
+
+
+def frame_energy_db(samples, sample_rate, full_scale=1.0, frame_ms=FRAME_MS):
+    """
+    RMS level of every frame in dBFS
+
+    Frames are reshaped views of the sample array and are converted to float in
+    blocks, so memory stays bounded on hour-long files.
+
+    :param samples: Array of shape (frames,) or (frames, channels)
+    :return: float32 array with one level per frame
+    """
+    if samples.ndim == 1:
+        samples = samples[:, None]
+    frame = max(int(sample_rate * frame_ms / 1000), 1)
+    count = len(samples) // frame
+    frames = samples[:count * frame].reshape(count, frame * samples.shape[1])
+    power = np.empty(count, dtype=np.float32)
+    for start in range(0, count, BLOCK_FRAMES):
+        block = frames[start:start + BLOCK_FRAMES].astype(np.float32) / full_scale
+        power[start:start + len(block)] = np.einsum('ij,ij->i', block, block) / block.shape[1]
+    return 10 * np.log10(np.maximum(power, 1e-12))
+
+
+def detect_pauses(samples, sample_rate, full_scale=1.0, min_silence_ms=MIN_SILENCE_MS,
+                  silence_thresh_db=SILENCE_THRESH_DB, frame_ms=FRAME_MS):
+    """
+    Find the silent stretches of a speech recording
+
+    :param silence_thresh_db: Threshold relative to the loudest frame
+    :return: (pauses, duration_ms) where pauses is an int64 array of [start_ms, end_ms] rows
+    """
+    levels = frame_energy_db(samples, sample_rate, full_scale, frame_ms)
+    duration_ms = len(samples) * 1000 // sample_rate
+    if not len(levels):
+        return np.empty((0, 2), dtype=np.int64), duration_ms
+    silent = levels < levels.max() + silence_thresh_db
+    edges = np.diff(np.concatenate(([0], silent.view(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    keep = (ends - starts) * frame_ms >= min_silence_ms
+    pauses = np.stack((starts[keep], ends[keep]), axis=1).astype(np.int64) * frame_ms
+    np.minimum(pauses, duration_ms, out=pauses)
+    return pauses, duration_ms
+
+
+def _line_weights(lines):
+    # 只按文字计长度，标点和空白不计
+    return np.array([max(len(re.sub(r'[\W_]', '', line)), 1) for line in lines], dtype=np.float64)
+
+
+def align_to_pauses(lines, pauses, duration_ms):
+    """
+    Start time of every line, placing line breaks on detected pauses
+
+    Each break is expected where the text before it would end if speech were
+    spread evenly over the voiced span. A dynamic program picks one pause per
+    break, in order, preferring long pauses close to the expected position.
+    Without enough pauses the expected positions are used as they are.
+
+    :return: List of start times in ms, relative to the start of the speech
+    """
+    if not lines:
+        return []
+    voice_on, voice_off = 0, duration_ms
+    if len(pauses) and pauses[0, 0] == 0:
+        voice_on = int(pauses[0, 1])
+        pauses = pauses[1:]
+    if len(pauses) and pauses[-1, 1] >= duration_ms:
+        voice_off = int(pauses[-1, 0])
+        pauses = pauses[:-1]
+    span = max(voice_off - voice_on, 1)
+    cumulative = np.cumsum(_line_weights(lines))
+    expected = voice_on + span * cumulative[:-1] / cumulative[-1]
+
+    breaks = len(lines) - 1
+    if breaks == 0:
+        return [voice_on]
+    if len(pauses) < breaks:
+        logger.info(f"Only {len(pauses)} pauses for {breaks} line breaks, using proportional timing")
+        return [voice_on] + [int(t) for t in expected]
+
+    middle = pauses.mean(axis=1)
+    length = (pauses[:, 1] - pauses[:, 0]) / (pauses[:, 1] - pauses[:, 0]).max()
+    deviation = np.abs(middle[None, :] - expected[:, None]) / (span / len(lines))
+    score = length[None, :] - POSITION_WEIGHT * deviation
+
+    # best[j]: 当前断点落在停顿 j 时的最高总分；back[i, j]: 上一断点所在的停顿
+    count = len(pauses)
+    indices = np.arange(count)
+    back = np.zeros((breaks, count), dtype=np.int64)
+    best = score[0].copy()
+    best[count - breaks + 1:] = -np.inf
+    for i in range(1, breaks):
+        prefix = np.maximum.accumulate(best)
+        arg = np.maximum.accumulate(np.where(best == prefix, indices, 0))
+        previous = np.concatenate(([-np.inf], prefix[:-1]))
+        back[i, 1:] = arg[:-1]
+        best = score[i] + previous
+        best[:i] = -np.inf
+        best[count - breaks + i + 1:] = -np.inf
+
+    chosen = [int(np.argmax(best))]
+    for i in range(breaks - 1, 0, -1):
+        chosen.append(int(back[i, chosen[-1]]))
+    chosen.reverse()
+    return [voice_on] + [int(pauses[j, 1]) for j in chosen]
+
+
+def align_to_words(lines, text, words):
+    """
+    Start time of every line from synthesis word boundaries
+
+    :param text: The text that was synthesized
+    :param words: List of (audio offset in ms, text offset)
+    :return: List of start times in ms, or None if a line cannot be found in text
+    """
+    if not words:
+        return None
+    words = sorted(words, key=lambda word: word[1])
+    offsets = np.array([offset for _, offset in words], dtype=np.int64)
+    times = [ms for ms, _ in words]
+    starts = []
+    cursor = 0
+    for line in lines:
+        position = text.find(line.strip(), cursor)
+        if position < 0:
+            return None
+        index = int(np.searchsorted(offsets, position))
+        if index == len(offsets):
+            return None
+        starts.append(int(times[index]))
+        cursor = position + len(line.strip())
+    return starts
+
+
+def align_lyrics(speech_audio, lines):
+    """
+    Start time of every lyric line within a speech recording
+
+    Word boundaries saved next to the audio during synthesis are used when they
+    cover every line; otherwise the lines are matched to pauses in the audio.
+
+    :param speech_audio: Path to the synthesized speech (before mixing), or a SpeechPcm carrying
+                         its word boundaries
+    :param lines: Non-empty lyric lines in reading order
+    :return: List of start times in ms, relative to the start of the speech
+    """
+    if isinstance(speech_audio, SpeechPcm):
+        boundaries = speech_audio.words
+    else:
+        boundaries = load_word_boundaries(speech_audio)
+    if boundaries is not None:
+        starts = align_to_words(lines, *boundaries)
+        if starts is not None:
+            logger.info(f"Aligned {len(lines)} lines from word boundaries")
+            return starts
+    samples, sample_rate, full_scale = read_speech(speech_audio)
+    pauses, duration_ms = detect_pauses(samples, sample_rate, full_scale)
+    logger.info(f"Aligning {len(lines)} lines to {len(pauses)} pauses")
+    return align_to_pauses(lines, pauses, duration_ms)
@@ -1,10 +1,15 @@
 import json
 import os
+from concurrent.futures import ThreadPoolExecutor
 from types import SimpleNamespace
-from add_bgm import add_background_music
+from add_bgm import add_background_music, finish_mix
 from azure_dalle3 import generate_img_with_dalle3
-from config import SPEECH_CACHE_DIR, BGM_DIR, DATA_DIR
+from artifact_store import ArtifactStore, get_artifact_store, poem_id
+from audio_mixer import SpeechPcm
+from config import BGM_DIR, SAVE_SPEECH_WAV
+from cover_store import get_cover_store
 from speech_assistant import get_speech_instance
+from tracing import traced
 from utils import get_logger
 
 logger = get_logger("music_object")
@@ -24,16 +29,22 @@ def p():
 
 
 class MusicMeta:
-    def __init__(self, response: str, cache_dir: str):
+    def __init__(self, response: str, store: ArtifactStore = None):
+        """
+        :param response: JSON reply of the LLM with title, content and photo_desc
+        :param store: Where the poem's files go (default: the shared artifact store)
+        """
         self.response = response
-        self.cache_dir = cache_dir
+        self.store = store or get_artifact_store()
+        self.poem_id = poem_id(response)
         self.parse_response(response)
-        response_file = os.path.join(self.cache_dir, self.title + ".json")
-        with open(response_file, "w", encoding="utf-8") as f:
-            f.write(response)
+        self.store.add_poem(self.poem_id, self.title)
+        self.store.put_bytes(self.poem_id, "response", response.encode("utf-8"), ".json")
+        self.save_content_to_text_file()
         self.bg_music_edition_path = None
         self.wav_path = None
 
+    @traced()
     def parse_response(self, content: str):
         print(content)
         obj = json.loads(content, object_hook=lambda d: SimpleNamespace(**d))
@@ -41,36 +52,80 @@ class MusicMeta:
         self.content = obj.content
         self.photo_desc = obj.photo_desc
         self.full_text = f"{self.title}\n{self.content}"
-        with open(os.path.join(self.cache_dir, self.title + ".txt"), "w", encoding="utf-8") as f:
-            f.write(self.full_text)
 
     def save_content_to_text_file(self):
-        self.text_path = os.path.join(self.cache_dir, self.title + ".txt")
-        with open(self.text_path, "a", encoding="utf-8") as f:
-            f.write(self.full_text)
+        # 内容相同时不会重写，多次调用也只有一份文本
+        self.text_path = self.store.put_bytes(self.poem_id, "text", self.full_text.encode("utf-8"), ".txt")
+        return self.text_path
 
-    def generate_audio(self) -> str:
+    @traced()
+    def generate_audio(self) -> SpeechPcm:
+        """合成语音并以内存中的 PCM 返回，交给 attach_bgm 时不再读写 WAV"""
         sound_manager = get_speech_instance()
-        wav_path = os.path.join(SPEECH_CACHE_DIR, self.title + "_ori.wav")
-        sound_manager.get_or_create_audio(self.full_text, save_path=wav_path)
-        return wav_path
+        speech = sound_manager.get_or_create_pcm(self.full_text)
+        if SAVE_SPEECH_WAV and speech.path:
+            self.wav_path = self.store.put_file(self.poem_id, "speech", speech.path, link=True)
+        return speech
 
-    def attach_bgm(self, original_wav_path: str) -> str:
+    @traced()
+    def generate_cover(self) -> str:
+        # 封面按 prompt 缓存，不同标题的相同 prompt 不会重复生成
+        cover = get_cover_store().get_or_generate(self.photo_desc, generate_img_with_dalle3)
+        self.store.put_file(self.poem_id, "cover", cover, link=True)
+        return cover
+
+    @traced()
+    def attach_bgm(self, speech, cover_png: str = None) -> str:
+        """
+        :param speech: generate_audio 返回的 SpeechPcm，或语音 WAV 的路径
+        """
         bg_music = os.path.join(BGM_DIR, "default.mp3")
-        cover_png = os.path.join(DATA_DIR, f"{self.title}.png")
-        if not os.path.exists(cover_png):
-            generate_img_with_dalle3(self.photo_desc, cover_png)
-        output_path = add_background_music(original_wav_path,
-                                           bg_music,
-                                           bg_volume=0.3,
-                                           cover_img=cover_png,
-                                           lyrics_file=self.text_path,
-                                           artist="azure"
-                                           )
+        if cover_png is None:
+            cover_png = self.generate_cover()
+        with self.store.staging(self.poem_id) as staging:
+            output_audio = add_background_music(speech,
+                                                bg_music,
+                                                output_audio=os.path.join(staging, "mix.mp3"),
+                                                bg_volume=0.3,
+                                                cover_img=cover_png,
+                                                lyrics_file=self.text_path,
+                                                artist="azure"
+                                                )
+            output_path = self._store_mix(output_audio)
         logger.info(f"背景音乐已添加，输出文件路径: {output_path}")
         self.bg_music_edition_path = output_path
         return output_path
 
+    @traced()
+    def play_streaming(self, cover_png: str = None) -> str:
+        """
+        边合成边播放（带背景音乐），同时在后台写出 MP3
+
+        播放结束后与 attach_bgm 一样写出 LRC 并写入封面、歌词等标签；封面在播放期间生成。
+        """
+        sound_manager = get_speech_instance()
+        bg_music = os.path.join(BGM_DIR, "default.mp3")
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="cover") as executor:
+            cover = executor.submit(self.generate_cover) if cover_png is None else None
+            with self.store.staging(self.poem_id) as staging:
+                output_audio = os.path.join(staging, "mix.mp3")
+                sound_manager.stream_with_bgm(self.full_text, bg_music, output_audio=output_audio, bg_volume=0.3)
+                if cover is not None:
+                    cover_png = cover.result()
+                # 流式播放结束后语音已在 TTS 缓存中，这里只是映射缓存的 WAV
+                finish_mix(output_audio, sound_manager.get_or_create_pcm(self.full_text),
+                           lyrics_file=self.text_path, cover_img=cover_png, artist="azure")
+                output_path = self._store_mix(output_audio)
+        self.bg_music_edition_path = output_path
+        return output_path
+
+    def _store_mix(self, output_audio):
+        """Move a rendered MP3, and its LRC if one was written, from staging into the store"""
+        lrc = os.path.splitext(output_audio)[0] + ".lrc"
+        if os.path.exists(lrc):
+            self.store.put_file(self.poem_id, "lrc", lrc, name="mix.lrc")
+        return self.store.put_file(self.poem_id, "mix", output_audio)
+
 
 if __name__ == '__main__':
     p()
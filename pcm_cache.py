@@ -0,0 +1,146 @@
+import hashlib
+import os
+import time
+
+import numpy as np
+
+from audio_mixer import load_pcm, probe_audio
+from config import PCM_CACHE_DIR, PCM_CACHE_MAX_BYTES
+from tracing import count
+from utils import get_logger
+
+logger = get_logger("pcm_cache")
+
+# 其他进程正在解码同一个 BGM 时，等待它完成的最长时间（秒）
+LOCK_TIMEOUT = 120
+
+
+class PcmCache:
+    """
+    Cache of decoded, gain-adjusted PCM stored as raw float32 files.
+
+    Entries are keyed by the source file's content hash, the sample rate, the
+    channel count and the gain, and are returned as read-only memory maps so
+    that repeat jobs (and worker processes) share the same pages. The least
+    recently used entries are removed once the directory grows past
+    `max_bytes`.
+    """
+
+    def __init__(self, cache_dir=PCM_CACHE_DIR, max_bytes=PCM_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._digests = {}
+        self._probes = {}
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _signature(self, file_path):
+        st = os.stat(file_path)
+        return os.path.abspath(file_path), st.st_size, st.st_mtime_ns
+
+    def file_digest(self, file_path):
+        """Content hash of a file, remembered for as long as its size and mtime do not change"""
+        signature = self._signature(file_path)
+        digest = self._digests.get(signature)
+        if digest is None:
+            h = hashlib.sha256()
+            with open(file_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    h.update(chunk)
+            digest = self._digests[signature] = h.hexdigest()
+        return digest
+
+    def probe(self, file_path):
+        """probe_audio, remembered per file version"""
+        signature = self._signature(file_path)
+        info = self._probes.get(signature)
+        if info is None:
+            info = self._probes[signature] = probe_audio(file_path)
+        return info
+
+    def _entry_path(self, file_path, sample_rate, channels, gain_db):
+        # v2: 单声道音频以原电平复制到各声道，之前的条目经过 ffmpeg -ac 降低了 3 dB
+        key = f"v2_{self.file_digest(file_path)}_{sample_rate}_{channels}_{gain_db:+.3f}"
+        return os.path.join(self.cache_dir, key + ".f32")
+
+    def _open(self, entry_path, channels):
+        frames = os.path.getsize(entry_path) // (4 * channels)
+        os.utime(entry_path)  # mark as recently used
+        return np.memmap(entry_path, dtype='<f4', mode='r', shape=(frames, channels))
+
+    def load(self, file_path, sample_rate, channels, gain_db=0.0):
+        """
+        Return the decoded PCM of `file_path`, decoding it only on a cache miss
+
+        :param file_path: Path to the audio file
+        :param sample_rate: Target sample rate
+        :param channels: Target channel count
+        :param gain_db: Gain in dB baked into the cached samples
+        :return: Read-only float32 array of shape (frames, channels)
+        """
+        entry_path = self._entry_path(file_path, sample_rate, channels, gain_db)
+        lock_path = entry_path + ".lock"
+        deadline = time.time() + LOCK_TIMEOUT
+        while True:
+            if os.path.exists(entry_path):
+                logger.info(f"PCM cache hit: {os.path.basename(file_path)} -> {entry_path}")
+                count("pcm_cache.hit")
+                return self._open(entry_path, channels)
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                if time.time() > deadline:
+                    # 持锁进程可能已经崩溃，清理掉再试
+                    logger.warning(f"Removing stale PCM cache lock: {lock_path}")
+                    try:
+                        os.remove(lock_path)
+                    except FileNotFoundError:
+                        pass
+                    deadline = time.time() + LOCK_TIMEOUT
+                time.sleep(0.05)
+
+        try:
+            os.close(fd)
+            logger.info(f"PCM cache miss: decoding {file_path}")
+            count("pcm_cache.miss")
+            pcm = load_pcm(file_path, sample_rate, channels, gain_db, self.probe(file_path)[1])
+            if not len(pcm):
+                raise ValueError(f"No audio decoded from {file_path}")
+            tmp_path = f"{entry_path}.{os.getpid()}.tmp"
+            pcm.tofile(tmp_path)
+            os.replace(tmp_path, entry_path)
+        finally:
+            os.remove(lock_path)
+        self.evict(keep=entry_path)
+        return self._open(entry_path, channels)
+
+    def evict(self, keep=None):
+        """Remove least recently used entries until the cache fits in max_bytes"""
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".f32") and entry.path != keep:
+                st = entry.stat()
+                entries.append((st.st_mtime, st.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        if keep is not None and os.path.exists(keep):
+            total += os.path.getsize(keep)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                # 已映射该文件的进程不受影响，页面在它们解除映射后才释放
+                os.remove(path)
+                total -= size
+                logger.info(f"Evicted PCM cache entry: {path}")
+            except FileNotFoundError:
+                pass
+
+
+_bgm_cache = None
+
+
+def get_bgm_cache() -> PcmCache:
+    global _bgm_cache
+    if _bgm_cache is None:
+        _bgm_cache = PcmCache()
+    return _bgm_cache
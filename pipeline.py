@@ -0,0 +1,165 @@
+import queue
+import threading
+import time
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from utils import get_logger
+
+logger = get_logger("pipeline")
+
+_END = object()
+
+
+class Stage:
+    """
+    One step of the pipeline
+
+    A stage without dependencies is called with the item; any other stage is
+    called with the results of its dependencies, in the order they are listed.
+    """
+
+    def __init__(self, name, func, deps=(), concurrency=1):
+        """
+        :param name: Unique stage name
+        :param func: Callable doing the work
+        :param deps: Names of the stages whose results this stage needs
+        :param concurrency: How many items may run this stage at the same time
+        """
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.concurrency = concurrency
+
+
+class _Run:
+    def __init__(self, index, item, stages):
+        self.index = index
+        self.item = item
+        self.results = {}
+        self.timings = {}
+        self.error = None
+        self.remaining = {stage.name: len(stage.deps) for stage in stages}
+        self.unfinished = len(stages)
+
+
+class PipelineScheduler:
+    """
+    Run many items through a dependency graph of stages on a thread pool.
+
+    Stages of different items overlap freely: while item N is being rendered,
+    item N+1 can already be in its first stage. Each stage has its own
+    concurrency limit, and at most `max_in_flight` items are in the pipeline at
+    once, so throughput is bounded by the slowest stage rather than by the sum
+    of all stages. A failing stage skips its dependents but not other items.
+    """
+
+    def __init__(self, stages, max_in_flight=None):
+        self.stages = {stage.name: stage for stage in stages}
+        self._order = self._topological_order(stages)
+        self._dependents = {name: [s.name for s in stages if name in s.deps] for name in self.stages}
+        self.max_in_flight = max_in_flight or max(stage.concurrency for stage in stages) + 1
+        self._executor = ThreadPoolExecutor(max_workers=sum(stage.concurrency for stage in stages),
+                                            thread_name_prefix="stage")
+        self._lock = threading.Lock()
+        self._ready = {name: deque() for name in self.stages}
+        self._running = {name: 0 for name in self.stages}
+        self._finished = queue.Queue()
+
+    @staticmethod
+    def _topological_order(stages):
+        names = {stage.name for stage in stages}
+        order, seen = [], set()
+        pending = list(stages)
+        while pending:
+            progress = [stage for stage in pending if set(stage.deps) <= seen]
+            if not progress:
+                unknown = {dep for stage in pending for dep in stage.deps} - names
+                raise ValueError(f"Unknown stages {unknown}" if unknown else "Stages contain a cycle")
+            for stage in progress:
+                order.append(stage.name)
+                seen.add(stage.name)
+                pending.remove(stage)
+        return order
+
+    def _dispatch(self):
+        with self._lock:
+            for name in self._order:
+                stage = self.stages[name]
+                ready = self._ready[name]
+                while ready and self._running[name] < stage.concurrency:
+                    run = ready.popleft()
+                    self._running[name] += 1
+                    self._executor.submit(self._execute, stage, run)
+
+    def _execute(self, stage, run):
+        start = time.perf_counter()
+        try:
+            if run.error is None:
+                args = [run.results[dep] for dep in stage.deps] if stage.deps else [run.item]
+                run.results[stage.name] = stage.func(*args)
+        except Exception as e:
+            run.error = (stage.name, e, traceback.format_exc())
+            logger.error(f"Item {run.index} failed in stage {stage.name}: {e}")
+        run.timings[stage.name] = time.perf_counter() - start
+
+        with self._lock:
+            self._running[stage.name] -= 1
+            self._complete(stage.name, run)
+        self._dispatch()
+
+    def _complete(self, name, run):
+        """Mark a stage of a run as finished (or skipped) and release its dependents"""
+        run.unfinished -= 1
+        last = run.unfinished == 0
+        for dependent in self._dependents[name]:
+            run.remaining[dependent] -= 1
+            if run.remaining[dependent] == 0:
+                if run.error is None:
+                    self._ready[dependent].append(run)
+                else:
+                    self._complete(dependent, run)
+        if last:
+            self._finished.put(run)
+
+    def _start(self, run):
+        with self._lock:
+            for name in self._order:
+                if not self.stages[name].deps:
+                    self._ready[name].append(run)
+        self._dispatch()
+
+    def run(self, items):
+        """
+        Push items through the pipeline
+
+        :param items: Iterable of items; it is consumed lazily as capacity frees up
+        :return: Generator of (index, results, error) in completion order, where
+                 results maps stage name to its return value and error is None or
+                 (stage name, exception, traceback text)
+        """
+        items = iter(items)
+        in_flight = 0
+        index = 0
+        exhausted = False
+        try:
+            while True:
+                while not exhausted and in_flight < self.max_in_flight:
+                    item = next(items, _END)
+                    if item is _END:
+                        exhausted = True
+                        break
+                    self._start(_Run(index, item, self.stages.values()))
+                    index += 1
+                    in_flight += 1
+                if in_flight == 0:
+                    return
+                run = self._finished.get()
+                in_flight -= 1
+                timings = ", ".join(f"{name}={seconds:.2f}s" for name, seconds in run.timings.items())
+                logger.info(f"Item {run.index} finished ({timings})")
+                yield run.index, run.results, run.error
+        finally:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
@@ -0,0 +1,183 @@
+import os
+import time
+
+import pygame
+from mutagen import File as MutagenFile
+
+from lrc import Lyrics
+from utils import extended_seconds_to_hms, get_logger
+
+logger = get_logger("player")
+
+# 一首播完时 pygame 投递的事件
+TRACK_END = pygame.USEREVENT + 1
+PLAYLIST_SUFFIX = "_with_bgm.mp3"
+# 没有任何事件时最长的等待时间（毫秒）
+MAX_WAIT_MS = 1000
+
+
+def audio_duration(file_path):
+    """
+    Duration in seconds read from the file headers, without decoding the audio
+
+    :return: Seconds, or None if the format is not recognized
+    """
+    try:
+        audio = MutagenFile(file_path)
+    except Exception as e:
+        logger.info(f"Cannot read duration of {file_path}: {e}")
+        return None
+    if audio is None or audio.info is None:
+        return None
+    return audio.info.length
+
+
+def find_tracks(directory, suffix=PLAYLIST_SUFFIX):
+    """Rendered outputs in a directory, oldest first"""
+    paths = [os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(suffix)]
+    return sorted(paths, key=os.path.getmtime)
+
+
+def _lyrics_for(file_path):
+    lrc_file = os.path.splitext(file_path)[0] + '.lrc'
+    return Lyrics.from_file(lrc_file) if os.path.exists(lrc_file) else None
+
+
+class Player:
+    """
+    Gapless player on one long-lived pygame mixer.
+
+    Tracks are streamed from disk by mixer.music and the next one is queued as
+    soon as the current one starts, so there is no gap between them. The loop
+    sleeps in pygame.event.wait() until the end of a track, the next lyric line
+    or the next whole second, so an idle player uses almost no CPU. With
+    SDL_AUDIODRIVER=dummy everything runs without a sound card.
+    """
+
+    def __init__(self, frequency=44100, channels=2):
+        self.frequency = frequency
+        self.channels = channels
+        # 事件队列需要 video 子系统，没有显示器时使用 dummy 驱动
+        if not os.environ.get("DISPLAY") and os.name != "nt":
+            os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+        pygame.display.init()
+        self._ensure_mixer()
+
+    def _ensure_mixer(self):
+        # 其他模块（如 stream_player）可能以不同参数重建过 mixer
+        if not pygame.mixer.get_init():
+            pygame.mixer.init(frequency=self.frequency, channels=self.channels)
+        pygame.mixer.music.set_endevent(TRACK_END)
+
+    def play(self, file_path, lrc_file=None, show_progress=True):
+        """
+        Play one file, showing progress and synchronized lyrics
+
+        :param lrc_file: LRC file (optional, defaults to the .lrc next to the audio)
+        """
+        lyrics = Lyrics.from_file(lrc_file) if lrc_file else None
+        self.play_playlist([file_path], show_progress, lyrics=[lyrics] if lrc_file else None)
+
+    def play_playlist(self, paths, show_progress=True, lyrics=None):
+        """
+        Play files back to back without gaps
+
+        :param paths: Audio files in playing order
+        :param show_progress: Show a progress bar per track
+        :param lyrics: Optional list of lrc.Lyrics per track; by default the .lrc
+                       next to each file is used when present
+        """
+        if lyrics is None:
+            lyrics = [_lyrics_for(path) for path in paths]
+        tracks = []
+        for path, track_lyrics in zip(paths, lyrics):
+            if os.path.exists(path):
+                tracks.append((path, track_lyrics))
+            else:
+                logger.info(f"错误：文件 '{path}' 不存在。")
+        if not tracks:
+            return
+        self._ensure_mixer()
+        pygame.event.clear(TRACK_END)
+
+        try:
+            pygame.mixer.music.load(tracks[0][0])
+            pygame.mixer.music.play()
+            for index, (path, track_lyrics) in enumerate(tracks):
+                if index + 1 < len(tracks):
+                    # 预先排队下一首，当前曲目结束时无缝衔接
+                    pygame.mixer.music.queue(tracks[index + 1][0])
+                self._follow_track(path, track_lyrics, show_progress)
+        except pygame.error as e:
+            logger.info(f"播放音频时发生错误: {e}")
+        finally:
+            pygame.mixer.music.stop()
+
+    def _follow_track(self, file_path, lyrics, show_progress):
+        """Wait for the current track to end while updating progress and lyrics"""
+        duration = audio_duration(file_path)
+        logger.info(f"正在播放: {os.path.basename(file_path)}")
+        if duration is not None:
+            logger.info(f"音频长度: {extended_seconds_to_hms(int(duration))}")
+
+        pbar = None
+        if show_progress:
+            from tqdm import tqdm
+            pbar = tqdm(total=int(duration or 0), unit="sec", bar_format="{l_bar}{bar}| {n_fmt}/{total_fmt}",
+                        ncols=100)
+        start = time.monotonic()
+        current_line = -1
+        try:
+            while True:
+                position_ms = int((time.monotonic() - start) * 1000)
+                if lyrics:
+                    line = lyrics.line_at(position_ms)
+                    if line != current_line:
+                        current_line = line
+                        if line >= 0:
+                            (pbar.write if pbar else print)(lyrics.text(line))
+                if pbar and position_ms // 1000 != pbar.n:
+                    pbar.n = min(position_ms // 1000, pbar.total)
+                    pbar.refresh()
+
+                # 睡到下一次需要刷新的时刻：下一整秒或下一行歌词
+                wake_ms = (position_ms // 1000 + 1) * 1000 if pbar else position_ms + MAX_WAIT_MS
+                if lyrics and current_line + 1 < len(lyrics):
+                    wake_ms = min(wake_ms, lyrics.times[current_line + 1])
+                timeout = max(min(wake_ms - position_ms, MAX_WAIT_MS), 1)
+                event = pygame.event.wait(timeout)
+                if event.type == TRACK_END:
+                    return
+                if event.type == pygame.NOEVENT and not pygame.mixer.music.get_busy():
+                    return
+        finally:
+            if pbar:
+                pbar.close()
+
+    def close(self):
+        pygame.mixer.quit()
+        pygame.display.quit()
+
+
+_player = None
+
+
+def get_player() -> Player:
+    """The shared player, created on first use"""
+    global _player
+    if _player is None:
+        _player = Player()
+    return _player
+
+
+if __name__ == '__main__':
+    import argparse
+    from artifact_store import get_artifact_store
+
+    parser = argparse.ArgumentParser(description="Play rendered poems back to back")
+    parser.add_argument("paths", nargs="*", help="Audio files or directories (default: every stored poem)")
+    args = parser.parse_args()
+    tracks = [] if args.paths else get_artifact_store().paths("mix")
+    for target in args.paths:
+        tracks.extend(find_tracks(target) if os.path.isdir(target) else [target])
+    get_player().play_playlist(tracks)
@@ -0,0 +1,328 @@
+"""
+Shared rate limiting for the Azure services
+
+Each service (chat, tts, dalle) gets one Limiter per process, combining:
+
+- token buckets for requests per minute and, for chat, tokens per minute, so
+  a burst never exceeds the configured quota and sustained throughput settles
+  at it;
+- AIMD on the concurrency and the request rate, for quotas that are lower
+  than configured or shared with other clients. A throttled response halves
+  the concurrency and drops the rate to the success rate just measured, at
+  most once per round trip so that one burst of 429s counts once. While a
+  limit is the bottleneck, successes raise it again, slowly once it nears
+  the level that was throttled last, so it stays at the ceiling instead of
+  sawing up and down;
+- retries with full jitter, honouring Retry-After, during which the whole
+  service pauses rather than every thread hammering the endpoint again.
+
+Limits come from config.RATE_LIMITS and are per process; job_queue workers
+each take their share with set_share().
+"""
+import email.utils
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from config import RATE_LIMITS, RETRY_BASE_SECONDS, RETRY_MAX_ATTEMPTS, RETRY_MAX_SECONDS
+from tracing import count, current_span
+from utils import get_logger
+
+logger = get_logger("rate_limit")
+
+# 没有 Retry-After 时，AIMD 减半后也至少暂停这么久
+THROTTLE_PAUSE_SECONDS = 1.0
+# 按最近这么多秒的成功次数估计服务实际允许的速率
+RATE_WINDOW_SECONDS = 10.0
+# 接近上次被限流的水平后，增长放慢到这个比例
+PROBE_FRACTION = 0.1
+TRANSIENT_STATUS = (408, 409, 500, 502, 503, 504)
+
+
+class Throttled(Exception):
+    """The service rejected a request for exceeding its quota (HTTP 429 or the SDK equivalent)"""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Transient(Exception):
+    """A failure worth retrying that says nothing about the quota, e.g. a timeout or a 503"""
+
+
+def parse_retry_after(headers):
+    """
+    Seconds to wait according to retry-after-ms or Retry-After (seconds or an HTTP date)
+
+    :return: Seconds, or None when the headers do not say
+    """
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def classify(exc):
+    """
+    Map an exception from openai, httpx or our own wrappers to Throttled or
+    Transient, or None when it must not be retried
+    """
+    if isinstance(exc, (Throttled, Transient)):
+        return exc
+    response = getattr(exc, 'response', None)
+    status = getattr(exc, 'status_code', None) or getattr(response, 'status_code', None)
+    if status == 429:
+        return Throttled(str(exc), parse_retry_after(getattr(response, 'headers', None)))
+    if status in TRANSIENT_STATUS:
+        return Transient(str(exc))
+    # openai.APIConnectionError / APITimeoutError 和 httpx 的网络错误没有状态码
+    names = {cls.__name__ for cls in type(exc).__mro__}
+    if status is None and names & {'APIConnectionError', 'APITimeoutError', 'TransportError', 'TimeoutException'}:
+        return Transient(str(exc))
+    return None
+
+
+class TokenBucket:
+    """
+    Refills `rate` tokens per minute up to `capacity`
+
+    A request larger than the capacity waits for a full bucket and then goes
+    into debt, so it is delayed instead of blocked forever.
+    """
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.configured_rate = self.rate
+        # 默认允许 10 秒的突发，Azure 按 1 秒或 10 秒窗口统计
+        self.capacity = capacity or max(rate_per_minute / 6.0, 1.0)
+        self.configured_capacity = self.capacity
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, n=1.0):
+        """Block until n tokens are available and take them; returns the seconds waited"""
+        waited = 0.0
+        need = min(n, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= need:
+                    self._tokens -= n
+                    return waited
+                delay = (need - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    @property
+    def rate_per_minute(self):
+        return self.rate * 60
+
+    def set_rate(self, rate_per_minute):
+        """Change the refill rate, never above the configured one; the burst shrinks with it"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = min(max(rate_per_minute / 60.0, 1 / 60.0), self.configured_rate)
+            self.capacity = max(self.configured_capacity * self.rate / self.configured_rate, 1.0)
+            self._tokens = min(self._tokens, self.capacity)
+
+    def drain(self):
+        """Drop the saved-up burst, e.g. after the service said there is none left on its side"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self._tokens, 0.0)
+
+    def adjust(self, n):
+        """Give back (n > 0) or take (n < 0) tokens once the real cost of a request is known"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self.capacity, self._tokens + n)
+
+
+class Limiter:
+    """Rate, concurrency and retry control for one service"""
+
+    def __init__(self, name, requests_per_minute, tokens_per_minute=None, max_concurrency=8, initial_concurrency=None,
+                 max_attempts=RETRY_MAX_ATTEMPTS, base_delay=RETRY_BASE_SECONDS, max_delay=RETRY_MAX_SECONDS):
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_concurrency = max_concurrency
+        self.concurrency = float(initial_concurrency or max(1, max_concurrency // 2))
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._last_rate_decrease = float('-inf')
+        self._concurrency_ceiling = float('inf')
+        self._rate_ceiling = float('inf')
+        self._successes = deque()
+        self._created = time.monotonic()
+        self._cond = threading.Condition()
+
+    def _pause(self, seconds):
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def _enter(self):
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    self._cond.wait(self._paused_until - now)
+                elif self._in_flight >= int(self.concurrency):
+                    self._cond.wait()
+                else:
+                    self._in_flight += 1
+                    return now, self._in_flight >= int(self.concurrency)
+
+    def _measured_rate(self, now):
+        """
+        Successful requests per minute over the last RATE_WINDOW_SECONDS, or
+        None before a whole window has passed, when a few requests say nothing
+        """
+        while self._successes and self._successes[0] < now - RATE_WINDOW_SECONDS:
+            self._successes.popleft()
+        if now - self._created < RATE_WINDOW_SECONDS:
+            return None
+        return len(self._successes) * 60 / RATE_WINDOW_SECONDS
+
+    def _leave(self, started, saturated, rate_bound, throttled):
+        with self._cond:
+            self._in_flight -= 1
+            now = time.monotonic()
+            if throttled:
+                # 同一轮里先发出的请求都会收到 429，只按第一个降低
+                if started >= self._last_decrease:
+                    self._concurrency_ceiling = self.concurrency
+                    self.concurrency = max(1.0, self.concurrency / 2)
+                    self._last_decrease = now
+                    logger.warning(f"{self.name}: throttled, concurrency down to {int(self.concurrency)}")
+                # 服务端已经没有突发余量，本地攒下的也作废
+                self.requests.drain()
+                # 速率的效果要一个统计窗口后才看得出来，窗口内只降一次，降到实测的成功速率
+                if now - self._last_rate_decrease >= RATE_WINDOW_SECONDS:
+                    current, measured = self.requests.rate_per_minute, self._measured_rate(now)
+                    self._rate_ceiling = current
+                    self.requests.set_rate(measured if measured is not None and measured < current else current * 0.9)
+                    self._last_rate_decrease = now
+                    logger.warning(f"{self.name}: throttled, rate down to {self.requests.rate_per_minute:.1f}/min")
+            else:
+                self._successes.append(now)
+                # 只有限制真正起作用时才增长，否则空闲时会一直涨到上限
+                if saturated and self.concurrency < self.max_concurrency:
+                    step = 1 / self.concurrency
+                    if self.concurrency + 1 > self._concurrency_ceiling:
+                        step *= PROBE_FRACTION
+                    self.concurrency = min(self.max_concurrency, self.concurrency + step)
+                if rate_bound:
+                    step = 1.0 if self.requests.rate_per_minute + 1 <= self._rate_ceiling else PROBE_FRACTION
+                    self.requests.set_rate(self.requests.rate_per_minute + step)
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, tokens=0):
+        """
+        Hold one request's share of the quota; a 429 raised inside lowers the concurrency
+
+        :param tokens: Estimated tokens of the request, for services with a token quota
+        """
+        waited = self.requests.acquire()
+        rate_bound = waited > 0
+        if self.tokens is not None and tokens:
+            waited += self.tokens.acquire(tokens)
+        started, saturated = self._enter()
+        throttled = False
+        try:
+            yield
+        except Exception as e:
+            throttled = isinstance(classify(e), Throttled)
+            raise
+        finally:
+            self._leave(started, saturated, rate_bound, throttled)
+            if waited:
+                current_span().add("rate_limit_wait", waited)
+
+    def settle(self, estimated, actual):
+        """Correct the token bucket once a request's real token count is known"""
+        if self.tokens is not None and actual is not None:
+            self.tokens.adjust(estimated - actual)
+
+    def _delay(self, attempt, retry_after):
+        if retry_after is not None:
+            return retry_after + random.uniform(0, self.base_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def call(self, func, *args, tokens=0, **kwargs):
+        """
+        Call func under the limits, retrying throttled and transient failures
+
+        :param tokens: Estimated tokens of one attempt
+        :return: What func returns; the last error is raised once attempts run out
+        """
+        for attempt in range(self.max_attempts):
+            try:
+                with self.slot(tokens):
+                    return func(*args, **kwargs)
+            except Exception as e:
+                error = classify(e)
+                if error is None or attempt + 1 >= self.max_attempts:
+                    raise
+                retry_after = getattr(error, 'retry_after', None)
+                delay = self._delay(attempt, retry_after)
+                if isinstance(error, Throttled):
+                    count(f"rate_limit.{self.name}.throttled")
+                    self._pause(delay if retry_after is not None else max(delay, THROTTLE_PAUSE_SECONDS))
+                else:
+                    count(f"rate_limit.{self.name}.retry")
+                logger.warning(f"{self.name}: {type(error).__name__} ({error}), retry {attempt + 1} in {delay:.1f}s")
+                time.sleep(delay)
+
+
+_lock = threading.Lock()
+_limiters = {}
+_share = 1.0
+
+
+def set_share(fraction):
+    """Scale the request and token quotas of limiters created from now on, e.g. 1/4 in each of 4 workers"""
+    global _share
+    _share = fraction
+
+
+def get_limiter(name) -> Limiter:
+    """The process-wide limiter of a service configured in config.RATE_LIMITS"""
+    with _lock:
+        limiter = _limiters.get(name)
+        if limiter is None:
+            limits = dict(RATE_LIMITS[name])
+            limits['requests_per_minute'] *= _share
+            if limits.get('tokens_per_minute'):
+                limits['tokens_per_minute'] *= _share
+            limiter = _limiters[name] = Limiter(name, **limits)
+        return limiter
@@ -1,70 +1,523 @@
+import bisect
 import os
-import hashlib
+import queue
+import time
+import wave
 import azure.cognitiveservices.speech as speechsdk
-import pygame
+import numpy as np
+from xml.sax.saxutils import escape
 
 from add_bgm import add_background_music, play_audio
-from config import SPEECH_CACHE_DIR, LANGUAGE, AzureVoice, DATA_DIR
-from private_config import AzureOpenAiConfig
+from audio_mixer import PcmBuffer, SpeechPcm, map_wav
+from lyric_align import dump_word_boundaries, load_word_boundaries, words_path
+from config import SPEECH_CACHE_DIR, LANGUAGE, AzureVoice, DATA_DIR, TTS_BATCH_MAX_CHARS, TTS_BATCH_MAX_TEXTS
+from chunked_synthesis import ChunkedSynthesizer
+from rate_limit import Throttled, Transient, get_limiter
+from tracing import count, current_span, enabled as tracing_enabled, record, traced
+from tts_cache import get_tts_cache, normalize_text
 from utils import get_logger
 logger = get_logger("speech_assistant")
 
 
+# WAV 输出格式对应的裸 PCM 格式及采样率，分块合成时使用
+RAW_PCM_FORMATS = {
+    speechsdk.SpeechSynthesisOutputFormat.Riff16Khz16BitMonoPcm:
+        (speechsdk.SpeechSynthesisOutputFormat.Raw16Khz16BitMonoPcm, 16000),
+    speechsdk.SpeechSynthesisOutputFormat.Riff24Khz16BitMonoPcm:
+        (speechsdk.SpeechSynthesisOutputFormat.Raw24Khz16BitMonoPcm, 24000),
+    speechsdk.SpeechSynthesisOutputFormat.Riff48Khz16BitMonoPcm:
+        (speechsdk.SpeechSynthesisOutputFormat.Raw48Khz16BitMonoPcm, 48000),
+}
+
+
+# 这些取消原因重试即可；TooManyRequests 还会让限流器降低并发
+TRANSIENT_CANCELLATIONS = (
+    speechsdk.CancellationErrorCode.ConnectionFailure,
+    speechsdk.CancellationErrorCode.ServiceTimeout,
+    speechsdk.CancellationErrorCode.ServiceUnavailable,
+)
+
+
+def cancellation_error(details) -> Exception:
+    """The exception to raise for a canceled synthesis: Throttled, Transient or RuntimeError"""
+    message = f"Speech synthesis canceled: {details.reason} {details.error_details or ''}".strip()
+    if details.error_code == speechsdk.CancellationErrorCode.TooManyRequests:
+        return Throttled(message)
+    if details.error_code in TRANSIENT_CANCELLATIONS:
+        return Transient(message)
+    return RuntimeError(message)
+
+
+def build_batch_ssml(texts, voice, language=LANGUAGE):
+    """
+    One SSML document speaking several texts, each a paragraph preceded by a
+    bookmark named after its index. Every line becomes a sentence, so a title
+    keeps the pause a newline gives in plain text.
+
+    :return: (ssml, positions) where positions[i][j] is the index in ssml of character j of texts[i]
+    """
+    parts = [f'<speak version="1.0" xmlns="http://www.w3.org/2001/10/synthesis" xml:lang="{language}">'
+             f'<voice name="{escape(voice)}">']
+    length = len(parts[0])
+    positions = []
+
+    def emit(markup):
+        nonlocal length
+        parts.append(markup)
+        length += len(markup)
+
+    for i, text in enumerate(texts):
+        emit(f'<bookmark mark="{i}"/><p>')
+        offsets = []
+        for line in text.split('\n'):
+            if line:
+                emit('<s>')
+                for char in line:
+                    offsets.append(length)
+                    emit(escape(char))
+                emit('</s>')
+            # 换行符本身不出现在 SSML 中，记在下一句之前
+            offsets.append(length)
+        positions.append(offsets[:len(text)])
+        emit('</p>')
+    emit('</voice></speak>')
+    return ''.join(parts), positions
+
+
+def pack_batches(items, max_texts=TTS_BATCH_MAX_TEXTS, max_chars=TTS_BATCH_MAX_CHARS):
+    """
+    Group (key, text) pairs into batches within the request limits, keeping their order
+
+    Texts longer than max_chars are left out; they go through the single-text path.
+    """
+    batches, batch, chars = [], [], 0
+    for key, text in items:
+        if len(text) > max_chars:
+            continue
+        if batch and (len(batch) >= max_texts or chars + len(text) > max_chars):
+            batches.append(batch)
+            batch, chars = [], 0
+        batch.append((key, text))
+        chars += len(text)
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+class AzurePcmSynthesizer:
+    """A long-lived synthesizer returning raw PCM in memory, for ChunkedSynthesizer"""
+
+    def __init__(self, speech_config):
+        self._synthesizer = speechsdk.SpeechSynthesizer(speech_config=speech_config, audio_config=None)
+
+    def synthesize(self, text):
+        return get_limiter("tts").call(self._speak, text)
+
+    def _speak(self, text):
+        result = self._synthesizer.speak_text_async(text).get()
+        if result.reason == speechsdk.ResultReason.SynthesizingAudioCompleted:
+            return result.audio_data
+        raise cancellation_error(result.cancellation_details)
+
+
+class PcmBufferCallback(speechsdk.audio.PushAudioOutputStreamCallback):
+    """Push-stream callback appending the synthesized PCM to an audio_mixer.PcmBuffer"""
+
+    def __init__(self, buffer):
+        super().__init__()
+        self.buffer = buffer
+
+    def write(self, audio_buffer: memoryview) -> int:
+        return self.buffer.write(audio_buffer)
+
+    def close(self):
+        pass
+
+
 class SpeechAssistant:
-    def __init__(self, speech_key, speech_region, output_dir, human):
+    def __init__(self, speech_key, speech_region, output_dir, human,
+                 output_format=speechsdk.SpeechSynthesisOutputFormat.Riff24Khz16BitMonoPcm, cache=None,
+                 concurrency=1, pauses=None):
+        """
+        :param output_format: Set explicitly so that it can be part of the cache key; the default is
+                              what the service returns for neural voices when no format is set
+        :param concurrency: Number of parallel synthesizers; above 1 texts are split into
+                            sentence chunks that are synthesized and cached separately
+        :param pauses: Pause lengths in ms between chunks, see chunked_synthesis.DEFAULT_PAUSES
+        """
         self.speech_key = speech_key
         self.speech_region = speech_region
         self.speech_human = human
         self.output_dir = output_dir
+        self.output_format = output_format
+        self.concurrency = concurrency
+        self.pauses = pauses
+        self._chunked = None
         self.speech_config = speechsdk.SpeechConfig(subscription=self.speech_key, region=self.speech_region)
         self.speech_config.speech_synthesis_voice_name = self.speech_human
+        self.speech_config.set_speech_synthesis_output_format(self.output_format)
+        self.cache = cache or get_tts_cache()
 
         if not os.path.exists(self.output_dir):
             os.makedirs(self.output_dir)
 
-    def _get_hash(self, text):
-        return hashlib.md5(text.encode()).hexdigest()
-
-    def _get_file_path(self, text):
-        hash_value = self._get_hash(text.strip())
-        return os.path.join(self.output_dir, f"{hash_value}_{self.speech_human}.wav")
+    def _cache_key(self, text):
+        return self.cache.make_key(text, self.speech_human, self.output_format.name)
 
     def get_or_create_audio(self, text, save_path=None):
+        """
+        Synthesize text unless identical text, voice and format are already cached
+
+        Word boundaries reported during synthesis are cached too and placed next
+        to the WAV (see lyric_align.words_path) for lyric alignment.
+
+        :param text: Text to speak
+        :param save_path: Where to put the WAV (optional); the cached file is hardlinked or copied there
+        :return: save_path, or the path inside the cache if no save_path is given
+        """
+        key = self._cache_key(text)
+        file_path = self.cache.get(key)
+        if file_path is not None:
+            logger.info(f"Using cached audio file: {file_path}")
+            count("tts_cache.hit")
+        else:
+            count("tts_cache.miss")
+            tmp_path = self.cache.temp_path(key, ".wav")
+            logger.info(f"Generating new audio file: {tmp_path}")
+            generate = self._generate_audio_chunked if self.concurrency > 1 else self._generate_audio
+            normalized = normalize_text(text)
+            words = []
+            if not generate(normalized, tmp_path, words):
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise RuntimeError("Speech synthesis failed")
+            file_path = self.cache.put_file(key, tmp_path, ".wav")
+            self._put_words(key, normalized, words)
         if save_path is None:
-            file_path = self._get_file_path(text)
-            if os.path.exists(file_path):
-                logger.info(f"Using existing audio file: {file_path}")
-                return file_path
+            return file_path
+        return self._materialize(key, save_path)
+
+    def _materialize(self, key, save_path):
+        sidecar = words_path(save_path)
+        if self.cache.materialize(self._words_key(key), sidecar) is None and os.path.exists(sidecar):
+            os.remove(sidecar)
+        return self.cache.materialize(key, save_path)
+
+    def get_or_create_pcm(self, text, save_path=None):
+        """
+        Like get_or_create_audio, but return the speech in memory for the mixer
+
+        A miss is synthesized into a PcmBuffer (or joined chunks) and stored in the
+        TTS cache from there; a hit memory-maps the cached WAV. Either way the
+        mixer and lyric alignment use the samples directly, so no WAV is decoded.
+
+        :param text: Text to speak
+        :param save_path: Also place the WAV there (optional)
+        :return: audio_mixer.SpeechPcm carrying the word boundaries
+        """
+        key = self._cache_key(text)
+        file_path = self.cache.get(key)
+        wav = map_wav(file_path) if file_path is not None else None
+        if wav is not None:
+            logger.info(f"Using cached audio: {file_path}")
+            count("tts_cache.hit")
+            speech = SpeechPcm(*wav, words=load_word_boundaries(file_path), path=file_path)
+        else:
+            count("tts_cache.miss")
+            normalized = normalize_text(text)
+            words = []
+            samples, sample_rate = self._synthesize_pcm(normalized, words)
+            file_path = self._put_pcm(key, samples, sample_rate)
+            self._put_words(key, normalized, words)
+            speech = SpeechPcm(samples, sample_rate, words=(normalized, words) if words else None, path=file_path)
+        if save_path is not None:
+            self._materialize(key, save_path)
+        return speech
+
+    @traced("tts.synthesize_pcm")
+    def _synthesize_pcm(self, text, words):
+        """
+        Synthesize text into memory
+
+        :return: (int16 samples of shape (frames, 1), sample rate)
+        """
+        if self.concurrency > 1:
+            chunked = self._get_chunked_synthesizer()
+            pcm = chunked.synthesize(text, words)
+            samples, sample_rate = np.frombuffer(pcm, dtype='<i2').reshape(-1, 1), chunked.sample_rate
         else:
-            file_path = save_path
-        logger.info(f"Generating new audio file: {file_path}")
-        self._generate_audio(text, file_path)
-        return file_path
+            raw_config, _, sample_rate = self._raw_speech_config()
+            samples = get_limiter("tts").call(self._speak_to_buffer, raw_config, sample_rate, text, words)
+        logger.info(f"Speech synthesized into memory ({len(samples) / sample_rate:.2f}s)")
+        current_span().set(chars=len(text), bytes=samples.nbytes)
+        return samples, sample_rate
+
+    def _speak_to_buffer(self, raw_config, sample_rate, text, words):
+        """One synthesis attempt into a fresh PcmBuffer"""
+        del words[:]
+        # 按每字约 0.3 秒预分配，不够时缓冲区会自动扩容
+        buffer = PcmBuffer(capacity_frames=len(text) * sample_rate * 3 // 10)
+        stream = speechsdk.audio.PushAudioOutputStream(PcmBufferCallback(buffer))
+        synthesizer = speechsdk.SpeechSynthesizer(speech_config=raw_config,
+                                                  audio_config=speechsdk.audio.AudioOutputConfig(stream=stream))
+        self._collect_words(synthesizer, words)
+        result = synthesizer.speak_text_async(text).get()
+        if result.reason != speechsdk.ResultReason.SynthesizingAudioCompleted:
+            raise cancellation_error(result.cancellation_details)
+        return buffer.view()
+
+    def synthesize_batch(self, texts):
+        """
+        Put many short texts into the TTS cache with few requests
+
+        The texts that are not cached yet are packed into SSML documents (see
+        pack_batches and build_batch_ssml) and each document is synthesized in
+        one request. The audio is cut at the bookmarks in front of every text
+        and stored under the same key as a single synthesis, together with its
+        word boundaries, so get_or_create_audio / get_or_create_pcm simply hit
+        the cache afterwards.
+
+        :param texts: Texts to speak
+        :return: Number of texts synthesized; those that were too long or whose batch
+                 failed are left to the single-text path
+        """
+        pending = {}
+        for text in texts:
+            key = self._cache_key(text)
+            if key not in pending and self.cache.get(key) is None:
+                pending[key] = normalize_text(text)
+        if not pending:
+            return 0
+        raw_config, _, sample_rate = self._raw_speech_config()
+        synthesized = 0
+        for batch in pack_batches(pending.items()):
+            try:
+                synthesized += self._synthesize_ssml_batch(batch, raw_config, sample_rate)
+            except Exception as e:
+                logger.error(f"Batched speech synthesis of {len(batch)} texts failed, "
+                             f"they will be synthesized one by one: {e}")
+        return synthesized
+
+    @traced("tts.synthesize_batch")
+    def _synthesize_ssml_batch(self, batch, raw_config, sample_rate):
+        texts = [text for _, text in batch]
+        ssml, positions = build_batch_ssml(texts, self.speech_human)
+        samples, marks, words = get_limiter("tts").call(self._speak_ssml_to_buffer, raw_config, sample_rate, ssml,
+                                                        sum(map(len, texts)))
+        if sorted(marks) != list(range(len(batch))):
+            raise RuntimeError(f"Expected {len(batch)} bookmarks, got {len(marks)}")
+        # audio_offset 的单位是 100 纳秒
+        starts = [marks[i] for i in range(len(batch))]
+        bounds = [ticks * sample_rate // 10 ** 7 for ticks in starts] + [len(samples)]
+        firsts = [offsets[0] if offsets else len(ssml) for offsets in positions]
+        per_text = [[] for _ in batch]
+        for ticks, ssml_offset in words:
+            i = bisect.bisect_right(firsts, ssml_offset) - 1
+            if i >= 0 and positions[i]:
+                offset = bisect.bisect_right(positions[i], ssml_offset) - 1
+                per_text[i].append(((ticks - starts[i]) // 10000, offset))
+        for i, (key, text) in enumerate(batch):
+            self._put_pcm(key, samples[bounds[i]:bounds[i + 1]], sample_rate)
+            self._put_words(key, text, per_text[i])
+        logger.info(f"Synthesized {len(batch)} texts in one request ({len(samples) / sample_rate:.2f}s)")
+        current_span().set(texts=len(batch), chars=sum(map(len, texts)), bytes=samples.nbytes)
+        return len(batch)
+
+    def _speak_ssml_to_buffer(self, raw_config, sample_rate, ssml, chars):
+        """
+        One batched synthesis attempt into a fresh PcmBuffer
+
+        :return: (samples, {bookmark index: audio offset}, [(audio offset, offset in ssml)])
+        """
+        buffer = PcmBuffer(capacity_frames=chars * sample_rate * 3 // 10)
+        stream = speechsdk.audio.PushAudioOutputStream(PcmBufferCallback(buffer))
+        synthesizer = speechsdk.SpeechSynthesizer(speech_config=raw_config,
+                                                  audio_config=speechsdk.audio.AudioOutputConfig(stream=stream))
+        marks, words = {}, []
+        synthesizer.bookmark_reached.connect(lambda evt: marks.setdefault(int(evt.text), evt.audio_offset))
+        # SSML 输入时 text_offset 是在 SSML 中的位置
+        synthesizer.synthesis_word_boundary.connect(lambda evt: words.append((evt.audio_offset, evt.text_offset)))
+        result = synthesizer.speak_ssml_async(ssml).get()
+        if result.reason != speechsdk.ResultReason.SynthesizingAudioCompleted:
+            raise cancellation_error(result.cancellation_details)
+        return buffer.view(), marks, words
 
-    def _generate_audio(self, text, file_path):
+    def _put_pcm(self, key, pcm, sample_rate):
+        """Store 16-bit mono PCM as a WAV in the TTS cache; returns its path"""
+        tmp_path = self.cache.temp_path(key, ".wav")
+        with wave.open(tmp_path, 'wb') as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(sample_rate)
+            w.writeframes(pcm)
+        return self.cache.put_file(key, tmp_path, ".wav")
+
+    @staticmethod
+    def _words_key(key):
+        # 缓存中的文件名 <key>.words.json 正好是 <key>.wav 的 words_path
+        return key + ".words"
+
+    def _put_words(self, key, text, words):
+        if words:
+            self.cache.put_bytes(self._words_key(key), dump_word_boundaries(text, words), ".json")
+
+    @staticmethod
+    def _collect_words(synthesizer, words):
+        # audio_offset 的单位是 100 纳秒
+        synthesizer.synthesis_word_boundary.connect(
+            lambda evt: words.append((evt.audio_offset // 10000, evt.text_offset)))
+
+    @staticmethod
+    def _trace_output(text, file_path):
+        if tracing_enabled() and os.path.exists(file_path):
+            current_span().set(chars=len(text), bytes=os.path.getsize(file_path))
+
+    @traced("tts.synthesize")
+    def _generate_audio(self, text, file_path, words=None):
+        try:
+            get_limiter("tts").call(self._speak_to_file, text, file_path, words)
+        except Exception as e:
+            logger.error(f"Speech synthesis failed: {e}")
+            return False
+        logger.info(f"Speech synthesized and saved to file '{file_path}'")
+        self._trace_output(text, file_path)
+        return True
+
+    def _speak_to_file(self, text, file_path, words):
+        """One synthesis attempt writing file_path"""
         audio_config = speechsdk.audio.AudioOutputConfig(filename=file_path)
         speech_synthesizer = speechsdk.SpeechSynthesizer(speech_config=self.speech_config, audio_config=audio_config)
+        if words is not None:
+            del words[:]
+            self._collect_words(speech_synthesizer, words)
         result = speech_synthesizer.speak_text_async(text).get()
+        if result.reason != speechsdk.ResultReason.SynthesizingAudioCompleted:
+            raise cancellation_error(result.cancellation_details)
 
-        if result.reason == speechsdk.ResultReason.SynthesizingAudioCompleted:
-            logger.info(f"Speech synthesized and saved to file '{file_path}'")
-        elif result.reason == speechsdk.ResultReason.Canceled:
-            cancellation_details = result.cancellation_details
-            logger.warning("Speech synthesis canceled: {}".format(cancellation_details.reason))
-            if cancellation_details.reason == speechsdk.CancellationReason.Error:
-                if cancellation_details.error_details:
-                    logger.error("Error details: {}".format(cancellation_details.error_details))
+    def _raw_speech_config(self):
+        """SpeechConfig producing raw PCM matching output_format, and its sample rate"""
+        if self.output_format not in RAW_PCM_FORMATS:
+            raise ValueError(f"Raw PCM synthesis does not support {self.output_format.name}")
+        raw_format, sample_rate = RAW_PCM_FORMATS[self.output_format]
+        raw_config = speechsdk.SpeechConfig(subscription=self.speech_key, region=self.speech_region)
+        raw_config.speech_synthesis_voice_name = self.speech_human
+        raw_config.set_speech_synthesis_output_format(raw_format)
+        return raw_config, raw_format, sample_rate
 
-    def play_sound(self, text):
-        pygame.mixer.init()
-        file_path = self.get_or_create_audio(text)
+    def _get_chunked_synthesizer(self) -> ChunkedSynthesizer:
+        if self._chunked is None:
+            raw_config, raw_format, sample_rate = self._raw_speech_config()
+            self._chunked = ChunkedSynthesizer(lambda: AzurePcmSynthesizer(raw_config),
+                                               pool_size=self.concurrency,
+                                               sample_rate=sample_rate,
+                                               cache=self.cache,
+                                               voice=self.speech_human,
+                                               format_name=raw_format.name,
+                                               pauses=self.pauses)
+        return self._chunked
+
+    @traced("tts.synthesize_chunked")
+    def _generate_audio_chunked(self, text, file_path, words=None):
         try:
-            pygame.mixer.music.load(file_path)
-            pygame.mixer.music.play()
-            while pygame.mixer.music.get_busy():
-                pygame.time.Clock().tick(10)
-        except pygame.error as e:
-            logger.info(f"Error playing sound: {e}")
+            # 分块合成时以每块的起点作为边界
+            self._get_chunked_synthesizer().synthesize_to_wav(text, file_path, words)
+        except RuntimeError as e:
+            logger.error(f"Chunked speech synthesis failed: {e}")
+            return False
+        logger.info(f"Speech synthesized in chunks and saved to file '{file_path}'")
+        self._trace_output(text, file_path)
+        return True
+
+    def _iter_synthesized_pcm(self, text, key, sample_rate):
+        """
+        Yield raw PCM chunks as the service produces them, then store the whole
+        speech in the TTS cache
+        """
+        raw_config, _, _ = self._raw_speech_config()
+        words = []
+        start = time.perf_counter()
+        # 429 在第一块音频之前到达，只有开始合成这一步需要限流和重试；synthesizer 要一直持有到流结束
+        synthesizer, chunks, chunk = get_limiter("tts").call(self._start_stream, raw_config, text, words)
+
+        received = []
+        while chunk is not None:
+            if not isinstance(chunk, bytes):
+                raise cancellation_error(chunk.cancellation_details)
+            if not received:
+                record("tts.stream.first_chunk", time.perf_counter() - start)
+            received.append(chunk)
+            yield chunk
+            chunk = chunks.get()
+        record("tts.stream", time.perf_counter() - start, chars=len(text), bytes=sum(map(len, received)))
+
+        self._put_pcm(key, b''.join(received), sample_rate)
+        self._put_words(key, text, words)
+
+    def _start_stream(self, raw_config, text, words):
+        """
+        Start synthesizing and wait for the first chunk
+
+        :return: (synthesizer, queue of the remaining chunks, first chunk or None)
+        """
+        del words[:]
+        synthesizer = speechsdk.SpeechSynthesizer(speech_config=raw_config, audio_config=None)
+        self._collect_words(synthesizer, words)
+        chunks = queue.Queue()
+        synthesizer.synthesizing.connect(lambda evt: chunks.put(evt.result.audio_data))
+        synthesizer.synthesis_completed.connect(lambda evt: chunks.put(None))
+        synthesizer.synthesis_canceled.connect(lambda evt: chunks.put(evt.result))
+        synthesizer.speak_text_async(text)
+        chunk = chunks.get()
+        if chunk is not None and not isinstance(chunk, bytes):
+            raise cancellation_error(chunk.cancellation_details)
+        return synthesizer, chunks, chunk
+
+    @staticmethod
+    def _iter_wav_pcm(file_path, chunk_frames=4096):
+        with wave.open(file_path, 'rb') as w:
+            while True:
+                chunk = w.readframes(chunk_frames)
+                if not chunk:
+                    return
+                yield chunk
+
+    def stream_with_bgm(self, text, bg_music, output_audio=None, bg_volume=0.3):
+        """
+        Play text with background music while it is still being synthesized
+
+        Audio starts as soon as the first chunks arrive; the mixed MP3 is written
+        to output_audio in the background and the speech ends up in the TTS cache.
+
+        :param text: Text to speak
+        :param bg_music: Path to the background music file
+        :param output_audio: Path of the MP3 to write (optional)
+        :param bg_volume: Background music volume, range 0-1
+        :return: output_audio
+        """
+        from pcm_cache import get_bgm_cache
+        from stream_player import stream_with_bgm
+        pcm_chunks, sample_rate = self._stream_pcm(text)
+        return stream_with_bgm(pcm_chunks, sample_rate, bg_music, output_audio=output_audio,
+                               bg_volume=bg_volume, bgm_cache=get_bgm_cache())
+
+    def _stream_pcm(self, text):
+        """
+        :return: (iterator of raw PCM chunks from the TTS cache or the synthesizer, sample rate)
+        """
+        _, _, sample_rate = self._raw_speech_config()
+        key = self._cache_key(text)
+        cached = self.cache.get(key)
+        if cached is not None:
+            logger.info(f"Streaming cached audio file: {cached}")
+            count("tts_cache.hit")
+            return self._iter_wav_pcm(cached), sample_rate
+        count("tts_cache.miss")
+        return self._iter_synthesized_pcm(normalize_text(text), key, sample_rate), sample_rate
+
+    def play_sound(self, text):
+        """Speak text, starting as soon as the first audio arrives; the speech ends up in the TTS cache"""
+        from stream_player import stream_speech
+        stream_speech(*self._stream_pcm(text))
 
     def get_hear_text(self):
         # Creates a recognizer with the given settings
@@ -85,6 +538,7 @@ class SpeechAssistant:
 
 
 def get_speech_instance() -> SpeechAssistant:
+    from private_config import AzureOpenAiConfig
     return SpeechAssistant(
             AzureOpenAiConfig.SPEECH_KEY,
             AzureOpenAiConfig.AzureLocation,
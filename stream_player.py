@@ -0,0 +1,180 @@
+import queue
+import threading
+import time
+
+import numpy as np
+import pygame
+
+from audio_mixer import BgmMixer, MultiPcmWriter, load_pcm, probe_audio, upmix
+from utils import get_logger
+
+logger = get_logger("stream_player")
+
+# 流式播放时每块 250ms；BGM 前奏不等语音，语音在前奏播放期间合成
+STREAM_BLOCK_MS = 250
+
+
+def pcm16_to_blocks(pcm_chunks, channels):
+    """
+    Convert raw 16-bit mono PCM byte chunks to float32 blocks of shape (frames, channels)
+
+    A sample split across two chunks is carried over to the next one. Mono is
+    widened with audio_mixer.upmix, the same as in a rendered mix.
+    """
+    carry = b''
+    for chunk in pcm_chunks:
+        data = carry + bytes(chunk)
+        usable = len(data) - len(data) % 2
+        carry = data[usable:]
+        if not usable:
+            continue
+        mono = np.frombuffer(data, dtype='<i2', count=usable // 2).astype('<f4') / np.float32(32768)
+        yield upmix(mono[:, None], channels)
+
+
+def prefetch(iterable):
+    """
+    Consume an iterable on a background thread and yield its items
+
+    Lets the synthesis start (and keep going) while the caller is busy playing
+    the BGM intro; an exception from the iterable is raised in the caller.
+    """
+    items = queue.Queue()
+    done = object()
+
+    def consume():
+        try:
+            for item in iterable:
+                items.put(item)
+        except BaseException as e:
+            items.put(e)
+        else:
+            items.put(done)
+
+    threading.Thread(target=consume, name="stream-prefetch", daemon=True).start()
+    while True:
+        item = items.get()
+        if item is done:
+            return
+        if isinstance(item, BaseException):
+            raise item
+        yield item
+
+
+class StreamingPlayer:
+    """
+    Play float32 blocks as they arrive by queueing them on one pygame mixer channel
+    """
+
+    def __init__(self, sample_rate, channels):
+        # 共享的 mixer 可能以其他采样率运行（见 player.Player），需要重建
+        if pygame.mixer.get_init() != (sample_rate, -16, channels):
+            pygame.mixer.quit()
+            pygame.mixer.init(frequency=sample_rate, size=-16, channels=channels)
+        self._channel = pygame.mixer.Channel(0)
+
+    def feed(self, block):
+        """Queue a block, waiting while the channel already has one queued"""
+        pcm = np.clip(block * 32768.0, -32768, 32767).astype('<i2')
+        sound = pygame.mixer.Sound(buffer=pcm.tobytes())
+        while self._channel.get_queue() is not None:
+            time.sleep(0.01)
+        if self._channel.get_busy():
+            self._channel.queue(sound)
+        else:
+            self._channel.play(sound)
+
+    def drain(self):
+        """Wait until everything queued has been played"""
+        while self._channel.get_busy():
+            time.sleep(0.05)
+
+    def close(self):
+        pygame.mixer.quit()
+
+
+def stream_with_bgm(pcm_chunks, sample_rate, bg_music, output_audio=None, bg_volume=0.5, bgm_cache=None):
+    """
+    Mix speech with BGM while it is being synthesized and play it immediately
+
+    The mix runs at the speech sample rate with the BGM's channel count. The
+    BGM intro starts playing right away while the speech is read on a
+    background thread, so playback does not wait for the synthesizer. When
+    `output_audio` is given, the same blocks are encoded to it on a background
+    thread while playback goes on; if anything fails, the partial file is
+    deleted.
+
+    :param pcm_chunks: Iterable of raw 16-bit mono PCM byte chunks, e.g. from the synthesizer
+    :param sample_rate: Sample rate of the speech PCM
+    :param bg_music: Path to the background music file
+    :param output_audio: Path of the MP3 to write alongside playback (optional)
+    :param bg_volume: Background music volume, range 0-1
+    :param bgm_cache: Optional pcm_cache.PcmCache for the decoded BGM
+    :return: output_audio
+    """
+    gain_db = -(10 * (1 - bg_volume))
+    if bgm_cache:
+        _, channels = bgm_cache.probe(bg_music)
+        bgm = bgm_cache.load(bg_music, sample_rate, channels, gain_db)
+    else:
+        _, channels = probe_audio(bg_music)
+        bgm = load_pcm(bg_music, sample_rate, channels, gain_db, channels)
+    mixer = BgmMixer(bgm, sample_rate, block_frames=sample_rate * STREAM_BLOCK_MS // 1000)
+
+    writer = MultiPcmWriter({output_audio: 'mp3'}, sample_rate, channels) if output_audio else None
+
+    player = StreamingPlayer(sample_rate, channels)
+    start = time.perf_counter()
+    first = True
+    try:
+        for block in mixer.iter_mix(pcm16_to_blocks(prefetch(pcm_chunks), channels), eager_intro=True):
+            if writer is not None:
+                writer.write(block)
+            player.feed(block)
+            if first:
+                logger.info(f"Playback started after {time.perf_counter() - start:.2f}s")
+                first = False
+        player.drain()
+    except BaseException:
+        # 合成或混音中途失败时不保留截断的 MP3
+        if writer is not None:
+            writer.abort()
+        raise
+    else:
+        if writer is not None:
+            writer.close()
+    finally:
+        player.close()
+    if output_audio:
+        logger.info(f"Streamed mix saved to {output_audio}")
+    return output_audio
+
+
+def stream_speech(pcm_chunks, sample_rate):
+    """
+    Play speech while it is being synthesized, without background music
+
+    :param pcm_chunks: Iterable of raw 16-bit mono PCM byte chunks, e.g. from the synthesizer
+    :param sample_rate: Sample rate of the speech PCM
+    """
+    block_frames = sample_rate * STREAM_BLOCK_MS // 1000
+    player = StreamingPlayer(sample_rate, 1)
+    start = time.perf_counter()
+    first = True
+    try:
+        # 合成器的块大小不定，凑够 STREAM_BLOCK_MS 再排队，避免块太小时播放断续
+        pending, frames = [], 0
+        for block in pcm16_to_blocks(prefetch(pcm_chunks), 1):
+            pending.append(block)
+            frames += len(block)
+            if frames >= block_frames:
+                player.feed(np.concatenate(pending))
+                pending, frames = [], 0
+                if first:
+                    logger.info(f"Playback started after {time.perf_counter() - start:.2f}s")
+                    first = False
+        if pending:
+            player.feed(np.concatenate(pending))
+        player.drain()
+    finally:
+        player.close()
@@ -0,0 +1,96 @@
+import wave
+
+import numpy as np
+import pytest
+from pydub import AudioSegment
+
+from audio_mixer import BgmMixer, mix_background_music
+
+RATE = 1000
+WAV_RATE = 44100
+
+
+def _mixer():
+    bgm = np.random.default_rng(1).uniform(-0.5, 0.5, (RATE * 5, 2)).astype('<f4')
+    return BgmMixer(bgm, RATE, block_frames=RATE // 4)
+
+
+def _speech_blocks(seconds, read):
+    speech = np.random.default_rng(2).uniform(-0.5, 0.5, (int(RATE * seconds), 2)).astype('<f4')
+    for start in range(0, len(speech), RATE // 10):
+        read.append(start)
+        yield speech[start:start + RATE // 10]
+
+
+# 语音至少比前奏中 BGM 单独的部分长一个 crossfade 时两者完全一致
+@pytest.mark.parametrize("seconds", [3, 10])
+def test_eager_intro_matches_regular_mix(seconds):
+    expected = np.concatenate(list(_mixer().iter_mix(_speech_blocks(seconds, []))))
+    eager = np.concatenate(list(_mixer().iter_mix(_speech_blocks(seconds, []), eager_intro=True)))
+    assert np.array_equal(eager, expected)
+
+
+def test_eager_intro_does_not_wait_for_speech():
+    mixer = _mixer()
+    read = []
+    blocks = mixer.iter_mix(_speech_blocks(10, read), eager_intro=True)
+    intro_blocks = mixer.speech_start // mixer.block_frames
+    for _ in range(intro_blocks):
+        next(blocks)
+    assert read == []
+    next(blocks)
+    assert read
+
+
+def _write_wav(path, seconds, channels, frequency):
+    t = np.arange(int(WAV_RATE * seconds)) / WAV_RATE
+    tone = (0.5 * np.sin(2 * np.pi * frequency * t) * 32767).astype('<i2')
+    with wave.open(str(path), 'wb') as w:
+        w.setnchannels(channels)
+        w.setsampwidth(2)
+        w.setframerate(WAV_RATE)
+        w.writeframes(np.repeat(tone[:, None], channels, axis=1).tobytes())
+    return str(path)
+
+
+def _pydub_mix(speech_path, bgm_path, bg_gain_db):
+    # add_background_music 改用 BgmMixer 之前的 pydub 实现
+    original = AudioSegment.from_wav(speech_path)
+    background = AudioSegment.from_wav(bgm_path) + bg_gain_db
+    bg_main = background * (len(original) // len(background) + 1)
+    bg_main = bg_main[:len(original)]
+    output = background[:3000].append(original, crossfade=1000)
+    output = output.overlay(bg_main[1000:])
+    return np.array(output.get_array_of_samples()).reshape(-1, output.channels)
+
+
+@pytest.mark.parametrize("speech_channels", [1, 2])
+def test_mix_matches_pydub(tmp_path, speech_channels):
+    speech = _write_wav(tmp_path / "speech.wav", 6, speech_channels, 440)
+    bgm = _write_wav(tmp_path / "bgm.wav", 4, 2, 110)
+    output = str(tmp_path / "mix.wav")
+    mix_background_music(speech, bgm, output, bg_gain_db=-5, audio_format='wav')
+    with wave.open(output, 'rb') as w:
+        assert w.getnchannels() == 2
+        mixed = np.frombuffer(w.readframes(w.getnframes()), dtype='<i2').reshape(-1, 2)
+    expected = _pydub_mix(speech, bgm, -5)
+    frames = min(len(mixed), len(expected))
+    assert abs(len(mixed) - len(expected)) <= WAV_RATE // 100
+    # 单声道人声以原电平复制到两个声道，与 pydub 的 set_channels 相同（ffmpeg 的 -ac 2 会低 3 dB）
+    assert np.abs(mixed[:frames].astype(int) - expected[:frames]).max() <= 32
+
+
+@pytest.mark.parametrize("speech_channels", [1, 2])
+def test_normalized_speech_measures_at_target(tmp_path, speech_channels):
+    from loudness import SPEECH_TARGET_LUFS, frame_power, integrated_loudness
+    speech = _write_wav(tmp_path / "speech.wav", 6, speech_channels, 440)
+    bgm = _write_wav(tmp_path / "bgm.wav", 4, 2, 110)
+    output = str(tmp_path / "mix.wav")
+    # BGM 压到几乎无声，测得的就是混音里人声的响度
+    mix_background_music(speech, bgm, output, audio_format='wav', speech_lufs=SPEECH_TARGET_LUFS, bgm_lufs=-90)
+    with wave.open(output, 'rb') as w:
+        mixed = np.frombuffer(w.readframes(w.getnframes()), dtype='<i2').reshape(-1, 2)
+    # 人声从第 2 秒开始淡入，只测淡入结束后的部分
+    speech_section = mixed[3 * WAV_RATE:8 * WAV_RATE]
+    loudness = integrated_loudness(frame_power(speech_section, WAV_RATE, full_scale=32768.0))
+    assert loudness == pytest.approx(SPEECH_TARGET_LUFS, abs=0.3)
@@ -0,0 +1,89 @@
+import random
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from chunked_synthesis import ChunkedSynthesizer, split_text
+from tts_cache import TtsCache
+
+RATE = 1000
+POEM = "床前明月光，\n疑是地上霜。\n\n举头望明月，\n低头思故乡。"
+PAUSES = {'sentence': 20, 'line': 50, 'stanza': 100}
+
+
+def _pcm(text):
+    value = sum(map(ord, text)) % 30000 + 1
+    return np.full(len(text) * 10, value, dtype='<i2').tobytes()
+
+
+class FakeSynthesizer:
+    """Returns 10 ms of a constant sample per character, taking a random time like the service"""
+
+    calls = []
+    lock = threading.Lock()
+
+    def synthesize(self, text):
+        with self.lock:
+            self.calls.append(text)
+        time.sleep(random.uniform(0, 0.02))
+        return _pcm(text)
+
+
+@pytest.fixture
+def fake():
+    FakeSynthesizer.calls = []
+    return FakeSynthesizer
+
+
+def _synthesizer(fake, cache=None):
+    return ChunkedSynthesizer(fake, pool_size=4, sample_rate=RATE, cache=cache, voice="fake", format_name="pcm",
+                              pauses=PAUSES)
+
+
+def _expected(text):
+    parts = []
+    for chunk, pause in split_text(text):
+        parts.append(_pcm(chunk))
+        parts.append(b'\0\0' * (PAUSES[pause] * RATE // 1000 if pause else 0))
+    return b''.join(parts)
+
+
+def test_split_text_marks_boundaries():
+    assert split_text(POEM) == [("床前明月光，", 'line'), ("疑是地上霜。", 'stanza'),
+                                ("举头望明月，", 'line'), ("低头思故乡。", None)]
+    long_line = "一句话。" * 30
+    chunks = split_text(long_line, max_chars=40)
+    assert [pause for _, pause in chunks] == ['sentence'] * (len(chunks) - 1) + [None]
+    assert all(len(chunk) <= 40 for chunk, _ in chunks)
+    assert "".join(chunk for chunk, _ in chunks) == long_line
+
+
+def test_chunks_joined_in_order_with_pauses(fake):
+    synthesizer = _synthesizer(fake)
+    try:
+        for _ in range(5):
+            marks = []
+            assert synthesizer.synthesize(POEM, marks) == _expected(POEM)
+    finally:
+        synthesizer.close()
+    # 每块的起点：前面各块 10ms/字，加上 line/stanza 停顿
+    assert marks == [(0, 0), (110, 7), (270, 15), (380, 22)]
+
+
+def test_editing_one_line_only_resynthesizes_that_chunk(fake, tmp_path):
+    cache = TtsCache(str(tmp_path / "tts"))
+    synthesizer = _synthesizer(fake, cache)
+    try:
+        synthesizer.synthesize(POEM)
+        assert sorted(fake.calls) == sorted(chunk for chunk, _ in split_text(POEM))
+        fake.calls.clear()
+        edited = POEM.replace("低头思故乡。", "低头思故人。")
+        assert synthesizer.synthesize(edited) == _expected(edited)
+        assert fake.calls == ["低头思故人。"]
+        fake.calls.clear()
+        synthesizer.synthesize(edited)
+        assert fake.calls == []
+    finally:
+        synthesizer.close()
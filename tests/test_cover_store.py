@@ -0,0 +1,58 @@
+import os
+
+import pytest
+from mutagen.id3 import ID3
+from PIL import Image
+
+import cover_store
+from add_bgm import tag_mp3
+from cover_store import CoverStore, embedded_art_bytes, embedded_art_path
+
+
+def _png(path):
+    Image.new('RGBA', (64, 48), (200, 30, 30, 128)).save(path)
+    return str(path)
+
+
+@pytest.fixture
+def covers(tmp_path, monkeypatch):
+    covers = CoverStore(str(tmp_path / "covers"))
+    monkeypatch.setattr(cover_store, "_cover_store", covers)
+    return covers
+
+
+def test_user_cover_is_embedded_from_memory(tmp_path, covers):
+    user_dir = tmp_path / "user"
+    user_dir.mkdir()
+    cover = _png(user_dir / "cover.png")
+    mp3 = tmp_path / "song.mp3"
+    mp3.write_bytes(b'\xff\xfb\x90\x00' + b'\0' * 413)
+    tag_mp3(str(mp3), artist="me", cover_img=cover)
+    art = ID3(str(mp3)).getall('APIC')
+    assert art and art[0].data[:2] == b'\xff\xd8'
+    assert os.listdir(user_dir) == ["cover.png"]
+
+
+def test_store_cover_caches_its_derivative(covers):
+    cover = covers.get_or_generate("a red square", lambda prompt, path: _png(path))
+    art_path = embedded_art_path(cover)
+    assert os.path.exists(art_path)
+    stale = os.path.getmtime(cover) - 10
+    os.utime(art_path, (stale, stale))
+    data = embedded_art_bytes(cover)
+    # 派生图比原图旧时重新生成并缓存
+    assert os.path.getmtime(art_path) > stale
+    with open(art_path, 'rb') as f:
+        assert f.read() == data
+
+
+def test_unwritable_derivative_falls_back_to_memory(covers, monkeypatch):
+    cover = covers.get_or_generate("a red square", lambda prompt, path: _png(path))
+    os.remove(embedded_art_path(cover))
+
+    def read_only(art_path, data):
+        raise PermissionError(13, "Read-only file system", art_path)
+
+    monkeypatch.setattr(cover_store, "_write_art", read_only)
+    assert embedded_art_bytes(cover)[:2] == b'\xff\xd8'
+    assert not os.path.exists(embedded_art_path(cover))
@@ -0,0 +1,300 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+import job_queue
+import music_object
+from artifact_store import ArtifactStore, poem_id
+from job_queue import JobQueue, QueueStage, Worker
+
+
+def _poem(i):
+    return json.dumps({"title": f"诗{i}", "content": f"第{i}首的内容。", "photo_desc": f"picture {i}"},
+                      ensure_ascii=False)
+
+
+class StubStages:
+    """Stages that write a small file per poem and record every run"""
+
+    def __init__(self, fail=(), delay=0.0):
+        self.calls = []
+        self.fail = set(fail)
+        self.delay = delay
+        self._lock = threading.Lock()
+
+    def _runner(self, name):
+        def run(worker, music, *deps):
+            with self._lock:
+                self.calls.append((name, music.title))
+            time.sleep(self.delay)
+            if name in self.fail:
+                raise RuntimeError(f"{name} broke")
+            return music.store.put_bytes(music.poem_id, name, f"{name} {music.title} {deps}".encode('utf-8'),
+                                         ".txt")
+        return run
+
+    @staticmethod
+    def _key(name):
+        return lambda worker, music, *shas: job_queue.digest(name, music.title, *shas)
+
+    def stages(self):
+        return (QueueStage("speech", self._runner("speech"), self._key("speech")),
+                QueueStage("cover", self._runner("cover"), self._key("cover")),
+                QueueStage("mix", self._runner("mix"), self._key("mix"), deps=("speech", "cover")))
+
+
+class StubSpeech:
+    def __init__(self):
+        self.batches = []
+
+    def synthesize_batch(self, texts):
+        self.batches.append(list(texts))
+        return len(texts)
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = ArtifactStore(str(tmp_path / "artifacts"), str(tmp_path / "artifacts" / "manifest.sqlite3"))
+    monkeypatch.setattr(music_object, "get_artifact_store", lambda: store)
+    return store
+
+
+@pytest.fixture
+def stub_stages(monkeypatch):
+    def install(**options):
+        stages = StubStages(**options)
+        monkeypatch.setattr(job_queue, "STAGES", stages.stages())
+        monkeypatch.setattr(job_queue, "STAGE_BY_NAME", {stage.name: stage for stage in job_queue.STAGES})
+        return stages
+    monkeypatch.setattr(job_queue, "TTS_BATCH_MAX_TEXTS", 1)
+    return install
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"), lease_seconds=60, max_attempts=3, backoff_seconds=10)
+    yield queue
+    queue.close()
+
+
+def _states(queue):
+    return {stage: dict(states) for stage, states in queue.status().items()}
+
+
+def test_enqueue_keys_jobs_by_poem_id_and_skips_duplicates(queue):
+    assert queue.enqueue(_poem(1)) == 1
+    assert queue.enqueue(_poem(1)) is None
+    assert queue.enqueue("not json") is None
+    assert queue.enqueue(json.dumps({"title": "无内容"})) is None
+    assert queue._db.execute("SELECT response_hash FROM jobs").fetchall() == [(poem_id(_poem(1)),)]
+    assert _states(queue) == {"speech": {"pending": 1}, "cover": {"pending": 1}, "mix": {"pending": 1}}
+
+
+def test_claim_respects_dependencies_and_finishes_older_jobs_first(queue, stub_stages):
+    stub_stages()
+    queue.enqueue(_poem(1))
+    queue.enqueue(_poem(2))
+    first = queue.claim("a")
+    assert (first.job_id, first.stage) == (1, "cover")
+    queue.complete(first, "a", "k")
+    second = queue.claim("a")
+    assert (second.job_id, second.stage) == (2, "cover")
+    speech = queue.claim("a")
+    assert (speech.job_id, speech.stage) == (1, "speech")
+    queue.complete(speech, "a", "k")
+    # 第 1 首的 speech 和 cover 都完成后，mix 优先于其他任务
+    mix = queue.claim("a")
+    assert (mix.job_id, mix.stage) == (1, "mix")
+
+
+def test_expired_lease_is_taken_over(queue):
+    queue.enqueue(_poem(1))
+    task = queue.claim("a")
+    queue._db.execute("UPDATE tasks SET lease_until = 0 WHERE job_id = ? AND stage = ?", (task.job_id, task.stage))
+    taken = queue.claim("b")
+    assert (taken.job_id, taken.stage, taken.attempts) == (task.job_id, task.stage, 2)
+    assert not queue.renew(task, "a")
+    # 原来的工作进程完成时得知租约已丢失
+    assert queue.complete(task, "a", "k") is False
+    assert queue.complete(taken, "b", "k") is True
+
+
+def test_lease_expired_on_the_last_attempt_fails_for_good(queue):
+    queue.enqueue(_poem(1))
+    queue._db.execute("UPDATE tasks SET state = 'running', attempts = 3, lease_until = 0, worker = 'a' "
+                      "WHERE stage = 'speech'")
+    while queue.claim("b") is not None:
+        pass
+    states = _states(queue)
+    assert states["speech"] == {"failed": 1}
+    assert states["mix"] == {"failed": 1}
+
+
+def test_fail_backs_off_then_gives_up_and_cascades(queue):
+    queue.enqueue(_poem(1))
+    task = queue.claim("a")
+    assert task.stage == "speech" or task.stage == "cover"
+    before = time.time()
+    queue.fail(task, "a", "boom")
+    state, available_at, error = queue._db.execute(
+        "SELECT state, available_at, error FROM tasks WHERE job_id = ? AND stage = ?",
+        (task.job_id, task.stage)).fetchone()
+    # 第一次失败退避 5 到 10 秒（backoff_seconds 乘以 0.5 到 1 的抖动）
+    assert state == "pending" and error == "boom"
+    assert before + 5 <= available_at <= time.time() + 10
+    assert queue.claim("a").stage != task.stage
+
+    for attempt in (2, 3):
+        queue._db.execute("UPDATE tasks SET available_at = 0 WHERE job_id = ? AND stage = ?",
+                          (task.job_id, task.stage))
+        retried = queue.claim("a")
+        while retried.stage != task.stage:
+            retried = queue.claim("a")
+        assert retried.attempts == attempt
+        queue.fail(retried, "a", "boom")
+    states = _states(queue)
+    assert states[task.stage] == {"failed": 1}
+    # mix 依赖失败的阶段，随之失败
+    assert states["mix"] == {"failed": 1}
+    assert queue.retry_failed() == 2
+    assert states != _states(queue)
+
+
+def test_fail_from_a_worker_that_lost_the_lease_is_ignored(queue):
+    queue.enqueue(_poem(1))
+    task = queue.claim("a")
+    queue._db.execute("UPDATE tasks SET worker = 'b' WHERE job_id = ? AND stage = ?", (task.job_id, task.stage))
+    queue.fail(task, "a", "boom")
+    assert queue._db.execute("SELECT state, error FROM tasks WHERE job_id = ? AND stage = ?",
+                             (task.job_id, task.stage)).fetchone() == ("running", None)
+
+
+def test_release_orphans_hands_back_tasks_of_dead_workers(queue):
+    queue.enqueue(_poem(1))
+    queue.enqueue(_poem(2))
+    dead = subprocess.Popen([sys.executable, "-c", "pass"])
+    dead.wait()
+    orphan = queue.claim(f"{socket.gethostname()}:{dead.pid}")
+    alive = queue.claim(f"{socket.gethostname()}:{os.getpid()}")
+    # 其他主机上的进程无法检查，只能等租约过期
+    remote = queue.claim("other-host:1")
+    assert queue.release_orphans() == 1
+    states = {(job, stage): state for job, stage, state in
+              queue._db.execute("SELECT job_id, stage, state FROM tasks").fetchall()}
+    assert states[(orphan.job_id, orphan.stage)] == "pending"
+    assert states[(alive.job_id, alive.stage)] == "running"
+    assert states[(remote.job_id, remote.stage)] == "running"
+
+
+def test_worker_runs_every_stage_and_reuses_recorded_outputs(queue, store, stub_stages):
+    stages = stub_stages()
+    for i in range(3):
+        queue.enqueue(_poem(i))
+    assert Worker(queue).run() == 9
+    assert _states(queue) == {"speech": {"done": 3}, "cover": {"done": 3}, "mix": {"done": 3}}
+    assert len(stages.calls) == 9
+    outputs = queue.outputs(store)
+    assert [title for _, title, _ in outputs] == ["诗0", "诗1", "诗2"]
+    assert all(path == store.get(poem_id(_poem(i)), "mix") for i, (_, _, path) in enumerate(outputs))
+
+    # 强制重跑：输入未变、产物仍在清单中，一个阶段都不会再执行
+    queue._db.execute("UPDATE tasks SET state = 'pending'")
+    assert Worker(queue).run() == 9
+    assert len(stages.calls) == 9
+
+    # 产物被删除的阶段会重新生成，依赖它的 mix 输入不变，仍然复用
+    store.remove(poem_id(_poem(0)))
+    queue._db.execute("UPDATE tasks SET state = 'pending'")
+    Worker(queue).run()
+    assert sorted(stages.calls[9:]) == [("cover", "诗0"), ("mix", "诗0"), ("speech", "诗0")]
+
+
+def test_worker_retries_failures_and_cascades_when_attempts_run_out(queue, store, stub_stages):
+    stages = stub_stages(fail={"cover"})
+    queue.backoff_seconds = 0
+    queue.enqueue(_poem(1))
+    Worker(queue).run()
+    assert [call for call in stages.calls if call[0] == "cover"] == [("cover", "诗1")] * 3
+    assert _states(queue) == {"speech": {"done": 1}, "cover": {"failed": 1}, "mix": {"failed": 1}}
+    assert "cover broke" in queue._db.execute("SELECT error FROM tasks WHERE stage = 'cover'").fetchone()[0]
+
+
+def test_batched_speech_tasks_stay_leased_until_each_finishes(tmp_path, store, stub_stages, monkeypatch):
+    stages = stub_stages(delay=0.2)
+    monkeypatch.setattr(job_queue, "TTS_BATCH_MAX_TEXTS", 4)
+    db_path = str(tmp_path / "jobs.sqlite3")
+    queue = JobQueue(db_path, lease_seconds=0.3)
+    for i in range(4):
+        queue.enqueue(_poem(i))
+    worker = Worker(queue)
+    worker._speech = StubSpeech()
+
+    # 另一个进程不断尝试接手语音任务；四个任务依次执行共 0.8 秒，远超 0.3 秒的租约
+    stop = threading.Event()
+    stolen = []
+
+    def rival():
+        other = JobQueue(db_path, lease_seconds=0.3)
+        while not stop.is_set():
+            stolen.extend(other.claim_more("rival", "speech", 1))
+            time.sleep(0.02)
+        other.close()
+
+    thread = threading.Thread(target=rival)
+    prefetch = worker.prefetch_speech
+
+    def prefetch_then_compete(tasks):
+        # 四个语音任务都已被 worker 认领，对手只能在租约过期后接手
+        thread.start()
+        prefetch(tasks)
+
+    worker.prefetch_speech = prefetch_then_compete
+    try:
+        worker.run()
+    finally:
+        stop.set()
+        if thread.is_alive():
+            thread.join()
+    assert worker._speech.batches == [[f"诗{i}\n第{i}首的内容。" for i in range(4)]]
+    assert stolen == []
+    assert sorted(call for call in stages.calls if call[0] == "speech") == [("speech", f"诗{i}") for i in range(4)]
+    assert _states(queue)["speech"] == {"done": 4}
+    queue.close()
+
+
+class SidecarSpeech:
+    """Writes a WAV and its word-boundary sidecar the way SpeechAssistant.get_or_create_audio does"""
+
+    def get_or_create_audio(self, text, save_path=None):
+        import wave
+        from lyric_align import dump_word_boundaries, words_path
+        with wave.open(save_path, 'wb') as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(16000)
+            w.writeframes(b'\0\0' * 1600)
+        with open(words_path(save_path), 'wb') as f:
+            f.write(dump_word_boundaries(text, [(0, 0), (50, 3)]))
+        return save_path
+
+
+def test_speech_stage_keeps_word_boundaries_for_the_mix(tmp_path, store):
+    from lyric_align import load_word_boundaries
+
+    class StubWorker:
+        @staticmethod
+        def speech():
+            return SidecarSpeech()
+
+    music = music_object.MusicMeta(_poem(1), store)
+    path = job_queue._speech(StubWorker(), music)
+    assert path == store.get(music.poem_id, "speech")
+    # _mix 把这个路径交给 attach_bgm，对齐歌词时从旁边的 sidecar 读取词边界
+    assert load_word_boundaries(path) == (music.full_text, [(0, 0), (50, 3)])
+    assert not [name for name in os.listdir(store.poem_dir(music.poem_id)) if name.startswith(".staging")]
@@ -0,0 +1,97 @@
+import json
+
+import pytest
+
+import azure_openai_wrapper
+from json_stream import JsonArrayStream
+
+POEMS = [
+    {"title": "春晓", "content": "春眠不觉晓，\n处处闻啼鸟。", "photo_desc": "清晨的鸟"},
+    {"title": "引号", "content": "他说：\"{不是对象}\"", "photo_desc": "[方括号] 和 \\ 反斜杠"},
+    {"title": "嵌套", "content": "无", "photo_desc": "有", "tags": [{"a": 1}, {"b": [2, 3]}]},
+]
+
+
+def _feed_all(stream, pieces):
+    objects = []
+    for piece in pieces:
+        objects.extend(stream.feed(piece))
+    return objects
+
+
+def _chunks(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 1000])
+def test_objects_split_across_chunks(size):
+    text = json.dumps(POEMS, ensure_ascii=False, indent=2)
+    stream = JsonArrayStream()
+    objects = _feed_all(stream, _chunks(text, size))
+    assert [json.loads(obj) for obj in objects] == POEMS
+    assert stream.done
+
+
+def test_code_fence_is_ignored():
+    text = "好的，以下是诗：\n```json\n" + json.dumps(POEMS[:2], ensure_ascii=False) + "\n```\n"
+    stream = JsonArrayStream()
+    objects = _feed_all(stream, _chunks(text, 5))
+    assert [json.loads(obj) for obj in objects] == POEMS[:2]
+    assert stream.done
+
+
+def test_escaped_quotes_and_braces_inside_strings():
+    poem = {"title": "a\\\"}", "content": "\\\\\"{[", "photo_desc": "}]\""}
+    stream = JsonArrayStream()
+    objects = _feed_all(stream, list("[" + json.dumps(poem) + "]"))
+    assert [json.loads(obj) for obj in objects] == [poem]
+
+
+def test_object_is_returned_as_soon_as_it_closes():
+    stream = JsonArrayStream()
+    first, second = (json.dumps(poem, ensure_ascii=False) for poem in POEMS[:2])
+    assert stream.feed("[" + first[:-1]) == []
+    assert stream.feed(first[-1] + ", " + second[:3]) == [first]
+    assert not stream.done
+    assert stream.feed(second[3:] + "]") == [second]
+    assert stream.done
+
+
+def test_text_after_the_array_is_ignored():
+    stream = JsonArrayStream()
+    assert stream.feed('[{"a": 1}] 还有 {"b": 2}') == ['{"a": 1}']
+
+
+def test_generators_end_when_the_chat_fails(monkeypatch):
+    replies = iter(["第一首", "第二首"])
+
+    def chat(messages):
+        try:
+            return next(replies)
+        except StopIteration:
+            raise RuntimeError("outage") from None
+
+    def stream_chat(messages):
+        yield '[{"title": "一"}, {"ti'
+        raise RuntimeError("outage")
+
+    monkeypatch.setattr(azure_openai_wrapper, "chat_with_gpt4", chat)
+    monkeypatch.setattr(azure_openai_wrapper, "stream_chat_with_gpt4", stream_chat)
+    assert list(azure_openai_wrapper.create_text_with_openai("写诗")) == ["第一首", "第二首"]
+    assert list(azure_openai_wrapper.create_texts_in_batches("写诗", 2)) == ['{"title": "一"}']
+
+
+def test_batches_stop_after_replies_without_an_array(monkeypatch):
+    replies = iter(['[{"title": "一"}]', "好的，这是一首诗：春眠不觉晓。", '{"title": "二"}', "抱歉，我无法完成。"])
+    requests = []
+
+    def stream_chat(messages):
+        requests.append(messages)
+        # 假的聊天流：一直有回复，但后面都不是 JSON 数组
+        reply = next(replies, "仍然没有数组")
+        yield from _chunks(reply, 4)
+
+    monkeypatch.setattr(azure_openai_wrapper, "stream_chat_with_gpt4", stream_chat)
+    poems = azure_openai_wrapper.create_texts_in_batches("写诗", 2)
+    assert list(poems) == ['{"title": "一"}']
+    assert len(requests) == 1 + azure_openai_wrapper.MAX_EMPTY_REPLIES
@@ -0,0 +1,70 @@
+import pytest
+
+from lrc import Lyrics, format_timestamp
+
+LRC = """[ti:静夜思]
+[ar:李白]
+[00:01.00]床前明月光
+[00:03.50][00:13.50]疑是地上霜
+[00:06.250]举头望明月
+
+没有时间标签的一行
+[00:09]低头思故乡
+"""
+
+
+def test_metadata_is_collected_not_shown():
+    lyrics = Lyrics.parse(LRC)
+    assert lyrics.metadata == {'ti': '静夜思', 'ar': '李白'}
+    assert all(not text.startswith('[') for _, text in lyrics)
+
+
+def test_lines_with_several_timestamps_are_expanded_and_sorted():
+    lyrics = Lyrics.parse(LRC)
+    assert list(lyrics) == [(1000, "床前明月光"), (3500, "疑是地上霜"), (6250, "举头望明月"),
+                            (9000, "低头思故乡"), (13500, "疑是地上霜")]
+
+
+@pytest.mark.parametrize("tag, ms", [
+    ("[01:02]", 62000),
+    ("[01:02.5]", 62500),
+    ("[01:02.50]", 62500),
+    ("[01:02.505]", 62505),
+    ("[01:02:50]", 62500),
+    ("[100:00.00]", 6000000),
+])
+def test_timestamp_forms(tag, ms):
+    assert list(Lyrics.parse(f"{tag}行")) == [(ms, "行")]
+
+
+@pytest.mark.parametrize("offset, expected", [("+500", [500, 2500]), ("-500", [1500, 3500]), ("2000", [0, 1000])])
+def test_offset_is_applied(offset, expected):
+    lyrics = Lyrics.parse(f"[offset:{offset}]\n[00:01.00]一\n[00:03.00]二")
+    assert list(lyrics.times) == expected
+
+
+def test_round_trip():
+    lyrics = Lyrics.parse("[offset:+500]\n" + LRC)
+    text = lyrics.to_lrc()
+    assert text.splitlines()[:2] == ["[ti:静夜思]", "[ar:李白]"]
+    assert "offset" not in text
+    again = Lyrics.parse(text)
+    assert list(again) == list(lyrics)
+    assert again.metadata == {'ti': '静夜思', 'ar': '李白'}
+    assert format_timestamp(62505) == "[01:02.51]"
+
+
+def test_line_at():
+    lyrics = Lyrics.parse(LRC)
+    assert lyrics.line_at(0) == -1
+    assert lyrics.line_at(999) == -1
+    assert lyrics.text_at(999) is None
+    # 恰好在时间标签上时显示该行
+    assert lyrics.line_at(1000) == 0
+    assert lyrics.line_at(3499) == 0
+    assert lyrics.line_at(3500) == 1
+    assert lyrics.text_at(6250) == "举头望明月"
+    # 最后一行之后一直显示最后一行
+    assert lyrics.line_at(13500) == len(lyrics) - 1
+    assert lyrics.line_at(10 ** 9) == len(lyrics) - 1
+    assert Lyrics().line_at(0) == -1
@@ -0,0 +1,61 @@
+import threading
+import time
+import wave
+
+import numpy as np
+import pytest
+
+RATE = 44100
+
+
+def _track(path, seconds, frequency):
+    t = np.arange(int(RATE * seconds)) / RATE
+    tone = (0.2 * np.sin(2 * np.pi * frequency * t) * 32767).astype('<i2')
+    with wave.open(str(path), 'wb') as w:
+        w.setnchannels(2)
+        w.setsampwidth(2)
+        w.setframerate(RATE)
+        w.writeframes(np.repeat(tone[:, None], 2, axis=1).tobytes())
+    return str(path)
+
+
+@pytest.fixture
+def player(monkeypatch):
+    monkeypatch.setenv("SDL_AUDIODRIVER", "dummy")
+    monkeypatch.setenv("SDL_VIDEODRIVER", "dummy")
+    from player import Player
+    player = Player()
+    yield player
+    player.close()
+
+
+def test_playlist_advances_on_end_event_and_returns(tmp_path, player, monkeypatch):
+    import pygame
+    from player import TRACK_END
+    tracks = [_track(tmp_path / "a.wav", 0.3, 440), _track(tmp_path / "b.wav", 0.3, 660)]
+    queued, followed, events = [], [], []
+
+    queue = pygame.mixer.music.queue
+    monkeypatch.setattr(pygame.mixer.music, "queue", lambda path, *args: (queued.append(path), queue(path, *args)))
+    follow = player._follow_track
+    monkeypatch.setattr(player, "_follow_track", lambda path, *args: (followed.append(path), follow(path, *args)))
+    wait = pygame.event.wait
+    monkeypatch.setattr(pygame.event, "wait", lambda *args: events.append(wait(*args)) or events[-1])
+
+    start = time.monotonic()
+    thread = threading.Thread(target=player.play_playlist, args=(tracks,), kwargs={"show_progress": False})
+    thread.start()
+    thread.join(timeout=10)
+    assert not thread.is_alive(), "play_playlist did not return"
+    assert time.monotonic() - start < 5
+    # 第二首在第一首开始时就已排队，第一首结束的事件到来后跟随第二首
+    assert queued == [tracks[1]]
+    assert followed == tracks
+    assert [event.type for event in events].count(TRACK_END) >= 1
+
+
+def test_missing_tracks_are_skipped(tmp_path, player):
+    track = _track(tmp_path / "a.wav", 0.2, 440)
+    start = time.monotonic()
+    player.play_playlist([str(tmp_path / "missing.mp3"), track], show_progress=False)
+    assert time.monotonic() - start < 5
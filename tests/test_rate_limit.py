@@ -0,0 +1,178 @@
+import threading
+import time
+
+import httpx
+import openai
+import pytest
+
+from benchmarks.fake_azure import FakeQuota, start_server
+from http_pool import get_azure_openai_client
+from rate_limit import Limiter, Throttled, TokenBucket, Transient, classify, parse_retry_after
+
+MESSAGES = [{"role": "user", "content": "写一首诗"}]
+
+
+@pytest.fixture
+def fake_azure():
+    """Start a fake chat endpoint; returns a function (quota, **server options) -> chat completions API"""
+    servers = []
+
+    def start(quota, **options):
+        server = start_server(quota, **options)
+        servers.append(server)
+        client = get_azure_openai_client(api_version="2024-02-01", api_key="fake",
+                                         azure_endpoint=f"http://127.0.0.1:{server.server_port}")
+        return client.chat.completions
+
+    yield start
+    for server in servers:
+        server.shutdown()
+
+
+def _chat(completions, limiter):
+    return limiter.call(completions.create, model="fake", messages=MESSAGES)
+
+
+def _limiter(**options):
+    options.setdefault("base_delay", 0.01)
+    return Limiter("test", 6000, **options)
+
+
+def _response(status, headers=None):
+    return httpx.Response(status, headers=headers, request=httpx.Request("POST", "http://fake/chat/completions"))
+
+
+def test_retry_after_ms_is_honoured(fake_azure):
+    # 每秒 10 个、不允许突发：第二个请求收到约 100ms 的 retry-after-ms
+    quota = FakeQuota(600, burst=1)
+    completions = fake_azure(quota, latency=0.0)
+    limiter = _limiter()
+    # 从第一个请求之前计时：配额在第一个请求被接受约 100ms 后才补上，机器繁忙时第二个请求要等的更少
+    start = time.monotonic()
+    _chat(completions, limiter)
+    _chat(completions, limiter)
+    elapsed = time.monotonic() - start
+    assert (quota.accepted, quota.rejected) == (2, 1)
+    # 等了 retry-after-ms，而不是取整后的 Retry-After: 1
+    assert 0.09 <= elapsed < 0.9
+
+
+def test_retry_after_seconds_is_honoured(fake_azure):
+    quota = FakeQuota(600, burst=1)
+    completions = fake_azure(quota, latency=0.0, retry_after_ms=False)
+    limiter = _limiter()
+    _chat(completions, limiter)
+    start = time.monotonic()
+    _chat(completions, limiter)
+    assert (quota.accepted, quota.rejected) == (2, 1)
+    assert time.monotonic() - start >= 1.0
+
+
+def test_concurrency_halves_once_per_burst(fake_azure):
+    quota = FakeQuota(6000, max_concurrency=2)
+    # 延迟留足余量，机器繁忙时八个请求也都在第一个 429 返回之前发出
+    completions = fake_azure(quota, latency=2.0, reject_latency=1.0)
+    limiter = _limiter(max_concurrency=8, initial_concurrency=8, max_attempts=1)
+    barrier = threading.Barrier(8)
+    errors = []
+
+    def call():
+        barrier.wait()
+        try:
+            _chat(completions, limiter)
+        except openai.RateLimitError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert (quota.accepted, quota.rejected, len(errors)) == (2, 6, 6)
+    # 六个 429 属于同一轮，只减半一次
+    assert int(limiter.concurrency) == 4
+
+
+def test_transient_errors_are_retried(fake_azure):
+    quota = FakeQuota(6000)
+    quota.inject(503, times=2)
+    completions = fake_azure(quota, latency=0.0)
+    response = _chat(completions, _limiter(max_attempts=3))
+    assert response.choices[0].message.content
+    assert quota.accepted == 1 and quota.injected() is None
+
+
+def test_transient_errors_give_up_after_max_attempts(fake_azure):
+    quota = FakeQuota(6000)
+    quota.inject(503, times=3)
+    completions = fake_azure(quota, latency=0.0)
+    with pytest.raises(openai.InternalServerError):
+        _chat(completions, _limiter(max_attempts=2))
+    assert quota.injected() == 503 and quota.accepted == 0
+
+
+def test_non_retryable_errors_are_raised(fake_azure):
+    quota = FakeQuota(6000)
+    quota.inject(400, times=2)
+    completions = fake_azure(quota, latency=0.0)
+    with pytest.raises(openai.BadRequestError):
+        _chat(completions, _limiter(max_attempts=5))
+    # 只发了一次请求
+    assert quota.injected() == 400 and quota.accepted == 0
+
+
+def test_parse_retry_after():
+    assert parse_retry_after(None) is None
+    assert parse_retry_after(httpx.Headers({})) is None
+    assert parse_retry_after(httpx.Headers({"Retry-After": "3"})) == 3.0
+    # retry-after-ms 更精确，优先使用
+    assert parse_retry_after(httpx.Headers({"Retry-After": "1", "retry-after-ms": "250"})) == 0.25
+    assert parse_retry_after(httpx.Headers({"Retry-After": "-5"})) == 0.0
+    future = time.time() + 30
+    date = time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime(future))
+    assert 27 <= parse_retry_after(httpx.Headers({"Retry-After": date})) <= 31
+    assert parse_retry_after(httpx.Headers({"Retry-After": "soon"})) is None
+    assert parse_retry_after(httpx.Headers({"retry-after-ms": "x", "Retry-After": "2"})) == 2.0
+
+
+def test_classify():
+    throttled = classify(openai.RateLimitError("slow down", response=_response(429, {"retry-after-ms": "1500"}),
+                                               body=None))
+    assert isinstance(throttled, Throttled) and throttled.retry_after == 1.5
+    assert isinstance(classify(openai.InternalServerError("busy", response=_response(503), body=None)), Transient)
+    assert classify(openai.BadRequestError("bad", response=_response(400), body=None)) is None
+    request = httpx.Request("POST", "http://fake")
+    assert isinstance(classify(openai.APIConnectionError(request=request)), Transient)
+    assert isinstance(classify(openai.APITimeoutError(request=request)), Transient)
+    assert isinstance(classify(httpx.ConnectError("refused")), Transient)
+    own = Throttled("tts", retry_after=2)
+    assert classify(own) is own
+    assert classify(ValueError("not a network error")) is None
+
+
+def test_token_bucket_oversized_request_goes_into_debt():
+    bucket = TokenBucket(600, capacity=2)
+    # 超过容量的请求等到桶满就放行，欠下的由后面的请求偿还
+    assert bucket.acquire(5) == 0
+    waited = bucket.acquire(1)
+    assert 0.35 <= waited <= 0.6
+
+
+def test_token_bucket_drain_keeps_debt():
+    bucket = TokenBucket(600, capacity=2)
+    bucket.drain()
+    assert 0.05 <= bucket.acquire(1) <= 0.3
+    bucket.acquire(3)
+    bucket.drain()
+    assert bucket._tokens < 0
+
+
+def test_token_bucket_set_rate_is_clamped_and_scales_the_burst():
+    bucket = TokenBucket(600)
+    assert bucket.capacity == 100
+    bucket.set_rate(300)
+    assert bucket.rate_per_minute == pytest.approx(300) and bucket.capacity == pytest.approx(50)
+    bucket.set_rate(6000)
+    assert bucket.rate_per_minute == pytest.approx(600) and bucket.capacity == pytest.approx(100)
+    bucket.set_rate(0)
+    assert bucket.rate_per_minute == pytest.approx(1) and bucket.capacity == 1.0
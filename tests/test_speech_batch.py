@@ -0,0 +1,98 @@
+import re
+import xml.dom.minidom
+
+import numpy as np
+import pytest
+
+from lyric_align import load_word_boundaries
+from speech_assistant import SpeechAssistant, build_batch_ssml, pack_batches
+from tts_cache import TtsCache, normalize_text
+
+VOICE = "zh-CN-XiaoqiuNeural"
+# 每个字 10ms，audio_offset 的单位是 100 纳秒
+CHAR_TICKS = 10 * 10000
+_TOKEN = re.compile(r'<bookmark mark="(\d+)"/>|<[^>]*>|&[a-z]+;|.', re.S)
+
+
+def fake_speak_ssml(ssml, sample_rate):
+    """
+    Stand-in for the service: every spoken character becomes a word boundary
+    and 10 ms of samples holding the index of the paragraph it belongs to
+    plus one; bookmarks report the audio offset they are reached at
+    """
+    xml.dom.minidom.parseString(ssml)  # 转义错误时 SSML 无法解析
+    samples, marks, words = [], {}, []
+    paragraph = 0
+    for match in _TOKEN.finditer(ssml):
+        ticks = len(samples) * CHAR_TICKS
+        if match.group(1) is not None:
+            paragraph = int(match.group(1)) + 1
+            marks[paragraph - 1] = ticks
+        elif not match.group().startswith('<'):
+            words.append((ticks, match.start()))
+            samples.append(paragraph)
+    pcm = np.repeat(np.array(samples, dtype='<i2'), sample_rate // 100)[:, None]
+    return pcm, marks, words
+
+
+@pytest.fixture
+def assistant(tmp_path, monkeypatch):
+    assistant = SpeechAssistant("fake-key", "eastasia", str(tmp_path / "speech"), VOICE,
+                                cache=TtsCache(str(tmp_path / "tts")))
+    requests = []
+
+    def speak(raw_config, sample_rate, ssml, chars):
+        requests.append(ssml)
+        return fake_speak_ssml(ssml, sample_rate)
+
+    monkeypatch.setattr(assistant, "_speak_ssml_to_buffer", speak)
+    assistant.requests = requests
+    return assistant
+
+
+def test_ssml_escapes_text_and_maps_every_character():
+    texts = ["标题 <a&b>\n第一行", "x > y & z"]
+    ssml, positions = build_batch_ssml(texts, VOICE)
+    xml.dom.minidom.parseString(ssml)
+    assert "&lt;a&amp;b&gt;" in ssml and "x &gt; y &amp; z" in ssml
+    for text, offsets in zip(texts, positions):
+        assert len(offsets) == len(text)
+        for char, offset in zip(text, offsets):
+            if char != '\n':
+                assert ssml[offset:].startswith({'<': '&lt;', '>': '&gt;', '&': '&amp;'}.get(char, char))
+
+
+def test_pack_batches_respects_limits_and_order():
+    items = [(i, "字" * n) for i, n in enumerate([40, 40, 30, 120, 10, 10, 10, 10])]
+    batches = pack_batches(items, max_texts=3, max_chars=100)
+    assert [[key for key, _ in batch] for batch in batches] == [[0, 1], [2, 4, 5], [6, 7]]
+    assert all(sum(len(text) for _, text in batch) <= 100 for batch in batches)
+
+
+def test_batch_is_cut_at_bookmarks(assistant):
+    texts = ["春晓\n春眠不觉晓", "<夜&雨>\n夜来风雨声", "花落知多少"]
+    assert assistant.synthesize_batch(texts) == 3
+    assert len(assistant.requests) == 1
+    for i, text in enumerate(texts):
+        speech = assistant.get_or_create_pcm(text)
+        # 每段音频只含自己那一段的样本
+        assert set(np.unique(speech.samples)) == {i + 1}
+        assert len(speech.samples) == len(text.replace('\n', '')) * speech.sample_rate // 100
+
+
+def test_word_offsets_are_rebased_to_each_text(assistant):
+    texts = ["春晓\n春眠", "<夜&雨>\n风雨"]
+    assistant.synthesize_batch(texts)
+    for text in texts:
+        normalized, words = load_word_boundaries(assistant.get_or_create_audio(text))
+        assert normalized == normalize_text(text)
+        spoken = [i for i, char in enumerate(normalized) if char != '\n']
+        # 毫秒从本段开头算起，文本位置指向本段中的字符
+        assert words == [(k * 10, offset) for k, offset in enumerate(spoken)]
+
+
+def test_cached_texts_are_not_sent_again(assistant):
+    assistant.synthesize_batch(["一", "二"])
+    assert assistant.synthesize_batch(["二", "三", "三"]) == 1
+    assert len(assistant.requests) == 2
+    assert "二" not in assistant.requests[1]
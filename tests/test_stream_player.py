@@ -0,0 +1,51 @@
+import wave
+
+import numpy as np
+import pytest
+
+import stream_player
+from audio_mixer import SpeechReader, SpeechPcm
+
+RATE = 16000
+
+
+@pytest.fixture(autouse=True)
+def dummy_audio(monkeypatch):
+    monkeypatch.setenv("SDL_AUDIODRIVER", "dummy")
+
+
+def _bgm(path, seconds=1):
+    with wave.open(str(path), 'wb') as w:
+        w.setnchannels(2)
+        w.setsampwidth(2)
+        w.setframerate(RATE)
+        w.writeframes(np.zeros((RATE * seconds, 2), dtype='<i2').tobytes())
+    return str(path)
+
+
+def test_streamed_and_rendered_upmix_match():
+    mono = (np.sin(np.arange(RATE) / 10) * 16000).astype('<i2')
+    streamed = np.concatenate(list(stream_player.pcm16_to_blocks([mono.tobytes()[:1001], mono.tobytes()[1001:]], 2)))
+    with SpeechReader(SpeechPcm(mono[:, None], RATE), RATE, 2) as reader:
+        rendered = np.concatenate(list(reader))
+    assert np.array_equal(streamed, rendered)
+    assert np.array_equal(streamed[:, 0], streamed[:, 1])
+
+
+def test_failed_stream_deletes_partial_mp3(tmp_path):
+    output = tmp_path / "mix.mp3"
+
+    def chunks():
+        yield np.zeros(RATE // 5, dtype='<i2').tobytes()
+        raise RuntimeError("synthesis canceled")
+
+    with pytest.raises(RuntimeError, match="synthesis canceled"):
+        stream_player.stream_with_bgm(chunks(), RATE, _bgm(tmp_path / "bgm.wav"), output_audio=str(output))
+    assert not output.exists()
+
+
+def test_stream_writes_mp3(tmp_path):
+    output = tmp_path / "mix.mp3"
+    chunks = [np.zeros(RATE // 5, dtype='<i2').tobytes()]
+    stream_player.stream_with_bgm(chunks, RATE, _bgm(tmp_path / "bgm.wav"), output_audio=str(output))
+    assert output.stat().st_size > 0
@@ -0,0 +1,41 @@
+import json
+
+import pytest
+
+import tracing
+
+
+@pytest.fixture
+def trace_file(tmp_path):
+    path = tmp_path / "trace.jsonl"
+    tracing.reset()
+    tracing.enable(str(path))
+    yield path
+    tracing.disable()
+    tracing.reset()
+
+
+def _records(path):
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+
+def test_counters_written_to_trace_file(trace_file):
+    with tracing.span("tts.synthesize"):
+        tracing.count("tts.cache.miss")
+    tracing.count("tts.cache.hit", 2)
+    tracing.log_summary()
+    tracing.count("tts.cache.hit")
+    tracing.disable()
+
+    records = _records(trace_file)
+    assert records[0]["name"] == "tts.synthesize"
+    counters = [record for record in records if record["name"] == "counters"]
+    assert counters[0]["counters"] == {"tts.cache.miss": 1, "tts.cache.hit": 2}
+    assert counters[-1]["counters"] == {"tts.cache.miss": 1, "tts.cache.hit": 3}
+
+
+def test_no_counter_record_without_counters(trace_file):
+    with tracing.span("mix"):
+        pass
+    tracing.disable()
+    assert [record["name"] for record in _records(trace_file)] == ["mix"]
@@ -0,0 +1,268 @@
+"""
+Lightweight spans, counters and latency histograms
+
+Tracing is off unless the POEM_TRACE environment variable is set ("1" writes
+to data/traces/, any other value is taken as the JSON-lines path) or
+enable() is called. Counters are written to the same file as a "counters"
+record whenever the summary is logged and when recording stops. When off,
+span() returns a shared no-op object and traced() functions call straight
+through, so the instrumentation costs one attribute check.
+"""
+import atexit
+import functools
+import json
+import os
+import threading
+import time
+from array import array
+
+from config import TRACE_DIR, TRACE_ENV
+from utils import get_logger
+
+logger = get_logger("tracing")
+
+
+class _State:
+    enabled = False
+    path = None
+    file = None
+
+
+_state = _State()
+_lock = threading.Lock()
+_local = threading.local()
+_durations = {}
+_counters = {}
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+    def add(self, key, value=1):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class Span:
+    """One timed operation; attributes and accumulated values end up in its JSON line"""
+
+    __slots__ = ('name', 'attrs', 'parent', 'start', 'wall_start')
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+        self.parent = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def add(self, key, value=1):
+        """Accumulate a number, e.g. bytes written or seconds spent decoding"""
+        self.attrs[key] = self.attrs.get(key, 0) + value
+
+    def __enter__(self):
+        stack = getattr(_local, 'stack', None)
+        if stack is None:
+            stack = _local.stack = []
+        self.parent = stack[-1].name if stack else None
+        stack.append(self)
+        self.wall_start = time.time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start
+        _local.stack.pop()
+        record = {'name': self.name, 'start': round(self.wall_start, 6), 'duration': round(duration, 6),
+                  'thread': threading.current_thread().name, 'parent': self.parent}
+        if exc_type is not None:
+            record['error'] = exc_type.__name__
+        record.update(self.attrs)
+        _record(self.name, duration, record)
+        return False
+
+
+def _record(name, duration, record):
+    with _lock:
+        durations = _durations.get(name)
+        if durations is None:
+            durations = _durations[name] = array('d')
+        durations.append(duration)
+        if _state.file is not None:
+            _state.file.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+
+
+def enabled():
+    return _state.enabled
+
+
+def enable(path=None):
+    """
+    Start recording
+
+    :param path: JSON-lines file to append spans to (optional; without it only
+                 the in-process histograms are kept)
+    """
+    write_counters()
+    with _lock:
+        if _state.file is not None:
+            _state.file.close()
+            _state.file = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            _state.file = open(path, 'a', encoding='utf-8', buffering=1)
+        _state.path = path
+        _state.enabled = True
+
+
+def disable():
+    write_counters()
+    with _lock:
+        _state.enabled = False
+        if _state.file is not None:
+            _state.file.close()
+            _state.file = None
+
+
+def span(name, **attrs):
+    """
+    Context manager timing a block
+
+        with span("tts.synthesize", chars=len(text)) as s:
+            ...
+            s.set(bytes=size)
+    """
+    if not _state.enabled:
+        return _NOOP
+    return Span(name, attrs)
+
+
+def current_span():
+    """The innermost open span of this thread, or a no-op span"""
+    stack = getattr(_local, 'stack', None)
+    return stack[-1] if _state.enabled and stack else _NOOP
+
+
+def traced(name=None):
+    """Decorator wrapping every call of a function in a span (named module.function by default)"""
+    def decorator(func):
+        span_name = name or f"{func.__module__}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _state.enabled:
+                return func(*args, **kwargs)
+            with Span(span_name, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record(name, duration, **attrs):
+    """Record an already measured duration, e.g. from a generator where a span cannot stay open"""
+    if _state.enabled:
+        attrs.update(name=name, start=round(time.time() - duration, 6), duration=round(duration, 6),
+                     thread=threading.current_thread().name)
+        _record(name, duration, attrs)
+
+
+def count(name, value=1):
+    """Increment a counter such as cache hits and misses"""
+    if _state.enabled:
+        with _lock:
+            _counters[name] = _counters.get(name, 0) + value
+
+
+def write_counters():
+    """
+    Append the current counter totals to the JSON-lines file as one record:
+    {"name": "counters", "time": ..., "pid": ..., "counters": {name: value}}
+
+    Values are cumulative since enable()/reset(), so the last record of a
+    process holds its final totals.
+    """
+    with _lock:
+        if _state.file is None or not _counters:
+            return
+        record = {'name': 'counters', 'time': round(time.time(), 6), 'pid': os.getpid(),
+                  'counters': dict(_counters)}
+        _state.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def timed_iter(iterable, target, key):
+    """Yield from iterable, adding the seconds spent waiting for each item to target's `key`"""
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            target.add(key, time.perf_counter() - start)
+        yield item
+
+
+def _percentile(ordered, fraction):
+    # 最近秩法
+    index = max(int(-(-fraction * len(ordered) // 1)) - 1, 0)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+def summary():
+    """
+    :return: {'spans': {name: {count, total, p50, p95, p99, max}}, 'counters': {name: value}}
+    """
+    with _lock:
+        durations = {name: sorted(values) for name, values in _durations.items()}
+        counters = dict(_counters)
+    spans = {}
+    for name, ordered in durations.items():
+        spans[name] = {'count': len(ordered), 'total': sum(ordered), 'p50': _percentile(ordered, 0.5),
+                       'p95': _percentile(ordered, 0.95), 'p99': _percentile(ordered, 0.99), 'max': ordered[-1]}
+    return {'spans': spans, 'counters': counters}
+
+
+def reset():
+    with _lock:
+        _durations.clear()
+        _counters.clear()
+
+
+def log_summary():
+    """Log the latency table and counters, and write the counters to the trace file"""
+    write_counters()
+    data = summary()
+    if not data['spans'] and not data['counters']:
+        return
+    lines = [f"{'span':<40} {'count':>6} {'total':>9} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}"]
+    for name, stats in sorted(data['spans'].items(), key=lambda item: -item[1]['total']):
+        lines.append(f"{name:<40} {stats['count']:>6} {stats['total']:>8.2f}s {stats['p50']:>7.3f}s "
+                     f"{stats['p95']:>7.3f}s {stats['p99']:>7.3f}s {stats['max']:>7.3f}s")
+    for name, value in sorted(data['counters'].items()):
+        lines.append(f"{name:<40} {value:>6}")
+    logger.info("Trace summary\n" + "\n".join(lines))
+
+
+def _enable_from_env():
+    value = os.environ.get(TRACE_ENV, "")
+    if not value or value == "0":
+        return
+    path = value if value != "1" else os.path.join(TRACE_DIR, time.strftime("trace-%Y%m%d-%H%M%S") +
+                                                   f"-{os.getpid()}.jsonl")
+    enable(path)
+    atexit.register(log_summary)
+
+
+_enable_from_env()
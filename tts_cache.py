@@ -0,0 +1,227 @@
+import atexit
+import functools
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import unicodedata
+
+from config import TTS_CACHE_DIR, TTS_CACHE_MAX_BYTES, TTS_CACHE_MAX_AGE
+from utils import get_logger
+
+logger = get_logger("tts_cache")
+
+
+def _locked(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalize text before keying and synthesis: NFC, unix newlines, no
+    leading/trailing blanks per line and single spaces inside a line
+    """
+    text = unicodedata.normalize('NFC', text).replace('\r\n', '\n').replace('\r', '\n')
+    lines = [re.sub(r'[ \t　]+', ' ', line).strip() for line in text.split('\n')]
+    return '\n'.join(lines).strip()
+
+
+def _temp_name(path):
+    # 进程号加线程号，同一进程里的多个线程（或多个 TtsCache 实例）不会写同一个临时文件
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+class TtsCache:
+    """
+    Content-addressed store of synthesized speech.
+
+    Entries are keyed by the normalized text, the voice and the output format
+    and live in two-level sharded directories. A small JSON index keeps size
+    and usage times so lookups and eviction never walk the directory tree.
+    """
+
+    def __init__(self, cache_dir=TTS_CACHE_DIR, max_bytes=TTS_CACHE_MAX_BYTES, max_age=TTS_CACHE_MAX_AGE):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.index_path = os.path.join(cache_dir, "index.json")
+        os.makedirs(cache_dir, exist_ok=True)
+        self._index = self._load_index()
+        self._dropped = set()
+        self._dirty = False
+        self._lock = threading.RLock()
+        atexit.register(self.flush)
+
+    @staticmethod
+    def make_key(text, voice, output_format):
+        payload = "\0".join((normalize_text(text), voice, output_format))
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except ValueError:
+            logger.warning(f"TTS cache index {self.index_path} is corrupt, starting empty")
+            return {}
+
+    def _reload(self):
+        """Pick up entries added by other processes"""
+        for key, entry in self._load_index().items():
+            if key not in self._dropped:
+                self._index.setdefault(key, entry)
+
+    @_locked
+    def flush(self):
+        """Write the index if it changed, merged with what other processes wrote meanwhile"""
+        if not self._dirty:
+            return
+        index = self._load_index()
+        index.update(self._index)
+        for key in self._dropped:
+            index.pop(key, None)
+        self._index = index
+        self._dropped.clear()
+        tmp_path = _temp_name(self.index_path)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._index, f)
+        os.replace(tmp_path, self.index_path)
+        self._dirty = False
+
+    def _path(self, key, ext):
+        return os.path.join(self.cache_dir, key[:2], key + ext)
+
+    @_locked
+    def get(self, key):
+        """
+        Look up a cached file
+
+        :return: Path of the cached file or None
+        """
+        entry = self._index.get(key)
+        if entry is None:
+            self._reload()
+            entry = self._index.get(key)
+            if entry is None:
+                return None
+        path = os.path.join(self.cache_dir, entry['file'])
+        if not os.path.exists(path) or time.time() - entry['used'] > self.max_age:
+            self._drop(key)
+            return None
+        entry['used'] = time.time()
+        self._dirty = True
+        return path
+
+    def temp_path(self, key, ext):
+        """A path next to the final location to synthesize into before put_file"""
+        path = self._path(key, ext)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return _temp_name(path)
+
+    @_locked
+    def put_file(self, key, src_path, ext):
+        """
+        Move a finished file into the cache
+
+        :param key: Cache key from make_key
+        :param src_path: File to move, usually a temp_path
+        :param ext: Extension of the cached file, e.g. ".wav"
+        :return: Path of the cached file
+        """
+        path = self._path(key, ext)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(src_path, path)
+        self._add(key, path)
+        return path
+
+    def put_bytes(self, key, data, ext):
+        """
+        Store raw bytes in the cache
+
+        :return: Path of the cached file
+        """
+        tmp_path = self.temp_path(key, ext)
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        return self.put_file(key, tmp_path, ext)
+
+    def _add(self, key, path):
+        self._dropped.discard(key)
+        now = time.time()
+        self._index[key] = {'file': os.path.relpath(path, self.cache_dir), 'size': os.path.getsize(path),
+                            'created': now, 'used': now}
+        self._dirty = True
+        self.evict()
+        self.flush()
+
+    def _drop(self, key):
+        entry = self._index.pop(key, None)
+        if entry is None:
+            return
+        self._dropped.add(key)
+        self._dirty = True
+        try:
+            os.remove(os.path.join(self.cache_dir, entry['file']))
+        except FileNotFoundError:
+            pass
+
+    @_locked
+    def materialize(self, key, dst_path):
+        """
+        Make a cached entry available at dst_path, hardlinking when possible
+
+        :return: dst_path, or None if the key is not cached
+        """
+        path = self.get(key)
+        if path is None:
+            return None
+        if os.path.abspath(path) == os.path.abspath(dst_path):
+            return dst_path
+        dst_dir = os.path.dirname(dst_path)
+        if dst_dir:
+            os.makedirs(dst_dir, exist_ok=True)
+        tmp_path = _temp_name(dst_path)
+        try:
+            os.link(path, tmp_path)
+        except OSError:
+            shutil.copyfile(path, tmp_path)
+        os.replace(tmp_path, dst_path)
+        return dst_path
+
+    @_locked
+    def evict(self):
+        """Drop entries unused for longer than max_age, then the least recently used ones above max_bytes"""
+        now = time.time()
+        for key in [k for k, entry in self._index.items() if now - entry['used'] > self.max_age]:
+            self._drop(key)
+        total = sum(entry['size'] for entry in self._index.values())
+        if total <= self.max_bytes:
+            return
+        for key, entry in sorted(self._index.items(), key=lambda item: item[1]['used']):
+            if total <= self.max_bytes:
+                break
+            total -= entry['size']
+            logger.info(f"Evicting TTS cache entry {entry['file']}")
+            self._drop(key)
+
+
+_tts_cache = None
+_tts_cache_lock = threading.Lock()
+
+
+def get_tts_cache() -> TtsCache:
+    """The process-wide cache; every SpeechAssistant shares it, so its index and lock are shared too"""
+    global _tts_cache
+    with _tts_cache_lock:
+        if _tts_cache is None:
+            _tts_cache = TtsCache()
+        return _tts_cache